@@ -0,0 +1,42 @@
+"""measures how many occurrences per second the encoder turns into MonPoly
+log strings and ILP rows (without sending them anywhere)"""
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from encoder import Encoder  # noqa: E402
+from records import Timepoint, row_layouts  # noqa: E402
+from schema import Schema  # noqa: E402
+from signature import Signature  # noqa: E402
+
+SIG = "P(x:int)\nQ(x:int, y:string)\nR(x:int, y:int, z:int)"
+TIMEPOINTS = 10_000
+OCCURRENCES = 100
+
+
+def make_timepoints():
+    return [
+        Timepoint(
+            ts,
+            [
+                ("P", [[i] for i in range(OCCURRENCES)]),
+                ("Q", [[i, f"user{i % 10}"] for i in range(OCCURRENCES)]),
+                ("R", [[i, i + 1, i + 2] for i in range(OCCURRENCES)]),
+            ],
+        )
+        for ts in range(TIMEPOINTS)
+    ]
+
+
+if __name__ == "__main__":
+    signature = Signature.from_text(SIG)
+    schema = Schema()
+    encoder = Encoder(signature, row_layouts(signature, schema.symbol_columns(signature)))
+    timepoints = make_timepoints()
+    t = perf_counter()
+    encoder.encode(timepoints)
+    elapsed = perf_counter() - t
+    occurrences = TIMEPOINTS * OCCURRENCES * 3
+    print(f"{occurrences} occurrences in {elapsed:.3f}s: {occurrences / elapsed:,.0f} occurrences/s")
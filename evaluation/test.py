@@ -76,23 +76,19 @@ def set_policy(formula_fn):
 
 
 def change_policy(formula_fn, naive=False):
-    while True:
-        if naive:
-            r = requests.post(
-                CHANGE_POLICY_URL,
-                files={"policy": open(formula_fn, "rb")},
-                data={"naive": 1},
-            )
-        else:
-            r = requests.post(
-                CHANGE_POLICY_URL, files={"policy": open(formula_fn, "rb")}
-            )
-        assert r.ok
-        if "error" in json.loads(r.text):
-            print(r.text)
-            sleep(1)
-        else:
-            break
+    # the server waits until all logged time points are visible in the database
+    if naive:
+        r = requests.post(
+            CHANGE_POLICY_URL,
+            files={"policy": open(formula_fn, "rb")},
+            data={"naive": 1},
+        )
+    else:
+        r = requests.post(
+            CHANGE_POLICY_URL, files={"policy": open(formula_fn, "rb")}
+        )
+    assert r.ok
+    assert "error" not in json.loads(r.text), r.text
     return r.elapsed.total_seconds()
 
 
@@ -0,0 +1,200 @@
+import math
+import threading
+from collections import Counter
+
+# default bounds of the ingestion queue
+MAX_INFLIGHT_TIMEPOINTS = 100_000
+MAX_INFLIGHT_BYTES = 256 * 1024 * 1024
+MAX_REQUESTS_PER_CLIENT = 4
+# weight of the most recent measurement in the drain rate average
+DRAIN_RATE_ALPHA = 0.2
+
+
+class Rejection:
+    """an ingestion request that was not admitted"""
+    __slots__ = ("status", "retry_after", "message")
+
+    def __init__(self, status: int, retry_after: int, message: str):
+        self.status = status
+        self.retry_after = retry_after
+        self.message = message
+
+    def response(self) -> tuple:
+        """a flask response tuple (body, status, headers)"""
+        return (
+            {"error": self.message, "retry-after": self.retry_after},
+            self.status,
+            {"Retry-After": str(self.retry_after)},
+        )
+
+
+class Ticket:
+    """an admitted ingestion request, must be released once it is done"""
+    __slots__ = ("client", "bytes", "timepoints")
+
+    def __init__(self, client: str, nbytes: int):
+        self.client = client
+        self.bytes = nbytes
+        self.timepoints = 0
+
+
+class AdmissionController:
+    """bounds the amount of events waiting for MonPoly, so that bursts are
+    rejected with 429/503 instead of queueing up without limit
+
+    - 429 if a client already has too many requests in flight
+    - 503 if the time points or bytes in flight would exceed their bound,
+      time points held by the reorder buffer count as in flight
+    """
+
+    def __init__(self, config=None):
+        self.max_timepoints = MAX_INFLIGHT_TIMEPOINTS
+        self.max_bytes = MAX_INFLIGHT_BYTES
+        self.max_per_client = MAX_REQUESTS_PER_CLIENT
+        if config:
+            if "max_timepoints" in config.keys():
+                self.max_timepoints = int(config["max_timepoints"])
+            if "max_bytes" in config.keys():
+                self.max_bytes = int(config["max_bytes"])
+            if "max_per_client" in config.keys():
+                self.max_per_client = int(config["max_per_client"])
+        self.lock = threading.Lock()
+        self.inflight_timepoints = 0
+        self.inflight_bytes = 0
+        self.inflight_requests = 0
+        # time points held by the reorder buffer, see set_buffered()
+        self.buffered = 0
+        self.per_client = Counter()
+        # time points per second MonPoly and the database drain the queue with
+        self.drain_rate = None
+        self.admitted = 0
+        self.rejected = Counter()
+
+    def get_config(self) -> dict:
+        return {
+            "max_timepoints": self.max_timepoints,
+            "max_bytes": self.max_bytes,
+            "max_per_client": self.max_per_client,
+        }
+
+    def retry_after(self, backlog: int) -> int:
+        """seconds until the given number of time points is drained"""
+        if not self.drain_rate:
+            return 1
+        return max(1, math.ceil(backlog / self.drain_rate))
+
+    def reject(self, status: int, backlog: int, message: str) -> Rejection:
+        self.rejected[status] += 1
+        return Rejection(status, self.retry_after(backlog), message)
+
+    def admit(self, client: str, nbytes: int):
+        """admits a request of the given size if there is room for it
+
+        Args:
+            client (str): identifies the client (e.g. its address)
+            nbytes (int): size of the request body
+
+        Returns:
+            _type_: a Ticket or a Rejection
+        """
+        with self.lock:
+            if self.per_client[client] >= self.max_per_client:
+                return self.reject(
+                    429,
+                    self.inflight_timepoints,
+                    f"too many concurrent requests from {client} (limit {self.max_per_client})",
+                )
+            if self.inflight_requests > 0 and self.inflight_bytes + nbytes > self.max_bytes:
+                return self.reject(
+                    503,
+                    self.inflight_timepoints,
+                    f"ingestion queue is full ({self.inflight_bytes} bytes in flight)",
+                )
+            self.per_client[client] += 1
+            self.inflight_requests += 1
+            self.inflight_bytes += nbytes
+            self.admitted += 1
+            return Ticket(client, nbytes)
+
+    def add_timepoints(self, ticket: Ticket, timepoints: int):
+        """accounts for the time points of an admitted request once it is parsed
+
+        Returns:
+            _type_: None or a Rejection if the time points don't fit into the
+                queue, the ticket must be released in either case
+        """
+        with self.lock:
+            # a single request that exceeds the bound on its own is only
+            # admitted if nothing else is in flight
+            others = self.inflight_timepoints + self.buffered
+            if others > 0 and others + timepoints > self.max_timepoints:
+                return self.reject(
+                    503,
+                    others + timepoints,
+                    f"ingestion queue is full ({others} time points in flight)",
+                )
+            ticket.timepoints = timepoints
+            self.inflight_timepoints += timepoints
+            return None
+
+    def set_buffered(self, timepoints: int):
+        """updates the number of time points held by the reorder buffer, they
+        have been admitted, but MonPoly hasn't seen them yet"""
+        with self.lock:
+            self.buffered = timepoints
+
+    def charge(self, ticket: Ticket, nbytes: int):
+        """adds bytes to an admitted request, e.g. the decompressed size of a
+        compressed upload, which is admitted with its transferred size
+
+        Returns:
+            _type_: the ticket or a Rejection if the bytes don't fit into the
+                queue, the ticket must be released in either case
+        """
+        with self.lock:
+            others = self.inflight_bytes - ticket.bytes
+            if others > 0 and others + ticket.bytes + nbytes > self.max_bytes:
+                return self.reject(
+                    503,
+                    self.inflight_timepoints,
+                    f"ingestion queue is full ({others} bytes in flight)",
+                )
+            ticket.bytes += nbytes
+            self.inflight_bytes += nbytes
+            # returned since the ticket is a copy if the controller runs in the engine
+            return ticket
+
+    def release(self, ticket: Ticket, elapsed=None):
+        """releases an admitted request
+
+        Args:
+            ticket (Ticket): the ticket returned by admit()
+            elapsed (_type_, optional): seconds MonPoly and the database spent on
+                the time points of the request, updates the drain rate. Defaults to None.
+        """
+        with self.lock:
+            self.per_client[ticket.client] -= 1
+            if self.per_client[ticket.client] <= 0:
+                del self.per_client[ticket.client]
+            self.inflight_requests -= 1
+            self.inflight_bytes -= ticket.bytes
+            self.inflight_timepoints -= ticket.timepoints
+            if elapsed and ticket.timepoints:
+                rate = ticket.timepoints / elapsed
+                if self.drain_rate is None:
+                    self.drain_rate = rate
+                else:
+                    self.drain_rate += DRAIN_RATE_ALPHA * (rate - self.drain_rate)
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "in-flight requests": self.inflight_requests,
+                "in-flight time points": self.inflight_timepoints,
+                "buffered time points": self.buffered,
+                "in-flight bytes": self.inflight_bytes,
+                "clients": dict(self.per_client),
+                "drain rate": self.drain_rate,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+            }
@@ -1,10 +1,23 @@
 import os
 import atexit
+import functools
+import json
+import zipfile
+from datetime import datetime
 from werkzeug.utils import secure_filename
-from flask import Flask, request, flash
+from flask import Blueprint, Flask, Response, abort, g, request, flash, send_file, stream_with_context
+from werkzeug.local import LocalProxy
 from dateutil import parser
 from dateutil.parser import ParserError
 from monitor import Monitor
+from admission import Rejection
+from binary_events import MSGPACK_EXTENSIONS, MSGPACK_MIMETYPES, binary_schema
+from export import EXPORT_FORMATS
+import compression
+from compression import MIN_COMPRESS_BYTES, DecompressingReader, compress_chunks, detect_encoding, negotiate
+from engine import ENGINE_OPERATIONS, EngineClient, MonitorEngine, RemoteComponent, RemoteMonitor, RemoteTenants
+from profiling import SAMPLE_INTERVAL, TOP_ALLOCATIONS, Profiling
+from tracing import tracer
 
 app = Flask(__name__, static_folder="./static")
 
@@ -16,62 +29,198 @@ abspath = os.path.abspath(os.path.join(__file__, ".."))
 dname = os.path.dirname(abspath)
 os.chdir(dname)
 
-mon = Monitor()
+# with MONPOLY_ENGINE_SOCKET set this is a stateless worker and the monitors
+# run in the engine process (see engine.py), any number of workers can be used
+ENGINE_SOCKET = os.environ.get("MONPOLY_ENGINE_SOCKET")
+if ENGINE_SOCKET:
+    engine = EngineClient(ENGINE_SOCKET)
+    default_monitor = RemoteMonitor(engine, "")
+    tenants = RemoteTenants(engine)
+    # profilers of the engine and of this worker
+    profiling = RemoteComponent(engine, None, "profiling.", ENGINE_OPERATIONS)
+    worker_profiling = Profiling()
+    engine_tracer = RemoteComponent(engine, None, "tracer.", ENGINE_OPERATIONS)
+else:
+    engine = MonitorEngine()
+    default_monitor = engine.default_monitor
+    tenants = engine.tenants
+    profiling = worker_profiling = engine.profiling
+    engine_tracer = tracer
+# the profiling endpoints are only served with MONPOLY_PROFILING=1
+PROFILING = os.environ.get("MONPOLY_PROFILING", "") not in ("", "0")
+# the monitor served at /, tenants are served at /t/<tenant>/
+
+# all monitor routes, registered once without and once with a tenant prefix
+bp = Blueprint("monitor", __name__)
+
+
+def current_monitor() -> Monitor:
+    return g.get("monitor", default_monitor)
+
+
+# the monitor of the current request
+mon = LocalProxy(current_monitor)
+
+
+@bp.url_value_preprocessor
+def select_tenant(endpoint, values):
+    if values and "tenant" in values:
+        tenant = values.pop("tenant")
+        try:
+            g.monitor = tenants.get(tenant)
+        except ValueError as e:
+            abort(404, str(e))
+        g.tenant = tenant
 
 
-@app.before_first_request
-def before_first_request():
-    mon.restore_state()
-    restart_response = mon.launch(restart=True)
-    mon.write_server_log(f"app.py before_first_request() done: {restart_response}")
+@bp.teardown_request
+def release_tenant(error=None):
+    # the tenant isn't evicted while one of its requests uses it
+    if "tenant" in g:
+        tenants.release(g.pop("tenant"))
 
 
 def exit_handler():
-    mon.stop_monpoly()
-    mon.write_server_log(f"app.py exit_handler() done")
+    engine.stop()
+    default_monitor.write_server_log(f"app.py exit_handler() done")
+
+
+if not ENGINE_SOCKET:
+    atexit.register(exit_handler)
+    # MonPoly loads its state while the server already answers requests
+    engine.start()
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """
+    liveness probe, the server process is up
+    """
+    return {"status": "ok"}
 
 
-atexit.register(exit_handler)
+def response_error(result):
+    """the error of a view's return value (a dict with "error" or a status
+    of at least 400), None for a successful response
+
+    Returns:
+        _type_: (status, error message or None)
+    """
+    body, status = result, 200
+    if isinstance(result, tuple):
+        body = result[0]
+        if len(result) > 1 and isinstance(result[1], int):
+            status = result[1]
+    elif isinstance(result, Response):
+        body, status = None, result.status_code
+    if isinstance(body, dict) and "error" in body:
+        return status, str(body["error"])
+    if status >= 400:
+        return status, f"HTTP {status}"
+    return status, None
+
+
+def traced(view):
+    """records the spans of the request if tracing is enabled, see tracing.py,
+    error responses mark the root span as failed"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with tracer.trace(f"{request.method} {request.url_rule.rule}") as span:
+            span.set(**{"url.path": request.path, "http.request_content_length": request.content_length or 0})
+            result = view(*args, **kwargs)
+            status, error = response_error(result)
+            span.set(**{"http.response.status_code": status})
+            if error is not None:
+                span.fail(error)
+            return result
+    return wrapper
+
+
+def negotiated_response(chunks, mimetype: str) -> Response:
+    """a streamed response, compressed with the encoding the client prefers"""
+    encoding = negotiate(request.headers.get("Accept-Encoding", ""))
+    if encoding is None:
+        return Response(chunks, mimetype=mimetype)
+    return Response(
+        compress_chunks(chunks, encoding),
+        mimetype=mimetype,
+        headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+    )
 
 
 def string_to_html(text):
     return text.replace("\n", "<br>")
 
 
-@app.route("/", methods=["GET", "POST"])
+def status_response(etag: str, content, mimetype=None) -> Response:
+    """a response with the ETag of the status, 304 if the client has it"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif mimetype is None:
+        response = app.json.response(content)
+    else:
+        response = Response(content, mimetype=mimetype)
+    response.set_etag(etag)
+    return response
+
+
+@bp.route("/", methods=["GET", "POST"])
 def index():
+    etag, status = mon.get_status()
+    monpoly = status["monpoly"]
     content = f""" 
         <h1>Monpoly Backend</h1>
         <p>
-        <b>You are monitoring the following policy:</b><br> {string_to_html(mon.get_policy())} <br>
-        <b>With the signature:</b><br> {string_to_html(mon.get_signature())}  
+        <b>You are monitoring the following policy:</b><br> {string_to_html(status["policy"])} <br>
+        <b>With the signature:</b><br> {string_to_html(status["signature"])}  
         </p>
         <h2>Database schema</h2>
         <p>
-        {mon.get_schema()}
+        {status["tables"]}
         </p>
         <h2>Current Time Point</h2>
         <p>
-        {mon.most_recent_timepoint}: {mon.most_recent_timestamp if mon.most_recent_timestamp is not None else "No time point and time stamp seen yet"}
+        {status["timepoint"]}: {status["timestamp"] if status["timestamp"] is not None else "No time point and time stamp seen yet"}
         </p>
         <h2>Monitor process information</h2>
-        <p> {mon.get_monpoly_pid()}: {mon.monpoly.args if mon.monpoly and mon.monpoly.args else ""} </p>
-        <p> exit code: {mon.get_monpoly_exit_code()} </p>
+        <p> {monpoly["pid"] if monpoly["pid"] is not None else "monpoly not running"}: {monpoly["args"] or ""} </p>
+        <p> exit code: {monpoly["exit code"] if monpoly["exit code"] is not None else "monpoly still running" if monpoly["running"] else "monpoly not running (yet)"} </p>
         <h3>Monitorability</h3>
-        <p> {string_to_html(mon.get_monitorability_log())} </p>
+        <p> {string_to_html(status["monitorability"])} </p>
         <h2>Monitor log</h2>
-        <p> {string_to_html(mon.get_stdout())} <p>
+        <p> {string_to_html(status["output"] or "stdout is empty")} <p>
+    """
+    return status_response(etag, content, "text/html")
+
+
+@bp.route("/status", methods=["GET"])
+def get_status():
+    """
+    the state of the monitor from memory, with an ETag for conditional requests
+    """
+    etag, status = mon.get_status()
+    return status_response(etag, status)
+
+
+@bp.route("/readyz", methods=["GET"])
+def readyz():
+    """
+    readiness probe, 200 once MonPoly has loaded its state, 503 before
     """
-    return content
+    try:
+        readiness = mon.readiness()
+    except ConnectionError as e:
+        return {"ready": False, "status": str(e)}, 503
+    return readiness, 200 if readiness["ready"] else 503
 
 
-@app.route("/get-policy", methods=["GET", "POST"])
+@bp.route("/get-policy", methods=["GET", "POST"])
 def get_policy():
     policy = mon.get_policy()
     return {"policy": policy}
 
 
-@app.route("/set-policy", methods=["POST"])
+@bp.route("/set-policy", methods=["POST"])
 def set_policy():
     """
     this sets the policy
@@ -92,7 +241,8 @@ def set_policy():
         return mon.set_policy(path, negate)
 
 
-@app.route("/change-policy", methods=["POST"])
+@bp.route("/change-policy", methods=["POST"])
+@traced
 def change_policy():
     if "policy" not in request.files:
         return {
@@ -105,19 +255,20 @@ def change_policy():
     else:
         filename = secure_filename(pol_file.filename)  # type: ignore
         path = os.path.join(mon.policy_dir, filename)
-        pol_file.save(path)
+        with tracer.span("save upload"):
+            pol_file.save(path)
         negate = "negate" in request.form
         naive = "naive" in request.form
         # TODO later check for parameter specifying policy change method
         return mon.change_policy(path, negate, naive)
 
 
-@app.route("/get-signature", methods=["GET", "POST"])
+@bp.route("/get-signature", methods=["GET", "POST"])
 def get_signature():
     return {"signature": mon.get_signature()}
 
 
-@app.route("/set-signature", methods=["POST"])
+@bp.route("/set-signature", methods=["POST"])
 def set_signature():
     """
     this sets the signature if it has not been set yet
@@ -144,7 +295,84 @@ def set_signature():
         return mon.set_signature(path)
 
 
-@app.route("/start-monitor", methods=["GET", "POST"])
+@bp.route("/get-schema-config", methods=["GET", "POST"])
+def get_schema_config():
+    return mon.get_schema_config()
+
+
+@bp.route("/set-schema-config", methods=["POST"])
+def set_schema_config():
+    """
+    configures the schema generation of the tables created by a subsequent
+    /set-signature, rejected while a signature is set
+    """
+    changes = dict()
+    if "expected-rows-per-day" in request.form:
+        changes["expected_rows_per_day"] = request.form["expected-rows-per-day"]
+    if "partition" in request.form:
+        changes["partition"] = request.form["partition"] or None
+    if "low-cardinality" in request.form:
+        changes["low_cardinality"] = [
+            c.strip() for c in request.form["low-cardinality"].split(",") if c.strip()
+        ]
+    if "high-cardinality" in request.form:
+        changes["high_cardinality"] = [
+            c.strip() for c in request.form["high-cardinality"].split(",") if c.strip()
+        ]
+    try:
+        return mon.set_schema_config(changes)
+    except ValueError as e:
+        return {"error": str(e)}
+
+
+@bp.route("/get-retention", methods=["GET", "POST"])
+def get_retention():
+    return {"retention": mon.retention.get_config()}
+
+
+@bp.route("/set-retention", methods=["POST"])
+def set_retention():
+    """
+    configures the retention manager, additional policies that must remain
+    replayable can be uploaded as files named `policy`
+    """
+    changes = dict()
+    if "enabled" in request.form:
+        changes["enabled"] = request.form["enabled"].lower() in ("1", "true", "yes")
+    if "safety-horizon" in request.form:
+        changes["safety_horizon"] = request.form["safety-horizon"]
+    if "interval" in request.form:
+        changes["interval"] = request.form["interval"]
+    policies = request.files.getlist("policy")
+    if policies:
+        retention_dir = os.path.join(mon.policy_dir, "retention")
+        mon.make_dirs(retention_dir)
+        paths = []
+        for pol_file in policies:
+            filename = secure_filename(pol_file.filename)  # type: ignore
+            path = os.path.join(retention_dir, filename)
+            pol_file.save(path)
+            paths.append(path)
+        changes["policies"] = paths
+    try:
+        mon.retention.configure(changes)
+    except ValueError as e:
+        return {"error": str(e)}
+    mon.write_config()
+    return {"retention": mon.retention.get_config()}
+
+
+@bp.route("/enforce-retention", methods=["GET", "POST"])
+def enforce_retention():
+    return mon.enforce_retention(force=True)
+
+
+@bp.route("/get-hot-window", methods=["GET", "POST"])
+def get_hot_window():
+    return {"hot window": mon.hot_window.get_config() | mon.hot_window.get_stats()}
+
+
+@bp.route("/start-monitor", methods=["GET", "POST"])
 def start_monitor():
     use_existing_db = False
     if "existing-db" in request.form:
@@ -153,39 +381,216 @@ def start_monitor():
     return {"launch message": launch_msg}
 
 
-@app.route("/stop-monitor", methods=["GET", "POST"])
+@bp.route("/stop-monitor", methods=["GET", "POST"])
 def stop_monitor():
     return mon.stop_monpoly()
 
 
-@app.route("/reset-everything", methods=["GET", "POST"])
+@bp.route("/reset-everything", methods=["GET", "POST"])
 def reset_monitor():
     delete_message = mon.delete_everything()
     return delete_message
 
 
-@app.route("/log-events", methods=["POST"])
+def charge_decompressed(ticket, reader, encoding: str):
+    """charges the admission ticket of a compressed upload, which was
+    admitted with its transferred size, for its decompressed size
+
+    Returns:
+        _type_: the ticket or a Rejection
+    """
+    compression.stats.add("uploads", encoding, reader.compressed_bytes, reader.count)
+    return mon.admission.charge(ticket, max(reader.decompressed - reader.compressed_bytes, 0))
+
+
+def prepare_binary_upload(stream, ticket, encoding=None) -> tuple:
+    """decodes MessagePack events, decompressing them first if needed
+
+    Raises:
+        ValueError: if the events are malformed or decompress to more than
+            the bytes the ingestion queue holds
+
+    Returns:
+        tuple: the (charged) ticket and the Timepoint records, or a Rejection
+            and None
+    """
+    if encoding and encoding != "identity":
+        reader = DecompressingReader(stream, encoding, mon.admission.get_config()["max_bytes"])
+        data = reader.read()
+        ticket = charge_decompressed(ticket, reader, encoding)
+        if isinstance(ticket, Rejection):
+            return ticket, None
+    else:
+        data = stream.read()
+    return ticket, mon.prepare_binary_timepoints(data)
+
+
+@bp.route("/get-binary-schema", methods=["GET", "POST"])
+def get_binary_schema():
+    """
+    the predicate ids and schema id for binary events
+    """
+    return binary_schema(mon.get_validator())
+
+
+@bp.route("/log-events", methods=["POST"])
+@traced
 def log():
     """
-    takes events with or without timestamps in json format
+    takes events with or without timestamps in json format, or in the binary
+    MessagePack format as the request body or an uploaded file
     """
-    if "events" not in request.files:
+    binary_body = request.mimetype in MSGPACK_MIMETYPES
+    if not binary_body and "events" not in request.files:
         flash("No events sent")
         return {"message": "no events provided, for curl use `-F` and not `-d`"}
 
-    events_file = request.files["events"]
+    events_file = None if binary_body else request.files["events"]
     if events_file == "":
         flash("No selected file")
         return {"message": "filename can't be empty"}
-    else:
-        filename = secure_filename(events_file.filename)  # type: ignore
-        path = os.path.join(mon.events_dir, filename)
-        events_file.save(path)
-        result = mon.log_timepoints(path)
-        return result
+
+    if not mon.readiness()["accepting"]:
+        return Rejection(503, 1, "monitor is starting").response()
+    admitted = mon.admission.admit(request.remote_addr, request.content_length or 0)
+    if isinstance(admitted, Rejection):
+        return admitted.response()
+    # parsing, validation and encoding don't need MonPoly, with multiple
+    # workers they run in parallel
+    prepared = False
+    path = None
+    charged = admitted
+    try:
+        if binary_body:
+            charged, timepoints = prepare_binary_upload(
+                request.stream, admitted, request.headers.get("Content-Encoding")
+            )
+        elif request.form.get("format") == "msgpack" or (
+            events_file.filename or ""
+        ).lower().endswith(MSGPACK_EXTENSIONS):
+            charged, timepoints = prepare_binary_upload(
+                events_file.stream,
+                admitted,
+                request.form.get("encoding") or detect_encoding(events_file.stream),
+            )
+        else:
+            # compressed uploads are decompressed while they are parsed
+            encoding = request.form.get("encoding") or detect_encoding(
+                events_file.stream, events_file.filename or ""
+            )
+            if encoding:
+                reader = DecompressingReader(events_file.stream, encoding, mon.admission.get_config()["max_bytes"])
+                timepoints = mon.prepare_timepoints(reader)
+                charged = charge_decompressed(admitted, reader, encoding)
+            else:
+                filename = secure_filename(events_file.filename)  # type: ignore
+                path = os.path.join(mon.events_dir, filename)
+                with tracer.span("save upload"):
+                    events_file.save(path)
+                timepoints = mon.prepare_timepoints(path)
+        if isinstance(charged, Rejection):
+            return charged.response()
+        admitted = charged
+        prepared = True
+    except ValueError as error:
+        return {"error": f"Error while parsing events {error}"}
+    finally:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+        if not prepared:
+            mon.admission.release(admitted)
+    # binary request bodies have no form, their fields are query parameters
+    source = request.values.get("source", request.remote_addr)
+    timeout = None
+    if "timeout" in request.values:
+        try:
+            timeout = float(request.values["timeout"])
+        except ValueError:
+            mon.admission.release(admitted)
+            return {"error": f'invalid timeout {request.values["timeout"]}'}
+    result = mon.ingest(admitted, timepoints, source, timeout=timeout)
+    if isinstance(result, Rejection):
+        return result.response()
+    return result
+
+
+@bp.route("/get-reorder", methods=["GET", "POST"])
+def get_reorder():
+    return {"reorder": mon.reorder.get_config() | mon.reorder.get_stats()}
+
+
+@bp.route("/set-reorder", methods=["POST"])
+def set_reorder():
+    """
+    enables or disables ordering of time points of multiple producers
+    """
+    changes = dict()
+    if "lateness" in request.form:
+        changes["lateness"] = request.form["lateness"]
+    if "capacity" in request.form:
+        changes["capacity"] = request.form["capacity"]
+    if "enabled" in request.form:
+        changes["enabled"] = request.form["enabled"].lower() in ("1", "true", "yes")
+        if not changes["enabled"] and mon.reorder.get_config()["enabled"]:
+            mon.release_reordered(force=True)
+    try:
+        mon.reorder.configure(changes)
+    except ValueError as e:
+        return {"error": str(e)}
+    mon.write_config()
+    return {"reorder": mon.reorder.get_config()}
+
+
+@bp.route("/flush-reorder", methods=["GET", "POST"])
+def flush_reorder():
+    return mon.release_reordered(force=True)
+
+
+@bp.route("/get-supervisor", methods=["GET", "POST"])
+def get_supervisor():
+    """
+    crash recovery configuration, restarts and crash-to-serving time
+    """
+    return {"supervisor": mon.supervisor.get_config() | mon.supervisor.get_stats()}
+
+
+@bp.route("/set-supervisor", methods=["POST"])
+def set_supervisor():
+    """
+    configures the automatic restart of a crashed or hung MonPoly
+    """
+    changes = dict()
+    if "enabled" in request.form:
+        changes["enabled"] = request.form["enabled"].lower() in ("1", "true", "yes")
+    if "hang-timeout" in request.form:
+        changes["hang_timeout"] = request.form["hang-timeout"]
+    if "checkpoint-interval" in request.form:
+        changes["checkpoint_interval"] = request.form["checkpoint-interval"]
+    try:
+        mon.supervisor.configure(changes)
+    except ValueError as e:
+        return {"error": str(e)}
+    mon.write_config()
+    return {"supervisor": mon.supervisor.get_config()}
 
 
-@app.route("/get-events", methods=["GET", "POST"])
+@bp.route("/get-monpoly-usage", methods=["GET", "POST"])
+def get_monpoly_usage():
+    """
+    CPU time and memory used by MonPoly, from /proc/<pid>
+    """
+    return {"monpoly": mon.get_monpoly_usage()}
+
+
+@bp.route("/get-admission", methods=["GET", "POST"])
+def get_admission():
+    """
+    queue depth and rejection counts of the ingestion path
+    """
+    return {"admission": mon.admission.get_config() | mon.admission.get_stats()}
+
+
+@bp.route("/get-events", methods=["GET", "POST"])
 def get_events():
     start_date = None
     if "start" in request.form:
@@ -201,17 +606,122 @@ def get_events():
         except ParserError:
             return {"error": f'invalid end date {request.form["end"]}'}
 
-    return mon.get_events(start_date=start_date, end_date=end_date)
+    export_format = request.form.get("format", "json")
+    if export_format == "json":
+        events = json.dumps(mon.get_events(start_date=start_date, end_date=end_date))
+        if len(events) < MIN_COMPRESS_BYTES:
+            return Response(events, mimetype="application/json")
+        return negotiated_response([events], "application/json")
+    if export_format not in EXPORT_FORMATS:
+        return {"error": f"unknown format {export_format}, use one of json, {', '.join(EXPORT_FORMATS)}"}
+
+    predicates = None
+    if "predicates" in request.form:
+        predicates = [p.strip() for p in request.form["predicates"].split(",") if p.strip()]
+    try:
+        after = int(request.form.get("after", -1))
+        limit = int(request.form["limit"]) if "limit" in request.form else None
+        exporter = mon.export_events(
+            start_date=start_date,
+            end_date=end_date,
+            predicates=predicates,
+            after=after,
+            limit=limit,
+            token=request.form.get("continuation"),
+        )
+    except ValueError as e:
+        return {"error": str(e)}
+    # a generator response is sent with chunked transfer encoding
+    return negotiated_response(
+        stream_with_context(exporter.stream(export_format)), EXPORT_FORMATS[export_format]
+    )
+
+
+@bp.route("/export-columnar", methods=["GET", "POST"])
+def export_columnar():
+    """
+    exports the events per predicate as Arrow IPC or Parquet files, either
+    into the exports directory or as a download (`download` field)
+    """
+    start_date = None
+    end_date = None
+    try:
+        if "start" in request.form:
+            start_date = parser.parse(request.form["start"])
+        if "end" in request.form:
+            end_date = parser.parse(request.form["end"])
+    except ParserError as e:
+        return {"error": f"invalid date: {e}"}
+    predicates = None
+    if "predicates" in request.form:
+        predicates = [p.strip() for p in request.form["predicates"].split(",") if p.strip()]
+    export_format = request.form.get("format", "parquet")
+    name = secure_filename(
+        request.form.get("name", f'export-{datetime.now().strftime("%Y%m%d-%H%M%S")}')
+    )
+    try:
+        paths = mon.export_columnar(export_format, name, start_date, end_date, predicates)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    if "download" not in request.form:
+        return {"files": paths}
+    if len(paths) == 1:
+        return send_file(paths[0], as_attachment=True)
+    archive = os.path.join(mon.exports_dir, f"{name}.zip")
+    # the columnar files are already compressed
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf:
+        for path in paths:
+            zf.write(path, arcname=os.path.basename(path))
+    return send_file(archive, as_attachment=True)
+
+
+@bp.route("/verdicts", methods=["GET", "POST"])
+def verdicts():
+    """
+    a page of the verdicts MonPoly reported, filtered by time range and
+    variable bindings (`binding` fields of the form `variable=value`)
+    """
+    if "continuation" in request.form:
+        return mon.query_verdicts(token=request.form["continuation"])
+    start_date = None
+    end_date = None
+    try:
+        if "start" in request.form:
+            start_date = parser.parse(request.form["start"])
+        if "end" in request.form:
+            end_date = parser.parse(request.form["end"])
+    except ParserError as e:
+        return {"error": f"invalid date: {e}"}
+    bindings = []
+    for binding in request.form.getlist("binding"):
+        variable, separator, value = binding.partition("=")
+        if not separator or not variable.strip():
+            return {"error": f"invalid binding {binding}, use variable=value"}
+        bindings.append((variable.strip(), value.strip()))
+    policy = request.form.get("policy", "current")
+    try:
+        after = int(request.form.get("after", -1))
+        limit = int(request.form["limit"]) if "limit" in request.form else None
+    except ValueError as e:
+        return {"error": str(e)}
+    return mon.query_verdicts(
+        policy=None if policy == "all" else policy,
+        start_date=start_date,
+        end_date=end_date,
+        bindings=bindings,
+        after=after,
+        limit=limit,
+    )
 
 
-@app.route("/get-most-recent", methods=["GET", "POST"])
+@bp.route("/get-most-recent", methods=["GET", "POST"])
 def get_most_recent():
-    return {"timestamp": mon.get_most_recent_timestamp_from_db(),
-            "timepoint": mon.get_most_recent_timepoint_from_db()}
+    return mon.get_most_recent()
 
 ## Database configuration methods
 
-@app.route("/db-set-user", methods=["POST"])
+@bp.route("/db-set-user", methods=["POST"])
 def db_set_user():
     if "user" not in request.form:
         return {"error": "no user provided"}
@@ -223,7 +733,7 @@ def db_set_user():
     except Exception as e:
         return {"error": str(e)}
 
-@app.route("/db-set-password", methods=["POST"])
+@bp.route("/db-set-password", methods=["POST"])
 def db_set_password():
     if "password" not in request.form:
         return {"error": "no password provided"}
@@ -235,7 +745,7 @@ def db_set_password():
     except Exception as e:
         return {"error": str(e)}
 
-@app.route("/db-set-host", methods=["POST"])
+@bp.route("/db-set-host", methods=["POST"])
 def db_set_host():
     if "host" not in request.form:
         return {"error": "no host provided"}
@@ -247,7 +757,7 @@ def db_set_host():
     except Exception as e:
         return {"error": str(e)}
 
-@app.route("/db-set-pgsql-port", methods=["POST"])
+@bp.route("/db-set-pgsql-port", methods=["POST"])
 def db_set_pgsql_port():
     if "port" not in request.form:
         return {"error": "no port provided"}
@@ -259,7 +769,7 @@ def db_set_pgsql_port():
     except Exception as e:
         return {"error": str(e)}
 
-@app.route("/db-set-influxdb-port", methods=["POST"])
+@bp.route("/db-set-influxdb-port", methods=["POST"])
 def db_set_influxdb_port():
     if "port" not in request.form:
         return {"error": "no port provided"}
@@ -271,7 +781,7 @@ def db_set_influxdb_port():
     except Exception as e:
         return {"error": str(e)}
 
-@app.route("/db-set-database", methods=["POST"])
+@bp.route("/db-set-database", methods=["POST"])
 def db_set_database():
     if "database" not in request.form:
         return {"error": "no database provided"}
@@ -283,29 +793,163 @@ def db_set_database():
     except Exception as e:
         return {"error": str(e)}
 
-@app.route("/db-get-user", methods=["GET", "POST"])
+@bp.route("/db-get-user", methods=["GET", "POST"])
 def db_get_user():
     return {"response": mon.db.get_user()}
 
-@app.route("/db-get-password", methods=["GET", "POST"])
+@bp.route("/db-get-password", methods=["GET", "POST"])
 def db_get_password():
     return {"response": mon.db.get_password()}
 
-@app.route("/db-get-host", methods=["GET", "POST"])
+@bp.route("/db-get-host", methods=["GET", "POST"])
 def db_get_host():
     return {"response": mon.db.get_host()}
 
-@app.route("/db-get-pgsql-port", methods=["GET", "POST"])
+@bp.route("/db-get-pgsql-port", methods=["GET", "POST"])
 def db_get_pgsql_port():
     return {"response": mon.db.get_pgsql_port()}
 
-@app.route("/db-get-influxdb-port", methods=["GET", "POST"])
+@bp.route("/db-get-influxdb-port", methods=["GET", "POST"])
 def db_get_influxdb_port():
     return {"response": mon.db.get_influxdb_port()}
 
-@app.route("/db-get-database", methods=["GET", "POST"])
+@bp.route("/db-get-database", methods=["GET", "POST"])
 def db_get_database():
     return {"response": mon.db.get_database()}
-    
+
+## Tenants
+
+@app.route("/get-compression", methods=["GET", "POST"])
+def get_compression():
+    """
+    sizes and ratios of the compressed uploads and responses of this process
+    """
+    return {"compression": compression.stats.get_stats()}
+
+
+@app.route("/get-tracing", methods=["GET", "POST"])
+def get_tracing():
+    return {"tracing": engine_tracer.get_config() | engine_tracer.get_stats()}
+
+
+@app.route("/set-tracing", methods=["POST"])
+def set_tracing():
+    """
+    configures the tracing of /log-events and /change-policy requests, in
+    this process and in the engine
+    """
+    try:
+        enabled = None
+        if "enabled" in request.form:
+            enabled = request.form["enabled"].lower() in ("1", "true", "yes")
+        slow_seconds = float(request.form["slow-seconds"]) if "slow-seconds" in request.form else None
+        sample_rate = float(request.form["sample-rate"]) if "sample-rate" in request.form else None
+        config = tracer.configure(enabled, slow_seconds, sample_rate)
+        if engine_tracer is not tracer:
+            config = engine_tracer.configure(enabled, slow_seconds, sample_rate)
+    except ValueError as e:
+        return {"error": str(e)}
+    return {"tracing": config}
+
+
+@app.route("/get-tenants", methods=["GET", "POST"])
+def get_tenants():
+    return {"tenants": tenants.get_stats()}
+
+@app.route("/evict-tenant", methods=["POST"])
+def evict_tenant():
+    if "tenant" not in request.form:
+        return {"error": "no tenant provided"}
+    return tenants.evict(request.form["tenant"])
+
+
+## Profiling
+
+def profiling_route(view):
+    """serves the view only if profiling is enabled, the profilers are
+    selected with the `process` field: `engine` (default) or `worker`"""
+    @functools.wraps(view)
+    def wrapper():
+        if not PROFILING:
+            return {"error": "profiling is disabled, start the server with MONPOLY_PROFILING=1"}, 403
+        process = request.form.get("process", "engine")
+        if process not in ("engine", "worker"):
+            return {"error": f"unknown process {process}, use engine or worker"}
+        try:
+            return view(worker_profiling if process == "worker" else profiling)
+        except ValueError as e:
+            return {"error": str(e)}
+    return wrapper
+
+
+@app.route("/get-profiling", methods=["GET", "POST"])
+@profiling_route
+def get_profiling(profilers):
+    return profilers.get_stats()
+
+
+@app.route("/start-profiler", methods=["POST"])
+@profiling_route
+def start_profiler(profilers):
+    """
+    starts sampling the stacks of all threads every `interval` seconds
+    """
+    return profilers.sampler.start(float(request.form.get("interval", SAMPLE_INTERVAL)))
+
+
+@app.route("/stop-profiler", methods=["POST"])
+@profiling_route
+def stop_profiler(profilers):
+    return profilers.sampler.stop()
+
+
+@app.route("/get-profile", methods=["GET", "POST"])
+@profiling_route
+def get_profile(profilers):
+    """
+    the sampled stacks in the folded format of flamegraph.pl and speedscope
+    """
+    return Response(profilers.sampler.folded(), mimetype="text/plain")
+
+
+@app.route("/start-tracemalloc", methods=["POST"])
+@profiling_route
+def start_tracemalloc(profilers):
+    return profilers.allocations.start(int(request.form.get("frames", 1)))
+
+
+@app.route("/stop-tracemalloc", methods=["POST"])
+@profiling_route
+def stop_tracemalloc(profilers):
+    return profilers.allocations.stop()
+
+
+@app.route("/take-snapshot", methods=["POST"])
+@profiling_route
+def take_snapshot(profilers):
+    """
+    takes a tracemalloc snapshot and returns its top allocation sites
+    """
+    return profilers.allocations.snapshot(int(request.form.get("top", TOP_ALLOCATIONS)))
+
+
+@app.route("/diff-snapshots", methods=["GET", "POST"])
+@profiling_route
+def diff_snapshots(profilers):
+    """
+    the allocation sites that grew the most between the snapshots `from` and `to`
+    """
+    if "from" not in request.form or "to" not in request.form:
+        return {"error": "snapshots `from` and `to` required"}
+    return profilers.allocations.diff(
+        int(request.form["from"]),
+        int(request.form["to"]),
+        int(request.form.get("top", TOP_ALLOCATIONS)),
+    )
+
+
+app.register_blueprint(bp)
+app.register_blueprint(bp, url_prefix="/t/<tenant>", name="tenant")
+
 if __name__ == '__main__':
   app.run()
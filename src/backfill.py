@@ -0,0 +1,443 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter
+from db_helper import IlpWriter
+from monitor import CONFIG_DIR, Monitor
+from monpoly_io import LOG_DONE
+from records import Timepoint
+from tenants import TENANT_NAME, TenantRegistry
+from verdicts import VERDICT_VALUE
+
+# time points per ILP buffer
+BACKFILL_BATCH_SIZE = 10000
+# number of ILP connections sending batches in parallel
+BACKFILL_SENDERS = 4
+# verdicts per ILP buffer in the MonPoly pass
+VERDICT_BATCH_SIZE = 10000
+# tokens of MonPoly's log format: `@<time stamp> <predicate> (<tuple>) ... ;`,
+# commands like `>terminate<` are ignored
+LOG_TOKEN = re.compile(
+    r'\s*(?:@(?P<ts>[0-9.]+)|(?P<tuple>\((?:[^()"]|"[^"]*")*\))|(?P<name>[A-Za-z_][\w\']*)|(?P<end>;)|>[^<]*<)'
+)
+INPUT_FORMATS = ("monpoly", "ndjson", "json")
+EXTENSION_FORMATS = {".log": "monpoly", ".ndjson": "ndjson", ".jsonl": "ndjson", ".json": "json"}
+
+
+def input_format(path: str, default=None) -> str:
+    if default is not None:
+        return default
+    return EXTENSION_FORMATS.get(os.path.splitext(path)[1].lower(), "monpoly")
+
+
+def convert_value(value: str, monpoly_type: str):
+    """converts a value of a MonPoly log to the type of its attribute, values
+    that can't be converted are left to the validator"""
+    try:
+        if monpoly_type == "int":
+            return int(value)
+        if monpoly_type == "float":
+            return float(value)
+    except ValueError:
+        return value
+    return value.strip('"')
+
+
+def read_monpoly_log(path: str, signature) -> iter:
+    """generates the time points of a MonPoly log file as Timepoint records,
+    tuples of a predicate may be spread over several lines"""
+    timestamp = None
+    predicates = []
+    current = None
+    with open(path, "r", encoding="utf-8") as log:
+        for line_number, line in enumerate(log, 1):
+            position = 0
+            line = line.rstrip("\n")
+            while position < len(line):
+                match = LOG_TOKEN.match(line, position)
+                if match is None:
+                    if line[position:].strip():
+                        raise ValueError(f"{path}:{line_number}: can't parse {line[position:]!r}")
+                    break
+                position = match.end()
+                if match.group("ts") is not None:
+                    if timestamp is not None:
+                        yield Timepoint(timestamp, predicates)
+                    timestamp = int(float(match.group("ts")))
+                    predicates = []
+                    current = None
+                elif match.group("name") is not None:
+                    current = (match.group("name"), [])
+                    predicates.append(current)
+                elif match.group("tuple") is not None:
+                    if current is None:
+                        raise ValueError(f"{path}:{line_number}: tuple without predicate")
+                    predicate = signature.get(current[0])
+                    types = predicate.types if predicate is not None else ()
+                    values = [v.strip() for v in VERDICT_VALUE.findall(match.group("tuple")[1:-1])]
+                    current[1].append(
+                        [
+                            convert_value(v, types[i] if i < len(types) else "string")
+                            for i, v in enumerate(values)
+                        ]
+                    )
+                elif match.group("end") is not None:
+                    current = None
+    if timestamp is not None:
+        yield Timepoint(timestamp, predicates)
+
+
+def read_json_events(path: str, monitor: Monitor, ndjson: bool) -> iter:
+    """generates the time points of a JSON array or NDJSON file in the
+    format of /log-events (or of the NDJSON export)"""
+    timestamp_now = datetime.now()
+    with open(path, "r", encoding="utf-8") as f:
+        if ndjson:
+            events = (json.loads(line) for line in f if line.strip())
+        else:
+            events = json.load(f)
+        for event in events:
+            if "continuation" in event:
+                continue
+            if "timestamp-int" in event:
+                timestamp = int(event["timestamp-int"])
+            else:
+                timestamp = monitor.get_timestamp(event, timestamp_now)
+            yield Timepoint.from_dict(event, timestamp)
+
+
+def batched(timepoints, size: int) -> iter:
+    batch = []
+    for timepoint in timepoints:
+        batch.append(timepoint)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Backfill:
+    """bulk loads historical time points into the tables of a monitor,
+    without going through the HTTP server and without a MonPoly round trip
+    per time point
+
+    Batches are validated and encoded like /log-events and sent by a pool of
+    ILP connections. conf.json is only advanced to the last time point of
+    the batches that were all flushed, so an interrupted backfill leaves a
+    consistent watermark, the rows after it that were already flushed are
+    discarded (see Monitor.discard_partial_timepoints()) before their time
+    point numbers are used again. MonPoly's saved state is left behind the watermark
+    (state_timepoint), the server replays the missing time points on its
+    next start, unless monpoly() runs MonPoly over them right away.
+
+    The server must not run the monitor at the same time.
+    """
+
+    def __init__(
+        self,
+        monitor: Monitor,
+        batch_size: int = BACKFILL_BATCH_SIZE,
+        senders: int = BACKFILL_SENDERS,
+    ):
+        self.monitor = monitor
+        self.batch_size = batch_size
+        self.senders = senders
+        self.local = threading.local()
+        self.writers = []
+        self.writers_lock = threading.Lock()
+        # most recent time point before the backfill
+        self.first_timepoint = monitor.most_recent_timepoint + 1
+        self.log_path = os.path.join(monitor.events_dir, "events_backfill.log")
+        self.stored = 0
+        self.skipped = 0
+
+    def writer(self) -> IlpWriter:
+        """the ILP connection of the current sender thread"""
+        writer = getattr(self.local, "writer", None)
+        if writer is None:
+            db = self.monitor.db
+            writer = IlpWriter(db.host, db.port_influxdb)
+            self.local.writer = writer
+            with self.writers_lock:
+                self.writers.append(writer)
+        return writer
+
+    def flush(self, buf):
+        self.writer().flush(buf)
+
+    def close(self):
+        for writer in self.writers:
+            writer.close()
+
+    def read(self, path: str, file_format=None) -> iter:
+        signature = self.monitor.get_parsed_signature()
+        file_format = input_format(path, file_format)
+        if file_format == "monpoly":
+            return read_monpoly_log(path, signature)
+        return read_json_events(path, self.monitor, file_format == "ndjson")
+
+    def encode(self, batch: list, log) -> tuple:
+        """validates, encodes and numbers the batch and adds it to an ILP buffer
+
+        Returns:
+            tuple: the buffer, the last time point and its time stamp
+        """
+        from questdb.ingress import Buffer
+
+        monitor = self.monitor
+        monitor.get_validator().validate(batch)
+        monitor.create_log_strings(batch)
+        buf = Buffer()
+        time_point = self.next_timepoint
+        timestamp = self.next_timestamp
+        for timepoint in batch:
+            if timepoint.skip is None and timestamp is not None and timepoint.timestamp < timestamp:
+                timepoint.skip = f"out of order time stamp {timepoint.timestamp} < {timestamp}"
+            if timepoint.skip is not None:
+                self.skipped += 1
+                continue
+            time_point += 1
+            timestamp = timepoint.timestamp
+            at = datetime.fromtimestamp(timestamp)
+            buf.row(monitor.timepoints_table, symbols=None, columns={"time_point": time_point}, at=at)
+            for table, symbols, columns in timepoint.rows:
+                columns["time_point"] = time_point
+                buf.row(table, symbols=symbols, columns=columns, at=at)
+            log.write(timepoint.monpoly_string)
+        self.next_timepoint = time_point
+        self.next_timestamp = timestamp
+        return buf, time_point, timestamp
+
+    def commit(self, time_point: int, timestamp):
+        """advances the watermark of conf.json and of the watermark table,
+        all time points up to time_point have been flushed"""
+        from questdb.ingress import Buffer
+
+        monitor = self.monitor
+        if time_point == monitor.most_recent_timepoint:
+            return
+        self.stored += time_point - monitor.most_recent_timepoint
+        monitor.most_recent_timepoint = time_point
+        monitor.most_recent_timestamp = datetime.fromtimestamp(timestamp)
+        monitor.write_config()
+        # batches are flushed in parallel, the watermark row is only written
+        # once all batches before it have been flushed
+        monitor.ensure_watermark_table()
+        monitor.get_watermark()
+        sequence = monitor.watermark.sequence + 1
+        buf = Buffer()
+        buf.row(
+            monitor.watermark_table,
+            symbols=None,
+            columns={"sequence": sequence, "time_point": time_point},
+            at=monitor.most_recent_timestamp,
+        )
+        self.flush(buf)
+        monitor.watermark.commit(sequence, time_point, timestamp)
+
+    def load(self, paths: list, file_format=None) -> dict:
+        """loads the files in the given order
+
+        Returns:
+            dict: JSON style status message
+        """
+        monitor = self.monitor
+        if monitor.get_parsed_signature() is None:
+            return {"error": "no signature set"}
+        try:
+            monitor.discard_partial_timepoints()
+        except ValueError as e:
+            return {"error": str(e)}
+        self.next_timepoint = monitor.most_recent_timepoint
+        self.next_timestamp = monitor.most_recent_timestamp_int()
+        start = perf_counter()
+        pending = deque()
+        error = None
+        with ThreadPoolExecutor(self.senders) as executor, open(self.log_path, "w", encoding="utf-8") as log:
+            try:
+                for path in paths:
+                    for batch in batched(self.read(path, file_format), self.batch_size):
+                        buf, time_point, timestamp = self.encode(batch, log)
+                        pending.append((executor.submit(self.flush, buf), time_point, timestamp))
+                        # bounds the memory used by encoded batches
+                        while pending and (pending[0][0].done() or len(pending) > 2 * self.senders):
+                            future, time_point, timestamp = pending.popleft()
+                            future.result()
+                            self.commit(time_point, timestamp)
+                while pending:
+                    future, time_point, timestamp = pending.popleft()
+                    future.result()
+                    self.commit(time_point, timestamp)
+            except Exception as e:
+                error = e
+                for future, _, _ in pending:
+                    future.cancel()
+        self.close()
+        discarded = None
+        if error is not None and self.next_timepoint > monitor.most_recent_timepoint:
+            # batches after the watermark may have been written partially
+            monitor.discard_after = monitor.most_recent_timepoint
+            monitor.write_config()
+            try:
+                monitor.discard_partial_timepoints()
+                discarded = "were discarded"
+            except ValueError as e:
+                discarded = f"are discarded by the next backfill or start of the monitor ({e})"
+        elapsed = perf_counter() - start
+        response = {
+            "stored": self.stored,
+            "skipped": self.skipped,
+            "most recent timepoint": monitor.most_recent_timepoint,
+            "seconds": round(elapsed, 3),
+        }
+        if error is not None:
+            response["error"] = f"backfill stopped after time point {monitor.most_recent_timepoint}: {error}"
+        if discarded is not None:
+            response["error"] += f", the time points written after it {discarded}"
+        monitor.write_server_log(f"[Backfill.load({paths})] {response}")
+        return response
+
+    def monpoly(self) -> dict:
+        """runs MonPoly once over the time points after its saved state, writes
+        the verdicts of the backfilled time points to the verdict table and
+        saves MonPoly's state at the new watermark
+
+        Returns:
+            dict: JSON style status message
+        """
+        monitor = self.monitor
+        if not (monitor.signature_set() and monitor.policy_set()):
+            return {"error": "signature and policy have to be set"}
+        state = ""
+        after = -1
+        if os.path.exists(monitor.monitor_state_path) and monitor.state_timepoint is not None:
+            state = monitor.monitor_state_path
+            after = monitor.state_timepoint
+        replay_path = os.path.join(monitor.events_dir, "events_backfill_replay.log")
+        if after < self.first_timepoint - 1:
+            # MonPoly's state is older than the backfill, the time points in
+            # between and the backfilled ones are read back from the database
+            _, first_timepoint = monitor.write_replay_log(replay_path, after)
+            os.remove(self.log_path)
+        else:
+            first_timepoint = self.first_timepoint
+            os.replace(self.log_path, replay_path)
+        # server time point of MonPoly's time point 0, a saved state continues
+        # the count of the MonPoly that saved it
+        offset = monitor.monpoly_offset if state else first_timepoint
+        cmd = monitor.monpoly_command(
+            monitor.signature_path, monitor.policy_path, restart=state, log=replay_path, suppress_stdout=False
+        )
+        monitor.write_server_log(f"[Backfill.monpoly()] cmd={cmd}")
+        start = perf_counter()
+        parser = monitor.get_verdict_parser()
+        monitor.ensure_verdict_table()
+        process = subprocess.Popen(
+            cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True
+        )
+        writer = IlpWriter(monitor.db.host, monitor.db.port_influxdb)
+        verdicts = 0
+        lines = []
+        done = False
+        try:
+            for line in process.stdout:
+                if LOG_DONE in line:
+                    done = True
+                    break
+                if line.startswith(b"@"):
+                    lines.append(line.decode("utf-8", errors="replace"))
+                if len(lines) >= VERDICT_BATCH_SIZE:
+                    verdicts += self.write_verdicts(parser, writer, lines, offset)
+                    lines = []
+            verdicts += self.write_verdicts(parser, writer, lines, offset)
+        finally:
+            writer.close()
+        if not done:
+            return {"error": f"monpoly exited with code {process.wait()} before reading the log"}
+        process.stdin.write(f"> save_and_exit {monitor.monitor_state_path} < ;".encode("utf-8"))
+        process.stdin.close()
+        return_code = process.wait()
+        os.remove(replay_path)
+        if return_code != 0:
+            return {"error": f"monpoly exited with code {return_code} while saving its state"}
+        monitor.state_timepoint = monitor.most_recent_timepoint
+        monitor.monpoly_offset = offset
+        monitor.write_config()
+        response = {
+            "verdicts": verdicts,
+            "state timepoint": monitor.state_timepoint,
+            "seconds": round(perf_counter() - start, 3),
+        }
+        monitor.write_server_log(f"[Backfill.monpoly()] {response}")
+        return response
+
+    def write_verdicts(self, parser, writer: IlpWriter, lines: list, offset: int) -> int:
+        """writes the verdicts of the backfilled time points, the verdicts of
+        the replayed ones were already written when they were logged
+
+        Args:
+            offset (int): server time point of MonPoly's time point 0
+        """
+        from questdb.ingress import Buffer
+
+        verdicts = [
+            v for v in parser.parse("".join(lines), offset) if v.time_point >= self.first_timepoint
+        ]
+        if not verdicts:
+            return 0
+        buf = Buffer()
+        self.monitor.verdict_count = parser.add_rows(
+            buf, self.monitor.verdicts_table, verdicts, self.monitor.verdict_count
+        )
+        writer.flush(buf)
+        self.monitor.write_config()
+        return len(verdicts)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="bulk loads historical events into the database of a monitor, stop the server first"
+    )
+    arg_parser.add_argument("files", nargs="+", help="MonPoly log (.log), NDJSON (.ndjson, .jsonl) or JSON (.json) files, loaded in order")
+    arg_parser.add_argument("--format", choices=INPUT_FORMATS, help="format of all files, derived from the extension by default")
+    arg_parser.add_argument("--tenant", help="load into the tables of this tenant")
+    arg_parser.add_argument("--config-dir", default=CONFIG_DIR, help="data directory of the monitor")
+    arg_parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="time points per ILP batch")
+    arg_parser.add_argument("--senders", type=int, default=BACKFILL_SENDERS, help="number of parallel ILP connections")
+    arg_parser.add_argument(
+        "--monpoly",
+        action="store_true",
+        help="run MonPoly over the loaded time points, store their verdicts and save its state",
+    )
+    args = arg_parser.parse_args()
+
+    config_dir = args.config_dir
+    table_prefix = ""
+    if args.tenant is not None:
+        if not TENANT_NAME.fullmatch(args.tenant):
+            arg_parser.error(f"invalid tenant name {args.tenant}, use letters, digits and _")
+        registry = TenantRegistry(os.path.join(config_dir, "tenants"))
+        config_dir = registry.tenant_dir(args.tenant)
+        table_prefix = registry.table_prefix(args.tenant)
+    backfill = Backfill(Monitor(config_dir, table_prefix), args.batch_size, args.senders)
+    response = backfill.load(args.files, args.format)
+    print(json.dumps(response))
+    if "error" in response:
+        sys.exit(1)
+    if args.monpoly:
+        response = backfill.monpoly()
+        print(json.dumps(response))
+        if "error" in response:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
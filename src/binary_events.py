@@ -0,0 +1,240 @@
+import hashlib
+from records import Timepoint
+
+# msgpack is an optional dependency, only needed for binary uploads
+msgpack = None
+
+MSGPACK_MIMETYPE = "application/msgpack"
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, "application/x-msgpack", "application/vnd.msgpack")
+MSGPACK_EXTENSIONS = (".msgpack", ".mpk")
+
+
+def import_msgpack():
+    """
+    Raises:
+        ValueError: if msgpack isn't installed
+    """
+    global msgpack
+    if msgpack is not None:
+        return
+    try:
+        import msgpack as msgpack_module
+    except ImportError as error:
+        raise ValueError("binary events require msgpack (pip install msgpack)") from error
+    msgpack = msgpack_module
+
+
+def schema_id(predicates) -> str:
+    """identifies the predicate ids of a signature, it changes whenever a
+    predicate is added, removed, reordered or retyped
+
+    Args:
+        predicates (_type_): (name, attribute types) in signature order
+    """
+    text = ";".join(f"{name}({','.join(types)})" for name, types in predicates)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def binary_schema(validator) -> dict:
+    """the schema clients need to encode binary events, the id of a
+    predicate is its position in the signature
+
+    Args:
+        validator (_type_): Validator of the current signature
+    """
+    predicates = [(p.name, p.type_names) for p in validator.predicates.values()]
+    return {
+        "schema": schema_id(predicates),
+        "predicates": [
+            {"id": i, "name": name, "types": list(types)}
+            for i, (name, types) in enumerate(predicates)
+        ],
+    }
+
+
+def unpack(data: bytes) -> dict:
+    """
+    Raises:
+        ValueError: if the data isn't a MessagePack map or msgpack isn't installed
+    """
+    import_msgpack()
+    try:
+        document = msgpack.unpackb(data, raw=False, use_list=False)
+    except Exception as error:
+        # msgpack raises several exception types (ExtraData, FormatError, ...)
+        raise ValueError(f"invalid msgpack data: {error}") from error
+    if not isinstance(document, dict):
+        raise ValueError("binary events must be a map")
+    return document
+
+
+def check_schema(document: dict, validator):
+    """
+    Raises:
+        ValueError: if the document was encoded for another signature
+    """
+    if "schema" not in document:
+        return
+    expected = schema_id((p.name, p.type_names) for p in validator.predicates.values())
+    if document["schema"] != expected:
+        raise ValueError(
+            f'events were encoded for schema {document["schema"]}, the signature has schema {expected}'
+        )
+
+
+def decode_timepoints(document: dict, validator) -> list:
+    """decodes the time points of a MessagePack document into Timepoint
+    records, occurrences are kept as the tuples msgpack decoded them as
+
+    The document is a map
+    `{"schema": <schema id>, "timepoints": [[<timestamp>, [[<predicate id>, [[<attribute>, ...], ...]], ...]], ...]}`
+    with integer time stamps in seconds since 1970-01-01 00:00:00 UTC,
+    `schema` is optional.
+
+    Args:
+        document (dict): the unpacked MessagePack document
+        validator (_type_): Validator of the current signature
+
+    Raises:
+        ValueError: if the document is malformed or was encoded for another
+            signature
+
+    Returns:
+        list: Timepoint records, the ones with an unknown predicate id or a
+            time stamp that isn't an integer are marked as skipped
+    """
+    if "timepoints" not in document:
+        raise ValueError('binary events must contain "timepoints" or "timestamps"')
+    check_schema(document, validator)
+    predicates = validator.predicates
+    names = dict(enumerate(predicates))
+    timepoints = []
+    append = timepoints.append
+    for entry in document["timepoints"]:
+        try:
+            timestamp, encoded = entry
+            if type(timestamp) is not int:
+                append(Timepoint(0, [], skip=f"time stamp {timestamp!r} isn't an integer"))
+                continue
+            append(
+                Timepoint(
+                    timestamp,
+                    [(names[pid], occurrences) for pid, occurrences in encoded],
+                )
+            )
+        except KeyError as error:
+            append(Timepoint(timestamp, [], skip=f"unknown predicate id {error.args[0]!r}"))
+        except (TypeError, ValueError):
+            append(Timepoint(0, [], skip=f"malformed time point {entry!r}"))
+    return timepoints
+
+
+def column_data(column, monpoly_type: str):
+    """a column of a columnar batch, numpy arrays of numbers as raw bytes"""
+    if hasattr(column, "dtype"):
+        if monpoly_type == "int":
+            return column.astype("<i8").tobytes()
+        if monpoly_type == "float":
+            return column.astype("<f8").tobytes()
+        return column.tolist()
+    return list(column)
+
+
+class EventPacker:
+    """client helper that encodes events into the binary format of
+    `/log-events`, e.g.
+
+        packer = EventPacker.from_server("http://localhost:5000")
+        packer.add(1700000000, {"withdraw": [("alice", 100)]})
+        packer.post("http://localhost:5000")
+
+    or a columnar batch (see columnar_events.py):
+
+        data = packer.pack_columnar(timestamps, {"withdraw": (indexes, [users, amounts])})
+        packer.post("http://localhost:5000", data=data)
+    """
+
+    def __init__(self, schema: dict):
+        self.schema = schema["schema"]
+        self.ids = {p["name"]: p["id"] for p in schema["predicates"]}
+        self.types = {p["name"]: p["types"] for p in schema["predicates"]}
+        self.timepoints = []
+
+    @classmethod
+    def from_server(cls, url: str) -> "EventPacker":
+        """fetches the schema of the current signature from /get-binary-schema"""
+        import json
+        from urllib.request import urlopen
+
+        with urlopen(url.rstrip("/") + "/get-binary-schema", data=b"") as response:
+            return cls(json.load(response))
+
+    def add(self, timestamp: int, predicates: dict):
+        """adds a time point
+
+        Args:
+            timestamp (int): seconds since 1970-01-01 00:00:00 UTC
+            predicates (dict): predicate name -> list of attribute tuples
+
+        Raises:
+            KeyError: if a predicate isn't part of the signature
+        """
+        ids = self.ids
+        self.timepoints.append(
+            (int(timestamp), [(ids[name], occurrences) for name, occurrences in predicates.items()])
+        )
+
+    def pack(self) -> bytes:
+        """the MessagePack document of the added time points, they are cleared"""
+        import_msgpack()
+        data = msgpack.packb({"schema": self.schema, "timepoints": self.timepoints})
+        self.timepoints = []
+        return data
+
+    def pack_columnar(self, timestamps, predicates: dict) -> bytes:
+        """the MessagePack document of a columnar batch, numeric numpy arrays
+        are sent as raw little-endian bytes
+
+        Args:
+            timestamps (_type_): integer time stamps of the time points
+            predicates (dict): predicate name -> (index of the time point of
+                each occurrence, list of attribute columns)
+
+        Raises:
+            KeyError: if a predicate isn't part of the signature
+        """
+        import_msgpack()
+        blocks = []
+        for name, (indexes, columns) in predicates.items():
+            blocks.append(
+                {
+                    "id": self.ids[name],
+                    "timepoints": column_data(indexes, "int"),
+                    "columns": [column_data(c, t) for c, t in zip(columns, self.types[name])],
+                }
+            )
+        return msgpack.packb(
+            {"schema": self.schema, "timestamps": column_data(timestamps, "int"), "predicates": blocks}
+        )
+
+    def post(self, url: str, source=None, data=None) -> dict:
+        """sends the added time points, or the given packed data, to /log-events
+
+        Returns:
+            dict: the response of the server
+        """
+        import json
+        from urllib.parse import quote
+        from urllib.request import Request, urlopen
+
+        target = url.rstrip("/") + "/log-events"
+        if source is not None:
+            target += f"?source={quote(source)}"
+        request = Request(
+            target,
+            data=self.pack() if data is None else data,
+            headers={"Content-Type": MSGPACK_MIMETYPE},
+            method="POST",
+        )
+        with urlopen(request) as response:
+            return json.load(response)
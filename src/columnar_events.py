@@ -0,0 +1,215 @@
+from itertools import repeat
+from binary_events import check_schema
+from encoder import quote_string
+from records import Timepoint
+
+# numpy is an optional dependency, only needed for columnar batches
+np = None
+
+# dtype of numeric arrays sent as raw bytes
+BINARY_DTYPES = {"int": "<i8", "float": "<f8"}
+
+
+def import_numpy():
+    """
+    Raises:
+        ValueError: if numpy isn't installed
+    """
+    global np
+    if np is not None:
+        return
+    try:
+        import numpy
+    except ImportError as error:
+        raise ValueError("columnar batches require numpy (pip install numpy)") from error
+    np = numpy
+
+
+def int_array(values, what: str):
+    """an int64 array of a list of integers or of raw little-endian int64 bytes
+
+    Raises:
+        ValueError: if the values aren't integers
+    """
+    if isinstance(values, bytes):
+        if len(values) % 8:
+            raise ValueError(f"{what} has {len(values)} bytes, not a multiple of 8")
+        return np.frombuffer(values, dtype=BINARY_DTYPES["int"])
+    array = np.asarray(values)
+    if array.size == 0:
+        return array.astype(np.int64)
+    # booleans and floats are rejected like in the JSON format
+    if array.ndim != 1 or array.dtype.kind not in "iu":
+        raise ValueError(f"{what} must be an array of integers")
+    return array.astype(np.int64, copy=False)
+
+
+def float_array(values, what: str):
+    if isinstance(values, bytes):
+        if len(values) % 8:
+            raise ValueError(f"{what} has {len(values)} bytes, not a multiple of 8")
+        return np.frombuffer(values, dtype=BINARY_DTYPES["float"])
+    array = np.asarray(values)
+    if array.size == 0:
+        return array.astype(np.float64)
+    if array.ndim != 1 or array.dtype.kind not in "iuf":
+        raise ValueError(f"{what} must be an array of numbers")
+    return array.astype(np.float64, copy=False)
+
+
+def string_array(values, what: str):
+    # numpy would silently convert other types to strings
+    if isinstance(values, (bytes, str)) or not all(type(v) is str for v in values):
+        raise ValueError(f"{what} must be an array of strings")
+    return np.array(values, dtype=object)
+
+
+class ColumnarDecoder:
+    """decodes a columnar batch into Timepoint records with their MonPoly log
+    strings and ILP rows, the attributes are checked and formatted a column
+    at a time and grouped by time point with a single sort per predicate,
+    instead of validating and encoding every occurrence separately
+
+    A batch is a map
+    `{"schema": <schema id>, "timestamps": [<timestamp>, ...], "predicates": [{"id": <predicate id>, "timepoints": [<index>, ...], "columns": [[<x1>, ...], [<x2>, ...], ...]}, ...]}`
+    where the i-th occurrence of a predicate belongs to the time point at
+    index `timepoints[i]` of `timestamps`. Integer and float arrays may also
+    be raw little-endian int64/float64 bytes.
+    """
+
+    def __init__(self, validator, encoder):
+        self.validator = validator
+        self.encoder = encoder
+        self.names = dict(enumerate(validator.predicates))
+
+    def decode(self, document: dict) -> list:
+        """
+        Raises:
+            ValueError: if the batch is malformed, has an attribute of the wrong
+                type or was encoded for another signature
+
+        Returns:
+            list: Timepoint records, the ones with a string constant that can't
+                be encoded are marked as skipped
+        """
+        import_numpy()
+        check_schema(document, self.validator)
+        timestamps = int_array(document["timestamps"], "timestamps")
+        count = len(timestamps)
+        parts = [[f"@{timestamp}"] for timestamp in timestamps.tolist()]
+        rows = [[] for _ in range(count)]
+        skips = dict()
+        for block in document.get("predicates", ()):
+            self.decode_predicate(block, count, parts, rows, skips)
+        timepoints = []
+        for i, timestamp in enumerate(timestamps.tolist()):
+            timepoint = Timepoint(timestamp, [], skip=skips.get(i))
+            if timepoint.skip is None:
+                parts[i].append(";\n")
+                timepoint.monpoly_string = " ".join(parts[i])
+                timepoint.rows = rows[i]
+            timepoints.append(timepoint)
+        return timepoints
+
+    def decode_predicate(self, block: dict, count: int, parts: list, rows: list, skips: dict):
+        """appends the log entries and ILP rows of one predicate to those of
+        its time points"""
+        if not isinstance(block, dict) or "id" not in block:
+            raise ValueError("every predicate of a columnar batch needs an id")
+        name = self.names.get(block["id"])
+        if name is None:
+            raise ValueError(f'unknown predicate id {block["id"]!r}')
+        validator = self.validator.predicates[name]
+        indexes = int_array(block.get("timepoints", ()), f"timepoints of {name}")
+        columns = block.get("columns", ())
+        if len(columns) != validator.arity:
+            raise ValueError(f"{name} expects {validator.arity} columns, got {len(columns)}")
+        size = len(indexes)
+        if size == 0:
+            return
+        if indexes.min() < 0 or indexes.max() >= count:
+            raise ValueError(f"timepoints of {name} must be between 0 and {count - 1}")
+        # occurrences are grouped by time point, in their order within it
+        order = np.argsort(indexes, kind="stable")
+        indexes = indexes[order]
+        # the MonPoly constants and ILP values of each attribute, in time point order
+        formatted = []
+        values = []
+        for i, (column, monpoly_type) in enumerate(zip(columns, validator.type_names)):
+            what = f"attribute x{i+1} of {name}"
+            if monpoly_type == "int":
+                array = int_array(column, what)
+            elif monpoly_type == "float":
+                array = float_array(column, what)
+            else:
+                array = string_array(column, what)
+            if len(array) != size:
+                raise ValueError(f"{what} has {len(array)} values, expected {size}")
+            array = array[order]
+            values.append(array.tolist())
+            if monpoly_type in ("int", "float"):
+                formatted.append(array.astype(str))
+            else:
+                formatted.append(self.quote(array, indexes, skips))
+        encoder = self.encoder.predicate_encoder(name)
+        entries = self.entries(name, formatted, size)
+        occurrence_rows = self.rows(encoder, values, size)
+        # one slice of the sorted occurrences per time point
+        present, starts = np.unique(indexes, return_index=True)
+        ends = starts[1:].tolist() + [size]
+        for index, start, end in zip(present.tolist(), starts.tolist(), ends):
+            parts[index].append(" ".join(entries[start:end]))
+            rows[index].extend(occurrence_rows[start:end])
+
+    @staticmethod
+    def quote(array, indexes, skips: dict):
+        """the MonPoly constants of a string column, each distinct value is
+        quoted once, the time points of values that can't be encoded are skipped"""
+        unique, inverse = np.unique(array.astype(str), return_inverse=True)
+        quoted = []
+        invalid = []
+        for i, value in enumerate(unique.tolist()):
+            try:
+                quoted.append(quote_string(value))
+            except ValueError as error:
+                quoted.append("")
+                invalid.append((i, str(error)))
+        for i, error in invalid:
+            for index in np.unique(indexes[inverse == i]).tolist():
+                skips.setdefault(index, error)
+        return np.array(quoted, dtype=str)[inverse]
+
+    @staticmethod
+    def entries(name: str, formatted: list, size: int) -> list:
+        """the `name (x1, x2, ...)` log entries of all occurrences"""
+        if not formatted:
+            return [f"{name} ()"] * size
+        entries = np.char.add(f"{name} (", formatted[0])
+        for column in formatted[1:]:
+            entries = np.char.add(np.char.add(entries, ", "), column)
+        return np.char.add(entries, ")").tolist()
+
+    @staticmethod
+    def rows(encoder, values: list, size: int) -> list:
+        """the (table, symbols, columns) ILP rows of all occurrences, built
+        from the columns of the predicate's row layout"""
+        layout = encoder.layout
+        by_name = dict(zip(layout.names, values))
+        columns = dicts(layout.column_names, [by_name[c] for c in layout.column_names], size)
+        if layout.symbol_names:
+            symbols = dicts(
+                layout.symbol_names,
+                [list(map(str, by_name[c])) for c in layout.symbol_names],
+                size,
+            )
+        else:
+            symbols = repeat(None)
+        return list(zip(repeat(encoder.table), symbols, columns))
+
+
+def dicts(names: tuple, columns: list, size: int):
+    """one dict per row of the columns, without a loop in Python, every row
+    gets its own dict since the time point is added to it later"""
+    if not names:
+        return map(dict, repeat((), size))
+    return map(dict, zip(*(zip(repeat(name), column) for name, column in zip(names, columns))))
@@ -0,0 +1,123 @@
+import os
+from export import EventExporter
+
+# pyarrow is an optional dependency, only needed for columnar exports, it is
+# imported on the first export since it takes a while to import
+pa = None
+pq = None
+
+# number of time points fetched from the database per batch
+COLUMNAR_BATCH_SIZE = 50_000
+COLUMNAR_FORMATS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+
+def import_pyarrow():
+    """
+    Raises:
+        ValueError: if pyarrow isn't installed
+    """
+    global pa, pq
+    if pa is not None:
+        return
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as error:
+        raise ValueError("columnar exports require pyarrow (pip install pyarrow)") from error
+    pa = pyarrow
+    pq = pyarrow.parquet
+
+
+def arrow_type(monpoly_type: str):
+    """the arrow type of an attribute with the given MonPoly type"""
+    if monpoly_type == "int":
+        return pa.int64()
+    if monpoly_type == "float":
+        return pa.float64()
+    return pa.string()
+
+
+class ColumnarExporter(EventExporter):
+    """writes the occurrences of each predicate in a time range to one
+    columnar file per predicate (time_point, time_stamp, x1, ..., xn)
+
+    The time points table is paginated the same way as for the streaming
+    export, each batch is appended to the files as a record batch / row group.
+    """
+
+    def __init__(self, db, timepoints_table: str, signature, export_format: str, **kwargs):
+        import_pyarrow()
+        if export_format not in COLUMNAR_FORMATS:
+            raise ValueError(
+                f"unknown format {export_format}, use one of {', '.join(COLUMNAR_FORMATS)}"
+            )
+        kwargs.setdefault("batch_size", COLUMNAR_BATCH_SIZE)
+        super().__init__(db, timepoints_table, signature, **kwargs)
+        self.export_format = export_format
+        self.schemas = {
+            p.name: pa.schema(
+                [("time_point", pa.int64()), ("time_stamp", pa.timestamp("us"))]
+                + [(c, arrow_type(t)) for c, t in zip(p.columns, p.types)]
+            )
+            for p in self.predicates
+        }
+
+    def fetch_batch(self, cursor, rows: list) -> dict:
+        """fetches the occurrences of all predicates for the given time points
+
+        Returns:
+            dict: predicate name -> arrow table
+        """
+        first_tp, first_ts = rows[0]
+        last_tp, last_ts = rows[-1]
+        tables = {}
+        for predicate in self.predicates:
+            columns = ", ".join(("time_point", "time_stamp") + predicate.columns)
+            cursor.execute(
+                f"SELECT {columns} FROM {self.table_prefix}{predicate.name} "
+                f"WHERE time_stamp BETWEEN '{first_ts}' AND '{last_ts}' "
+                f"AND time_point BETWEEN {first_tp} AND {last_tp};"
+            )
+            result = cursor.fetchall()
+            if not result:
+                continue
+            schema = self.schemas[predicate.name]
+            tables[predicate.name] = pa.Table.from_arrays(
+                [
+                    pa.array(column, type=field.type)
+                    for column, field in zip(zip(*result), schema)
+                ],
+                schema=schema,
+            )
+        return tables
+
+    def open_writer(self, path: str, schema):
+        if self.export_format == "parquet":
+            return pq.ParquetWriter(path, schema)
+        return pa.ipc.new_file(path, schema)
+
+    def write(self, directory: str) -> list:
+        """writes the export into the given directory
+
+        Args:
+            directory (str): the output directory, created if it doesn't exist
+
+        Returns:
+            list: paths of the written files, one per predicate with occurrences
+        """
+        os.makedirs(directory, exist_ok=True)
+        extension = COLUMNAR_FORMATS[self.export_format]
+        writers = {}
+        paths = []
+        try:
+            for batch in self.batches():
+                for name, table in batch.items():
+                    if name not in writers:
+                        path = os.path.join(directory, name + extension)
+                        writers[name] = self.open_writer(path, self.schemas[name])
+                        paths.append(path)
+                    writers[name].write_table(table)
+        finally:
+            for writer in writers.values():
+                writer.close()
+        return paths
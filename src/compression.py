@@ -0,0 +1,276 @@
+import threading
+import zlib
+
+# zstandard is an optional dependency, without it only gzip is supported
+zstandard = None
+zstandard_missing = None
+
+# magic numbers of the supported encodings
+MAGIC = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+FILE_EXTENSIONS = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+# chunks of compressed uploads read at once
+READ_SIZE = 64 * 1024
+# default bound of the decompressed size of an upload
+MAX_DECOMPRESSED_BYTES = 256 * 1024 * 1024
+# responses smaller than this aren't compressed
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def import_zstandard():
+    """
+    Raises:
+        ValueError: if zstandard isn't installed
+    """
+    global zstandard, zstandard_missing
+    if zstandard is not None:
+        return
+    # the import isn't retried on every negotiation
+    if zstandard_missing is None:
+        try:
+            import zstandard as zstd_module
+        except ImportError as error:
+            zstandard_missing = error
+        else:
+            zstandard = zstd_module
+            return
+    raise ValueError("zstd requires zstandard (pip install zstandard)") from zstandard_missing
+
+
+def zstd_available() -> bool:
+    try:
+        import_zstandard()
+    except ValueError:
+        return False
+    return True
+
+
+def detect_encoding(stream, filename: str = ""):
+    """the encoding of an uploaded file, from its magic number if the stream
+    is seekable and otherwise from its file extension
+
+    Returns:
+        _type_: "gzip", "zstd" or None if the file isn't compressed
+    """
+    if stream.seekable():
+        position = stream.tell()
+        head = stream.read(4)
+        stream.seek(position)
+        for magic, encoding in MAGIC.items():
+            if head.startswith(magic):
+                return encoding
+        return None
+    for extension, encoding in FILE_EXTENSIONS.items():
+        if filename.lower().endswith(extension):
+            return encoding
+    return None
+
+
+class CountingReader:
+    """a binary file object that counts the bytes read from it"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.count += len(data)
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+
+class DecompressingReader:
+    """decompresses a binary stream while it is read, e.g. by json.load(),
+    the compressed data is never written to disk
+
+    Every fill() decompresses at most READ_SIZE bytes, so a small upload
+    that inflates to a huge one (a "zip bomb") is stopped at max_size
+    instead of being decompressed into memory.
+    """
+
+    def __init__(self, raw, encoding: str, max_size: int = MAX_DECOMPRESSED_BYTES):
+        self.raw = CountingReader(raw)
+        self.encoding = encoding
+        self.max_size = max_size
+        if encoding == "gzip":
+            self.decompressor = zlib.decompressobj(wbits=47)
+        elif encoding == "zstd":
+            import_zstandard()
+            # unlike decompressobj(), a stream reader bounds the output of a read
+            self.decompressor = zstandard.ZstdDecompressor().stream_reader(
+                self.raw, read_size=READ_SIZE, read_across_frames=True
+            )
+        else:
+            raise ValueError(f"unknown encoding {encoding}, use one of gzip, zstd")
+        # compressed data read but not decompressed yet (gzip)
+        self.pending = b""
+        self.buffer = b""
+        self.eof = False
+        # uncompressed bytes returned
+        self.count = 0
+        # uncompressed bytes produced
+        self.decompressed = 0
+
+    def fill(self):
+        """
+        Raises:
+            ValueError: if the data is invalid or decompresses to more than
+                max_size bytes
+        """
+        try:
+            if self.encoding == "gzip":
+                data = self.inflate()
+            else:
+                data = self.decompressor.read(READ_SIZE)
+                self.eof = not data
+        except zlib.error as error:
+            raise ValueError(f"invalid {self.encoding} data: {error}") from error
+        except Exception as error:
+            # zstandard.ZstdError
+            raise ValueError(f"invalid {self.encoding} data: {error}") from error
+        self.decompressed += len(data)
+        if self.decompressed > self.max_size:
+            raise ValueError(f"{self.encoding} data decompresses to more than {self.max_size} bytes")
+        self.buffer += data
+
+    def inflate(self) -> bytes:
+        """at most READ_SIZE bytes of the gzip stream, also of concatenated
+        gzip members"""
+        while True:
+            if not self.pending:
+                self.pending = self.raw.read(READ_SIZE)
+                if not self.pending:
+                    self.eof = True
+                    return self.decompressor.flush()
+            data = self.decompressor.decompress(self.pending, READ_SIZE)
+            if self.decompressor.eof:
+                self.pending = self.decompressor.unused_data
+                self.decompressor = zlib.decompressobj(wbits=47)
+            else:
+                self.pending = self.decompressor.unconsumed_tail
+            if data:
+                return data
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            while not self.eof:
+                self.fill()
+            data, self.buffer = self.buffer, b""
+        else:
+            while len(self.buffer) < size and not self.eof:
+                self.fill()
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.count += len(data)
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+    @property
+    def compressed_bytes(self) -> int:
+        return self.raw.count
+
+
+class CompressionStats:
+    """transferred and uncompressed bytes of compressed uploads and responses"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.directions = {
+            "uploads": {"count": 0, "compressed bytes": 0, "uncompressed bytes": 0},
+            "responses": {"count": 0, "compressed bytes": 0, "uncompressed bytes": 0},
+        }
+        self.encodings = dict()
+
+    def add(self, direction: str, encoding: str, compressed: int, uncompressed: int):
+        with self.lock:
+            stats = self.directions[direction]
+            stats["count"] += 1
+            stats["compressed bytes"] += compressed
+            stats["uncompressed bytes"] += uncompressed
+            key = f"{direction} {encoding}"
+            self.encodings[key] = self.encodings.get(key, 0) + 1
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            result = {}
+            for direction, stats in self.directions.items():
+                ratio = None
+                if stats["compressed bytes"]:
+                    ratio = round(stats["uncompressed bytes"] / stats["compressed bytes"], 2)
+                result[direction] = stats | {"ratio": ratio}
+            result["encodings"] = dict(self.encodings)
+        result["zstd available"] = zstd_available()
+        return result
+
+
+# compression statistics of this process
+stats = CompressionStats()
+
+
+def negotiate(accept_encoding: str):
+    """the preferred supported encoding of an Accept-Encoding header
+
+    Returns:
+        _type_: "zstd", "gzip" or None for an uncompressed response
+    """
+    preferences = {}
+    for item in (accept_encoding or "").split(","):
+        parts = [p.strip() for p in item.split(";")]
+        if not parts[0]:
+            continue
+        quality = 1.0
+        for parameter in parts[1:]:
+            if parameter.startswith("q="):
+                try:
+                    quality = float(parameter[2:])
+                except ValueError:
+                    quality = 0.0
+        preferences[parts[0].lower()] = quality
+    candidates = ["zstd", "gzip"] if zstd_available() else ["gzip"]
+    best = None
+    best_quality = 0.0
+    for encoding in candidates:
+        quality = preferences.get(encoding, preferences.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_chunks(chunks, encoding: str):
+    """compresses the chunks (str or bytes) of a streamed response as they
+    are generated, every chunk is flushed so that streamed batches reach the
+    client right away
+
+    Args:
+        chunks (_type_): iterable of str or bytes
+        encoding (str): "gzip" or "zstd"
+    """
+    if encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    else:
+        import_zstandard()
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        flush = lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        finish = compressor.flush
+    compressed = 0
+    uncompressed = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            uncompressed += len(chunk)
+            data = compressor.compress(chunk) + flush()
+            compressed += len(data)
+            yield data
+        data = finish()
+        compressed += len(data)
+        yield data
+    finally:
+        stats.add("responses", encoding, compressed, uncompressed)
@@ -1,11 +1,60 @@
-import psycopg2 as pg
+import threading
+from contextlib import contextmanager
 from time import time
+# psycopg2 and questdb.ingress take a while to import, they are only imported
+# once the first connection is made, so that the server starts quickly
 
 USER     = "admin"
 PASSWORD = "quest"
 HOST     = "localhost" # questdb
 # HOST     = "172.28.128.1"
 DATABASE = "qdb"
+# connections kept open per database configuration
+POOL_MIN_CONNECTIONS = 1
+POOL_MAX_CONNECTIONS = 16
+
+# connection pools and ILP writers are shared by all DbHelper objects with the
+# same configuration, e.g. by the monitors of all tenants
+pools = dict()
+ilp_writers = dict()
+shared_lock = threading.Lock()
+
+
+class IlpWriter:
+    """a single long-lived ILP connection, shared by all monitors writing to
+    the same QuestDB instance
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.sender = None
+        self.lock = threading.Lock()
+
+    def flush(self, buf):
+        """sends the buffer, reconnecting if the connection was lost
+
+        Raises:
+            IngressError: if the buffer can't be sent
+        """
+        from questdb.ingress import IngressError, Sender
+
+        with self.lock:
+            if self.sender is None:
+                self.sender = Sender(self.host, self.port)
+                self.sender.connect()
+            try:
+                self.sender.flush(buf)
+            except IngressError:
+                self.close()
+                raise
+
+    def close(self):
+        if self.sender is not None:
+            try:
+                self.sender.close()
+            finally:
+                self.sender = None
 
 class DbHelper:
     def __init__(
@@ -50,7 +99,58 @@ class DbHelper:
         }
         return config
 
+    def connection_key(self) -> tuple:
+        return (self.user, self.password, self.host, self.port_pgsql, self.database)
+
+    def get_pool(self):
+        """the connection pool shared by all helpers with this configuration"""
+        from psycopg2 import pool
+
+        key = self.connection_key()
+        with shared_lock:
+            if key not in pools:
+                pools[key] = pool.ThreadedConnectionPool(
+                    POOL_MIN_CONNECTIONS,
+                    POOL_MAX_CONNECTIONS,
+                    user=self.user,
+                    password=self.password,
+                    host=self.host,
+                    port=self.port_pgsql,
+                    database=self.database,
+                    gssencmode="disable",
+                    sslmode="disable",
+                )
+            return pools[key]
+
+    @contextmanager
+    def connection(self):
+        """borrows a connection from the shared pool"""
+        import psycopg2 as pg
+
+        connection_pool = self.get_pool()
+        connection = connection_pool.getconn()
+        try:
+            yield connection
+        except pg.OperationalError:
+            # the connection may be broken, don't hand it out again
+            connection_pool.putconn(connection, close=True)
+            connection = None
+            raise
+        finally:
+            if connection is not None:
+                connection_pool.putconn(connection)
+
+    def ilp_writer(self) -> IlpWriter:
+        """the ILP writer shared by all helpers with this host and port"""
+        key = (self.host, self.port_influxdb)
+        with shared_lock:
+            if key not in ilp_writers:
+                ilp_writers[key] = IlpWriter(self.host, self.port_influxdb)
+            return ilp_writers[key]
+
     def make_connection(self):
+        import psycopg2 as pg
+
         connection = pg.connect(
             user=self.user,
             password=self.password,
@@ -67,27 +167,28 @@ class DbHelper:
         """
         Runs the given SQL query on the database
         """
-        connection = None
-        cursor = None
+        import psycopg2 as pg
+        from psycopg2 import pool
+
         try:
-            connection = self.make_connection()
-            cursor = connection.cursor()
-            # t = time()
-            cursor.execute(query)
-            # print("query run time: ", time() - t)
-            if select:
-                return {"response": cursor.fetchall()}
-            else:
-                return {"response": "successfully executed query: " + query}
+            with self.connection() as connection:
+                # QuestDB doesn't have transactions, pooled connections
+                # shouldn't be left inside one either
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    # t = time()
+                    cursor.execute(query)
+                    # print("query run time: ", time() - t)
+                    if select:
+                        return {"response": cursor.fetchall()}
+                    else:
+                        return {"response": "successfully executed query: " + query}
         except pg.OperationalError as error:
             return{"error": f"pg.OperationalError: {str(error)}"}
         except pg.DatabaseError as error:
             return{"error": f"pg.DatabaseError: {str(error)}"}
-        finally:
-            if cursor is not None:
-                cursor.close()
-            if connection is not None:
-                connection.close()
+        except pool.PoolError as error:
+            return{"error": f"pool.PoolError: {str(error)}"}
 
 
     def set_user(self, user: str):
@@ -0,0 +1,164 @@
+import gc
+import re
+from records import RowLayout
+
+# strings MonPoly's log lexer accepts without quotes
+UNQUOTED_STRING = re.compile(r"[A-Za-z0-9_\-/:.']+")
+# string attributes tend to have few distinct values, their encoding is cached
+QUOTE_CACHE_SIZE = 100_000
+# attribute types whose constants are formatted by quote_string()
+QUOTED_TYPES = ("string", "regexp")
+
+
+class QuoteCache(dict):
+    """maps constants to their log representation, computed on a miss, so
+    that hits are a plain dictionary lookup, see encoder_source()"""
+
+    def __missing__(self, value) -> str:
+        quoted = str(value)
+        if not UNQUOTED_STRING.fullmatch(quoted):
+            if '"' in quoted:
+                raise ValueError(f"string constant {quoted} contains a double quote")
+            quoted = f'"{quoted}"'
+        if len(self) >= QUOTE_CACHE_SIZE:
+            self.clear()
+        self[value] = quoted
+        return quoted
+
+
+quote_cache = QuoteCache()
+
+
+def quote_string(value) -> str:
+    """formats a string constant for the MonPoly log, quoting it if necessary
+
+    Raises:
+        ValueError: if the string can't be represented in the log
+    """
+    return quote_cache[value]
+
+
+def format_value(value) -> str:
+    """formats a constant of unknown type, e.g. one read from the database"""
+    if isinstance(value, str):
+        return quote_string(value)
+    return str(value)
+
+
+def encoder_source(name: str, types, layout: RowLayout, table: str) -> str:
+    """the source of a function encoding the occurrences of a predicate, with
+    the attributes unpacked into local variables, the columns of the ILP rows
+    as dict displays and the log entry as an f-string, see PredicateEncoder
+
+    Names and columns only enter the source as literals (repr()), quote() is
+    the quote cache's lookup.
+    """
+    variables = [f"a{i}" for i in range(len(types))]
+    target = f"({''.join(v + ', ' for v in variables)})"
+    formatted = [
+        f"{{quote({v})}}" if t in QUOTED_TYPES else f"{{{v}}}" for v, t in zip(variables, types)
+    ]
+    by_name = dict(zip(layout.names, variables))
+    columns = ", ".join(f"{c!r}: {by_name[c]}" for c in layout.column_names)
+    if layout.symbol_getter is None:
+        symbols = "None"
+    else:
+        symbols = "{" + ", ".join(f"{c!r}: str({by_name[c]})" for c in layout.symbol_names) + "}"
+    entry = f"f\"({', '.join(formatted)})\""
+    return (
+        "def encode(occurrences, parts, rows):\n"
+        f"    parts.append({name + ' '!r} + ' '.join([{entry} for {target} in occurrences]))\n"
+        f"    rows.extend([({table!r}, {symbols}, {{{columns}}}) for {target} in occurrences])\n"
+    )
+
+
+class PredicateEncoder:
+    """encodes the occurrences of one predicate into a MonPoly log entry and
+    ILP rows, specialized on the predicate's attribute types
+
+    The log entry names the predicate once, followed by the tuples of all its
+    occurrences (`P (1, "a b") (2, c)`), string and regexp constants are
+    quoted. The loops over the occurrences are compiled for the predicate
+    (see encoder_source()), which spares the interpreter the generic zip(),
+    dict() and formatting calls per occurrence.
+    """
+    __slots__ = ("name", "table", "layout", "encode")
+
+    def __init__(self, name: str, types, layout: RowLayout, table: str):
+        self.name = name
+        self.table = table
+        self.layout = layout
+        namespace = {"quote": quote_cache.__getitem__}
+        exec(encoder_source(name, types, layout, table), namespace)
+        # encode(occurrences, parts, rows) appends the log entry of the
+        # occurrences to `parts` and their (table, symbols, columns) ILP rows
+        # to `rows`, raises ValueError if an occurrence has another arity or a
+        # string constant can't be encoded
+        self.encode = namespace["encode"]
+
+
+class Encoder:
+    """single pass encoder of Timepoint records, compiled from the signature"""
+
+    def __init__(self, signature, layouts: dict, table_prefix: str = ""):
+        self.table_prefix = table_prefix
+        self.encoders = dict()
+        if signature is not None:
+            for predicate in signature:
+                self.encoders[predicate.name] = PredicateEncoder(
+                    predicate.name,
+                    predicate.types,
+                    layouts[predicate.name],
+                    table_prefix + predicate.name,
+                )
+
+    def predicate_encoder(self, name: str) -> PredicateEncoder:
+        """
+        Raises:
+            ValueError: if the predicate isn't part of the signature, the
+                Validator skips such time points before they are encoded
+        """
+        encoder = self.encoders.get(name)
+        if encoder is None:
+            raise ValueError(f"unknown predicate {name}")
+        return encoder
+
+    def encode(self, timepoints: list) -> list:
+        """sets the MonPoly log string and the ILP rows of each time point,
+        time points that can't be encoded are marked as skipped
+
+        Args:
+            timepoints (list): Timepoint records
+
+        Returns:
+            list: the same records
+        """
+        # the log strings and rows can't form cycles, without pausing the
+        # collector it repeatedly scans the growing batch for nothing
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self.encode_timepoints(timepoints)
+        finally:
+            if collecting:
+                gc.enable()
+        return timepoints
+
+    def encode_timepoints(self, timepoints: list):
+        """encode() with the garbage collector paused"""
+        for timepoint in timepoints:
+            if timepoint.skip is not None:
+                continue
+            parts = [f"@{timepoint.timestamp}"]
+            rows = []
+            try:
+                for name, occurrences in timepoint.predicates:
+                    if occurrences:
+                        encoder = self.predicate_encoder(name)
+                        encoder.encode(occurrences, parts, rows)
+            except (ValueError, TypeError, IndexError) as error:
+                timepoint.skip = str(error)
+                continue
+            parts.append(";\n")
+            timepoint.monpoly_string = " ".join(parts)
+            timepoint.rows = rows
@@ -0,0 +1,511 @@
+import argparse
+import functools
+import hashlib
+import hmac
+import os
+import pickle
+import socket
+import socketserver
+import struct
+import threading
+from time import sleep
+from types import SimpleNamespace
+from db_helper import DbHelper
+from encoder import Encoder
+from monitor import CONFIG_DIR, TIMEPOINTS_TABLE, Monitor
+from profiling import Profiling
+from records import row_layouts
+from schema import Schema
+from signature import Signature
+from tenants import TENANT_NAME, TenantRegistry
+from tracing import tracer
+from validation import Validator
+
+# default path of the socket HTTP workers reach the engine at
+ENGINE_SOCKET = os.path.join(CONFIG_DIR, "backend-data", "engine.sock")
+# every frame is prefixed with its length as unsigned 32 bit big endian integer
+FRAME_HEADER = struct.Struct("!I")
+# the socket and its key file are created with permissions 0600
+SOCKET_UMASK = 0o177
+# bytes of the secret the engine writes next to its socket on every start
+KEY_SIZE = 32
+# frames carry an HMAC-SHA256 of the payload, only verified payloads are unpickled
+TAG_SIZE = hashlib.sha256().digest_size
+# directories of a monitor HTTP workers save uploads to
+MONITOR_PATHS = ("signature_dir", "policy_dir", "events_dir", "exports_dir")
+
+
+def bound_operation(path: tuple, method: str):
+    """calls a method of a (nested) component of the target"""
+    def operation(target, *args, **kwargs):
+        for name in path:
+            target = getattr(target, name)
+        return getattr(target, method)(*args, **kwargs)
+    operation.__name__ = method
+    return operation
+
+
+def allow_list(components: dict) -> dict:
+    """the operations of the given methods, e.g. {"admission": ("admit",)}
+    allows "admission.admit", "" names the target itself
+
+    Returns:
+        dict: operation name -> function of the target and the arguments
+    """
+    operations = dict()
+    for component, methods in components.items():
+        path = tuple(component.split(".")) if component else ()
+        for method in methods:
+            operations[".".join(path + (method,))] = bound_operation(path, method)
+    return operations
+
+
+# everything HTTP workers may do with a monitor
+MONITOR_OPERATIONS = allow_list(
+    {
+        "": (
+            "readiness", "get_status", "get_config", "write_config", "make_dirs",
+            "get_policy", "set_policy", "change_policy", "get_signature", "set_signature",
+            "get_schema_config", "set_schema_config", "enforce_retention", "launch",
+            "stop_monpoly", "release_reordered", "get_monpoly_usage", "get_events",
+            "export_columnar", "query_verdicts", "get_most_recent", "delete_everything",
+            "ingest_config", "ingest", "write_server_log", "discard_partial_timepoints",
+        ),
+        "retention": ("get_config", "configure"),
+        "reorder": ("get_config", "get_stats", "configure"),
+        "supervisor": ("get_config", "get_stats", "configure"),
+        "hot_window": ("get_config", "get_stats"),
+        "admission": ("admit", "charge", "release", "get_config", "get_stats"),
+        "db": (
+            "get_config", "get_user", "get_password", "get_host", "get_pgsql_port",
+            "get_influxdb_port", "get_database", "set_user", "set_password", "set_host",
+            "set_pgsql_port", "set_influxdb_port", "set_database",
+        ),
+    }
+)
+MONITOR_OPERATIONS["get_paths"] = lambda monitor: {name: getattr(monitor, name) for name in MONITOR_PATHS}
+# everything HTTP workers may do with the engine itself
+ENGINE_OPERATIONS = allow_list(
+    {
+        "tenants": ("get_stats", "evict"),
+        "tracer": ("get_config", "get_stats", "configure"),
+        "profiling": ("get_stats",),
+        "profiling.sampler": ("start", "stop", "folded"),
+        "profiling.allocations": ("start", "stop", "snapshot", "diff"),
+    }
+)
+# operations without side effects, the only ones EngineClient resends after
+# the connection broke while sending, the engine may have executed them already
+READ_ONLY_OPERATIONS = frozenset(
+    name
+    for name in list(MONITOR_OPERATIONS) + list(ENGINE_OPERATIONS)
+    if name.rsplit(".", 1)[-1].startswith("get_") or name.rsplit(".", 1)[-1] in ("readiness", "query_verdicts")
+)
+
+
+class FrameAuthenticationError(ConnectionError):
+    """a frame wasn't signed with the engine's key"""
+
+
+def key_path(socket_path: str) -> str:
+    """the file holding the key of the engine listening on the socket"""
+    return socket_path + ".key"
+
+
+def create_key(socket_path: str) -> bytes:
+    """writes a new key for the engine, only readable by its user"""
+    key = os.urandom(KEY_SIZE)
+    path = key_path(socket_path)
+    if os.path.exists(path):
+        os.remove(path)
+    umask = os.umask(SOCKET_UMASK)
+    try:
+        with open(path, "wb") as key_file:
+            key_file.write(key)
+    finally:
+        os.umask(umask)
+    return key
+
+
+def read_key(socket_path: str) -> bytes:
+    with open(key_path(socket_path), "rb") as key_file:
+        return key_file.read()
+
+
+def recv_exact(sock, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError("connection closed by peer")
+        received += n
+    return bytes(buf)
+
+
+def send_frame(sock, obj, key: bytes):
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    tag = hmac.new(key, payload, hashlib.sha256).digest()
+    sock.sendall(FRAME_HEADER.pack(TAG_SIZE + len(payload)) + tag + payload)
+
+
+def recv_frame(sock, key: bytes):
+    """
+    Raises:
+        FrameAuthenticationError: if the frame wasn't signed with the key, its
+            payload isn't unpickled
+    """
+    (size,) = FRAME_HEADER.unpack(recv_exact(sock, FRAME_HEADER.size))
+    if size < TAG_SIZE:
+        raise FrameAuthenticationError("frame without authentication tag")
+    frame = recv_exact(sock, size)
+    tag, payload = frame[:TAG_SIZE], frame[TAG_SIZE:]
+    if not hmac.compare_digest(tag, hmac.new(key, payload, hashlib.sha256).digest()):
+        raise FrameAuthenticationError("frame not signed with the engine's key")
+    return pickle.loads(payload)
+
+
+class MonitorEngine:
+    """owns the monitors (and their MonPoly processes) of the server
+
+    The engine either runs inside a single Flask process or as its own
+    process serving any number of stateless HTTP workers over a Unix domain
+    socket (see serve() and EngineClient). Frames are pickled and signed
+    with a key the engine writes next to the socket on every start (see
+    create_key()), frames with another signature are dropped before they
+    are unpickled. The socket and the key are only accessible to the user
+    running the engine.
+
+    Requests are (tenant, operation, args, kwargs) tuples, `operation` is
+    one of MONITOR_OPERATIONS, e.g. "admission.get_stats", for tenant "",
+    the default monitor, and other tenants, or one of ENGINE_OPERATIONS for
+    tenant None, the engine itself. Responses are (kind, value) tuples with
+    kind value or error.
+    """
+
+    def __init__(self):
+        self.default_monitor = Monitor()
+        self.tenants = TenantRegistry()
+        # profilers of the engine process, see app.py
+        self.profiling = Profiling()
+        self.tracer = tracer
+        self.running = True
+
+    def monitor(self, tenant):
+        if tenant is None:
+            return self
+        if tenant == "":
+            return self.default_monitor
+        return self.tenants.get(tenant)
+
+    def maintain(self):
+        """restarts crashed MonPoly processes, releases time points held by the
+        reorder buffers even if no producer sends new ones, drops partitions
+        once the retention interval has passed, trims the watermark table and
+        evicts idle tenants, one thread for all monitors
+
+        A step that raises, e.g. because QuestDB can't be reached, is logged
+        and counted in the supervisor's stats and retried on the next tick,
+        the other monitors aren't affected.
+        """
+        while self.running:
+            sleep(1)
+            for monitor in [self.default_monitor] + self.tenants.monitors():
+                self.maintenance_step(monitor, monitor.supervise)
+                if monitor.unflushed:
+                    self.maintenance_step(monitor, monitor.retry_flush)
+                if monitor.reorder.enabled and monitor.reorder.heap:
+                    self.maintenance_step(monitor, monitor.release_reordered)
+                # not on the ingestion path, dropping partitions can take a while
+                if monitor.retention.due():
+                    self.maintenance_step(monitor, monitor.enforce_retention)
+                # one row per flush, retention may be disabled
+                if monitor.watermark.trim_due():
+                    self.maintenance_step(monitor, monitor.trim_watermark)
+            try:
+                self.tenants.evict_idle()
+            except Exception as error:
+                self.default_monitor.write_server_log(
+                    f"[MonitorEngine.maintain()] evicting idle tenants failed: {type(error).__name__}: {error}"
+                )
+
+    @staticmethod
+    def maintenance_step(monitor, step):
+        """runs a step of the maintenance thread, errors are logged and
+        counted instead of ending the thread"""
+        try:
+            result = step()
+        except Exception as error:
+            message = f"{step.__name__}: {type(error).__name__}: {error}"
+        else:
+            if not (isinstance(result, dict) and "error" in result):
+                return
+            message = f"{step.__name__}: {result['error']}"
+        monitor.supervisor.maintenance_failed(message)
+        monitor.write_server_log(f"[MonitorEngine.maintain()] {message}")
+
+    def start(self):
+        """restarts the default monitor in the background and starts the
+        maintenance thread"""
+        self.default_monitor.launch_in_background()
+        threading.Thread(target=self.maintain, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+        self.tenants.stop_all()
+        self.default_monitor.stop_monpoly()
+        self.default_monitor.write_server_log("[MonitorEngine.stop()] done")
+
+    def handle(self, request) -> tuple:
+        """executes a request, see the class docstring"""
+        try:
+            tenant, name, args, kwargs = request
+            operations = ENGINE_OPERATIONS if tenant is None else MONITOR_OPERATIONS
+            operation = operations.get(name)
+            if operation is None:
+                raise ValueError(f"unknown operation {name}")
+            target = self.monitor(tenant)
+            try:
+                return ("value", operation(target, *args, **kwargs))
+            finally:
+                # the tenant can be evicted again once the operation is done
+                if tenant:
+                    self.tenants.release(tenant)
+        except Exception as error:
+            return ("error", error)
+
+    def serve(self, socket_path: str = ENGINE_SOCKET):
+        """launches the default monitor and serves requests until interrupted"""
+        engine = self
+        key = create_key(socket_path)
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                while True:
+                    try:
+                        request = recv_frame(self.request, key)
+                    except FrameAuthenticationError as error:
+                        engine.default_monitor.write_server_log(f"[MonitorEngine.serve()] closing connection: {error}")
+                        return
+                    except ConnectionError:
+                        return
+                    response = engine.handle(request)
+                    try:
+                        send_frame(self.request, response, key)
+                    except (pickle.PicklingError, TypeError, AttributeError) as error:
+                        send_frame(self.request, ("error", TypeError(f"result can't be sent: {error}")), key)
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        # the socket is created without access for others, instead of being
+        # accessible until a chmod after bind()
+        umask = os.umask(SOCKET_UMASK)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(socket_path, Handler)
+        finally:
+            os.umask(umask)
+        server.daemon_threads = True
+        self.start()
+        self.default_monitor.write_server_log(f"[MonitorEngine.serve()] listening on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.remove(socket_path)
+            os.remove(key_path(socket_path))
+            self.stop()
+
+
+class EngineClient:
+    """connection of an HTTP worker to the engine, one socket per thread"""
+
+    def __init__(self, socket_path: str = ENGINE_SOCKET):
+        self.socket_path = socket_path
+        self.local = threading.local()
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.socket_path)
+        # a restarted engine has a new key
+        self.local.key = read_key(self.socket_path)
+        self.local.sock = sock
+        return sock
+
+    def close(self):
+        sock = getattr(self.local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self.local.sock = None
+
+    def request(self, tenant, operation: str, *args, **kwargs):
+        """executes an operation in the engine and returns its result
+
+        Raises:
+            ConnectionError: if the engine can't be reached
+            Exception: the exception raised by the engine
+        """
+        message = (tenant, operation, args, kwargs)
+        sock = getattr(self.local, "sock", None)
+        try:
+            if sock is None:
+                sock = self.connect()
+            try:
+                send_frame(sock, message, self.local.key)
+            except OSError:
+                # the engine may have been restarted since the last request,
+                # but part of the request may have been received and executed,
+                # only requests without side effects are resent
+                self.close()
+                if operation not in READ_ONLY_OPERATIONS:
+                    raise
+                sock = self.connect()
+                send_frame(sock, message, self.local.key)
+            kind, value = recv_frame(sock, self.local.key)
+        except OSError as error:
+            self.close()
+            raise ConnectionError(f"monitor engine at {self.socket_path} unreachable: {error}") from error
+        if kind == "error":
+            raise value
+        return value
+
+
+class RemoteComponent:
+    """stands in for a monitor, or a component of it, in the engine, only the
+    methods of the allow-list are available and a call takes one request"""
+
+    def __init__(self, client: EngineClient, tenant, prefix: str = "", operations=None):
+        object.__setattr__(self, "client", client)
+        object.__setattr__(self, "tenant", tenant)
+        object.__setattr__(self, "prefix", prefix)
+        object.__setattr__(
+            self, "operations", MONITOR_OPERATIONS if operations is None else operations
+        )
+
+    def __getattr__(self, name):
+        operation = self.prefix + name
+        if operation in self.operations:
+            value = functools.partial(self.client.request, self.tenant, operation)
+        elif any(o.startswith(operation + ".") for o in self.operations):
+            value = RemoteComponent(self.client, self.tenant, operation + ".", self.operations)
+        else:
+            raise AttributeError(f"{name} isn't available in the engine")
+        object.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{name} can't be set in the engine, use configure()")
+
+
+class RemoteMonitor(RemoteComponent):
+    """a monitor in the engine, seen from an HTTP worker
+
+    Events are parsed, validated and encoded in the worker, with a validator
+    and encoder compiled from the signature of the engine's monitor, only
+    the encoded time points are sent to the engine.
+    """
+
+    # the parts of the ingestion path that don't depend on MonPoly
+    prepare_timepoints = Monitor.prepare_timepoints
+    prepare_binary_timepoints = Monitor.prepare_binary_timepoints
+    create_log_strings = Monitor.create_log_strings
+    get_timestamp = Monitor.get_timestamp
+
+    def __init__(self, client: EngineClient, tenant: str):
+        super().__init__(client, tenant)
+        object.__setattr__(self, "generation", None)
+        object.__setattr__(self, "signature", None)
+        object.__setattr__(self, "table_prefix", None)
+        object.__setattr__(self, "validator", None)
+        object.__setattr__(self, "encoder", None)
+
+    def __getattr__(self, name):
+        if name in MONITOR_PATHS:
+            # the directories of a monitor never change
+            for path, value in self.client.request(self.tenant, "get_paths").items():
+                object.__setattr__(self, path, value)
+            return object.__getattribute__(self, name)
+        return super().__getattr__(name)
+
+    def refresh(self):
+        """recompiles the validator and encoder if the signature or the schema
+        configuration changed"""
+        config = self.client.request(self.tenant, "ingest_config", self.generation)
+        if config is None:
+            return
+        signature = None
+        if config["signature"] is not None:
+            signature = Signature.from_text(config["signature"])
+        layouts = row_layouts(signature, Schema(config["schema"]).symbol_columns(signature))
+        object.__setattr__(self, "signature", signature)
+        object.__setattr__(self, "table_prefix", config["table_prefix"])
+        object.__setattr__(self, "validator", Validator(signature))
+        object.__setattr__(self, "encoder", Encoder(signature, layouts, config["table_prefix"]))
+        object.__setattr__(self, "generation", config["generation"])
+
+    def get_validator(self):
+        self.refresh()
+        return self.validator
+
+    def get_encoder(self):
+        return self.encoder
+
+    def export_events(self, *args, **kwargs):
+        """creates the exporter in the worker, which streams the export from
+        QuestDB itself, see Monitor.export_events()"""
+        self.refresh()
+        self.discard_partial_timepoints()
+        source = SimpleNamespace(
+            db=DbHelper(self.db.get_config()),
+            timepoints_table=self.table_prefix + TIMEPOINTS_TABLE,
+            table_prefix=self.table_prefix,
+            get_parsed_signature=lambda: self.signature,
+            discard_partial_timepoints=lambda: None,
+        )
+        return Monitor.export_events(source, *args, **kwargs)
+
+    def ingest(self, ticket, timepoints: list, source=None, timeout=None):
+        return self.client.request(
+            self.tenant, "ingest", ticket, timepoints, source, self.generation, timeout, tracer.context()
+        )
+
+
+class RemoteTenants:
+    """the tenant registry of the engine, seen from an HTTP worker"""
+
+    def __init__(self, client: EngineClient):
+        self.client = client
+        self.monitors = dict()
+
+    def get(self, tenant: str) -> RemoteMonitor:
+        """
+        Raises:
+            ValueError: if the tenant name is invalid
+        """
+        if not TENANT_NAME.fullmatch(tenant):
+            raise ValueError(f"invalid tenant name {tenant}, use letters, digits and _")
+        if tenant not in self.monitors:
+            self.monitors[tenant] = RemoteMonitor(self.client, tenant)
+        return self.monitors[tenant]
+
+    def release(self, tenant: str):
+        """the engine counts the uses of a tenant per operation, see MonitorEngine.handle()"""
+
+    def get_stats(self) -> dict:
+        return self.client.request(None, "tenants.get_stats")
+
+    def evict(self, tenant: str) -> dict:
+        return self.client.request(None, "tenants.evict", tenant)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="runs the monitors of the server for any number of HTTP workers"
+    )
+    arg_parser.add_argument("--socket", default=ENGINE_SOCKET, help="path of the Unix domain socket")
+    args = arg_parser.parse_args()
+    MonitorEngine().serve(args.socket)
+
+
+if __name__ == "__main__":
+    main()
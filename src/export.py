@@ -0,0 +1,293 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from encoder import format_value
+
+# number of time points fetched from the database per batch
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "monpoly": "text/plain",
+}
+LOG_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def encode_token(state: dict) -> str:
+    """encodes the position of an export as an opaque continuation token"""
+    return base64.urlsafe_b64encode(json.dumps(state).encode("utf-8")).decode("ascii")
+
+
+def decode_token(token: str) -> dict:
+    """decodes a continuation token created by encode_token()
+
+    Raises:
+        ValueError: if the token is malformed
+    """
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, UnicodeError) as error:
+        raise ValueError(f"invalid continuation token: {token}") from error
+
+
+def token_int(state: dict, key: str, default=None, minimum=None):
+    """an integer field of a continuation token, the fields of a token are
+    pasted into SQL queries so they are never used unchecked
+
+    Raises:
+        ValueError: if the field isn't an integer or is below the minimum
+    """
+    value = state.get(key, default)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"invalid continuation token: {key} must be an integer")
+    try:
+        value = int(value)
+    except ValueError as error:
+        raise ValueError(f"invalid continuation token: {key} must be an integer") from error
+    if minimum is not None and value < minimum:
+        raise ValueError(f"invalid continuation token: {key} must be at least {minimum}")
+    return value
+
+
+def token_timestamp(state: dict, key: str):
+    """a time stamp field of a continuation token, in the format str() gives
+    the datetimes QuestDB returns
+
+    Raises:
+        ValueError: if the field isn't an ISO 8601 time stamp
+    """
+    value = state.get(key)
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"invalid continuation token: {key} must be a time stamp")
+    try:
+        return str(datetime.fromisoformat(value))
+    except ValueError as error:
+        raise ValueError(f"invalid continuation token: {key} must be a time stamp") from error
+
+
+def token_strings(state: dict, key: str):
+    """a list of strings field of a continuation token
+
+    Raises:
+        ValueError: if the field isn't a list of strings
+    """
+    value = state.get(key)
+    if value is None:
+        return None
+    if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+        raise ValueError(f"invalid continuation token: {key} must be a list of strings")
+    return value
+
+
+class EventExporter:
+    """streams the time points in the database batch by batch
+
+    QuestDB doesn't support server side cursors (DECLARE CURSOR), instead the
+    time points table is paginated on (time_stamp, time_point), so each batch
+    only reads the partitions it needs and memory stays bounded by the batch size.
+    """
+
+    def __init__(
+        self,
+        db,
+        timepoints_table: str,
+        signature,
+        table_prefix: str = "",
+        start_date=None,
+        end_date=None,
+        predicates=None,
+        after: int = -1,
+        after_timestamp=None,
+        limit=None,
+        batch_size: int = EXPORT_BATCH_SIZE,
+    ):
+        self.db = db
+        self.timepoints_table = timepoints_table
+        self.signature = signature
+        self.table_prefix = table_prefix
+        self.start_date = str(start_date) if start_date is not None else None
+        self.end_date = str(end_date) if end_date is not None else None
+        self.filtered = predicates is not None
+        self.predicates = [
+            p for p in signature if predicates is None or p.name in predicates
+        ]
+        self.after = after
+        self.after_timestamp = after_timestamp
+        self.limit = limit
+        self.batch_size = batch_size
+        self.exported = 0
+        # the first exported time point, e.g. to number a replay
+        self.first_timepoint = None
+
+    @classmethod
+    def from_token(cls, db, timepoints_table: str, signature, token: str, table_prefix: str = ""):
+        """
+        Raises:
+            ValueError: if the token is malformed or one of its fields has the
+                wrong type
+        """
+        state = decode_token(token)
+        if not isinstance(state, dict):
+            raise ValueError(f"invalid continuation token: {token}")
+        return cls(
+            db,
+            timepoints_table,
+            signature,
+            table_prefix=table_prefix,
+            start_date=token_timestamp(state, "start"),
+            end_date=token_timestamp(state, "end"),
+            predicates=token_strings(state, "predicates"),
+            after=token_int(state, "after", -1),
+            after_timestamp=token_timestamp(state, "after_timestamp"),
+            limit=token_int(state, "limit", minimum=1),
+        )
+
+    def continuation_token(self) -> str:
+        return encode_token(
+            {
+                "start": self.start_date,
+                "end": self.end_date,
+                "predicates": [p.name for p in self.predicates] if self.filtered else None,
+                "after": self.after,
+                "after_timestamp": self.after_timestamp,
+                "limit": self.limit,
+            }
+        )
+
+    def timepoints_query(self, batch_size: int) -> str:
+        conditions = [f"time_point > {self.after}"]
+        if self.after_timestamp is not None:
+            conditions.append(f"time_stamp >= '{self.after_timestamp}'")
+        if self.start_date is not None:
+            conditions.append(f"time_stamp >= '{self.start_date}'")
+        if self.end_date is not None:
+            conditions.append(f"time_stamp <= '{self.end_date}'")
+        return (
+            f"SELECT time_point, time_stamp FROM {self.timepoints_table} "
+            f"WHERE {' AND '.join(conditions)} ORDER BY time_stamp, time_point LIMIT {batch_size};"
+        )
+
+    def batches(self):
+        """generates lists of time points in the same format as Monitor.get_events()
+
+        Database errors are propagated, the export can then be resumed from
+        the last complete batch with continuation_token()
+        """
+        with self.db.connection() as connection:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            while self.limit is None or self.exported < self.limit:
+                batch_size = self.batch_size
+                if self.limit is not None:
+                    batch_size = min(batch_size, self.limit - self.exported)
+                cursor.execute(self.timepoints_query(batch_size))
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                batch = self.fetch_batch(cursor, rows)
+                if self.first_timepoint is None:
+                    self.first_timepoint = rows[0][0]
+                self.after = rows[-1][0]
+                self.after_timestamp = str(rows[-1][1])
+                self.exported += len(rows)
+                yield batch
+                if len(rows) < batch_size:
+                    break
+            cursor.close()
+
+    def fetch_batch(self, cursor, rows: list) -> list:
+        """fetches the occurrences of all predicates for the given time points"""
+        first_tp, first_ts = rows[0]
+        last_tp, last_ts = rows[-1]
+        timepoints = {}
+        for tp, ts in rows:
+            timepoints[tp] = {
+                "timestamp-int": int(ts.timestamp()),
+                "timestamp": ts.strftime(LOG_TIMESTAMP_FORMAT),
+                "timepoint": tp,
+                "predicates": [],
+            }
+        for predicate in self.predicates:
+            columns = ", ".join(predicate.columns + ("time_point",))
+            cursor.execute(
+                f"SELECT {columns} FROM {self.table_prefix}{predicate.name} "
+                f"WHERE time_stamp BETWEEN '{first_ts}' AND '{last_ts}' "
+                f"AND time_point BETWEEN {first_tp} AND {last_tp};"
+            )
+            occurrences = {}
+            for row in cursor.fetchall():
+                occurrences.setdefault(row[-1], []).append(list(row[:-1]))
+            for tp, occ in occurrences.items():
+                if tp in timepoints:
+                    timepoints[tp]["predicates"].append(
+                        {"name": predicate.name, "occurrences": occ}
+                    )
+        result = list(timepoints.values())
+        if self.filtered:
+            result = [t for t in result if t["predicates"]]
+        return result
+
+    def more(self) -> bool:
+        """returns true if the export stopped because the limit was reached"""
+        return self.limit is not None and self.exported >= self.limit
+
+    def stream(self, export_format: str):
+        """generates chunks of the export in the given format, one chunk per batch
+
+        Args:
+            export_format (str): one of EXPORT_FORMATS
+        """
+        if export_format == "csv":
+            yield self.csv_header()
+        encode = {
+            "ndjson": self.ndjson_chunk,
+            "csv": self.csv_chunk,
+            "monpoly": self.monpoly_chunk,
+        }[export_format]
+        for batch in self.batches():
+            yield encode(batch)
+        if self.more():
+            token = self.continuation_token()
+            if export_format == "ndjson":
+                yield json.dumps({"continuation": token}) + "\n"
+            else:
+                yield f"# continuation: {token}\n"
+
+    def ndjson_chunk(self, batch: list) -> str:
+        return "".join(json.dumps(t) + "\n" for t in batch)
+
+    def csv_header(self) -> str:
+        arity = max((p.arity for p in self.predicates), default=0)
+        header = ["time_point", "time_stamp", "predicate"] + [
+            f"x{i+1}" for i in range(arity)
+        ]
+        return ",".join(header) + "\n"
+
+    def csv_chunk(self, batch: list) -> str:
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        for t in batch:
+            prefix = [t["timepoint"], t["timestamp"]]
+            if not t["predicates"]:
+                writer.writerow(prefix + [""])
+            for p in t["predicates"]:
+                for occ in p["occurrences"]:
+                    writer.writerow(prefix + [p["name"]] + occ)
+        return out.getvalue()
+
+    def monpoly_chunk(self, batch: list) -> str:
+        lines = []
+        for t in batch:
+            occurrences = [
+                f"{p['name']} ({', '.join(format_value(x) for x in occ)})"
+                for p in t["predicates"]
+                for occ in p["occurrences"]
+            ]
+            lines.append(f"@{t['timestamp-int']} {' '.join(occurrences)};\n")
+        return "".join(lines)
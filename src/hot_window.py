@@ -0,0 +1,108 @@
+from collections import deque
+
+# default number of seconds of recent time points kept in memory
+HOT_WINDOW_SECONDS = 600
+# default upper bound of the memory used by the encoded time points
+HOT_WINDOW_BYTES = 64 * 1024 * 1024
+
+
+class HotWindow:
+    """bounded in-memory ring buffer of the most recent time points that were
+    accepted by MonPoly, stored as their encoded MonPoly input
+
+    The window is complete for all time stamps greater than `boundary`: every
+    time point with a smaller or equal time stamp may have been evicted or may
+    have been logged before the server started.
+    """
+
+    def __init__(self, config=None):
+        self.seconds = HOT_WINDOW_SECONDS
+        self.max_bytes = HOT_WINDOW_BYTES
+        if config:
+            if "seconds" in config.keys():
+                self.seconds = int(config["seconds"])
+            if "max_bytes" in config.keys():
+                self.max_bytes = int(config["max_bytes"])
+        # (time point, time stamp in seconds, encoded time point)
+        self.entries = deque()
+        self.size = 0
+        self.boundary = None
+
+    def get_config(self) -> dict:
+        return {"seconds": self.seconds, "max_bytes": self.max_bytes}
+
+    def reset(self, boundary=None):
+        """empties the window
+
+        Args:
+            boundary (_type_, optional): time stamp (in seconds) of the most
+                recent time point that is not in the window, None if there
+                is no history at all. Defaults to None.
+        """
+        self.entries.clear()
+        self.size = 0
+        self.boundary = boundary
+
+    def append(self, time_point: int, timestamp: int, monpoly_string: str):
+        """adds a time point that has been accepted by MonPoly and evicts the
+        oldest time points that no longer fit into the window
+        """
+        encoded = monpoly_string.encode("utf-8")
+        self.entries.append((time_point, timestamp, encoded))
+        self.size += len(encoded)
+        while self.entries and (
+            self.size > self.max_bytes or self.entries[0][1] < timestamp - self.seconds
+        ):
+            _, evicted_timestamp, evicted = self.entries.popleft()
+            self.size -= len(evicted)
+            self.boundary = evicted_timestamp
+
+    def covers(self, lookback) -> bool:
+        """returns true if all time points within the given look-back of the
+        most recent time point are in the window
+
+        Args:
+            lookback (_type_): look-back in seconds, None if unbounded
+        """
+        if not self.entries:
+            return False
+        if self.boundary is None:
+            return True
+        if lookback is None:
+            return False
+        return self.boundary < self.entries[-1][1] - lookback
+
+    def since(self, lookback: int) -> tuple:
+        """the encoded time points within the given look-back of the most
+        recent time point, in order
+
+        Returns:
+            tuple: the first of their time points (None if there are none)
+                and the encoded time points
+        """
+        cutoff = self.entries[-1][1] - lookback if lookback is not None else None
+        entries = [
+            (tp, encoded) for tp, timestamp, encoded in self.entries
+            if cutoff is None or timestamp >= cutoff
+        ]
+        first = entries[0][0] if entries else None
+        return first, [encoded for _, encoded in entries]
+
+    def after(self, time_point: int):
+        """the encoded time points after the given time point, in order
+
+        Returns:
+            _type_: list or None if some of them are no longer in the window
+        """
+        if not self.entries or self.entries[0][0] > time_point + 1:
+            return None
+        return [encoded for tp, _, encoded in self.entries if tp > time_point]
+
+    def get_stats(self) -> dict:
+        return {
+            "time points": len(self.entries),
+            "bytes": self.size,
+            "oldest": self.entries[0][0] if self.entries else None,
+            "newest": self.entries[-1][0] if self.entries else None,
+            "complete after": self.boundary,
+        }
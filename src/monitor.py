@@ -1,41 +1,146 @@
+import functools
 import json
 import os
 import subprocess
+import threading
 from datetime import datetime
+from time import monotonic, perf_counter, time
 from dateutil import parser
 from dateutil.parser import ParserError
-import psycopg2
-from questdb.ingress import Buffer, Sender
+from admission import AdmissionController
+from binary_events import decode_timepoints, unpack
+from columnar_events import ColumnarDecoder
 from db_helper import DbHelper
-
-# if this path is absolute all subsequent paths are relative to this path
-# will be absolute paths
+from encoder import Encoder
+from export import EventExporter
+from hot_window import HotWindow
+from monpoly_io import LOG_DONE, SEPARATOR, MonpolyExited, MonpolyPipe, MonpolyTimeout
+from profiling import process_usage
+from records import Timepoint, row_layouts
+from reorder import ReorderBuffer
+from retention import RetentionManager, partition_start, relative_intervals_lookback
+from schema import Schema
+from signature import Signature
+from status import StatusSnapshot
+from supervisor import Supervisor
+from tracing import tracer
+from validation import Validator
+from verdicts import VERDICTS_TABLE, VerdictParser, VerdictQuery, free_variables, policy_id, verdict_table_ddl
+from watermark import CommitWatermark, VISIBILITY_TIMEOUT, WATERMARK_PARTITION_BY, WATERMARK_TABLE, watermark_table_ddl
+
+# psycopg2, questdb.ingress and pyarrow are imported where they are needed,
+# importing this module has to be fast for quick restarts
+
+# all paths are absolute, relative to the root of the repository
 abspath = os.path.abspath(os.path.join(__file__, ".."))
 dname = os.path.dirname(abspath)
-os.chdir(dname)
-CONFIG_DIR = os.path.abspath("./monitor-data/")
+CONFIG_DIR = os.path.join(dname, "monitor-data")
 LOG_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
 
 MONPOLY = 'monpoly' # './monpoly'
 LOGGING = False # True
 # LOGGING = True # True
 TIMEPOINTS_TABLE = "time_points_unique_not_reserved_name"
+# seconds MonPoly may take to load its saved state
+STATE_LOAD_TIMEOUT = 600
+# seconds MonPoly may take to read a log file on a restart or policy change
+REPLAY_TIMEOUT = 3600
+# seconds MonPoly may take to save its state and exit
+SAVE_TIMEOUT = 600
+# startup states in which the monitor accepts requests, see readiness()
+READY_STATES = ("ready", "not running")
+# startup states in which events are accepted, they wait for the recovery
+ACCEPTING_STATES = READY_STATES + ("recovering",)
+
+
+def synchronized(method):
+    """serializes calls of the decorated method on the monitor's lock, flask
+    handles requests in multiple threads but there is only one MonPoly process"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def changes_status(method):
+    """the decorated method changes the policy, signature, monitorability
+    or tables, the cached status (see status.py) is read again afterwards.
+    Placed below @synchronized, so that the status is invalidated under the lock"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.status.changed()
+    return wrapper
 
 
 class Monitor:
     """Wrapper class for MonPoly """
-    def __init__(self):
+    def __init__(self, config_dir: str = CONFIG_DIR, table_prefix: str = ""):
+        """
+        Args:
+            config_dir (str, optional): directory of all files of this monitor.
+                Defaults to CONFIG_DIR.
+            table_prefix (str, optional): prefix of all tables of this monitor,
+                used to keep the tables of multiple monitors apart. Defaults to "".
+        """
+        self.config_dir = config_dir
+        self.table_prefix = table_prefix
+        self.timepoints_table = table_prefix + TIMEPOINTS_TABLE
+        self.verdicts_table = table_prefix + VERDICTS_TABLE
+        self.watermark_table = table_prefix + WATERMARK_TABLE
+        # guards MonPoly and the monitor state, see synchronized()
+        self.lock = threading.RLock()
         # should the policy be negated?
         self.policy_negate = False
         # database helper object
         self.db = DbHelper()
+        # generation of the QuestDB schema from the signature
+        self.schema = Schema()
+        # parsed signature, loaded lazily by get_parsed_signature()
+        self.signature = None
+        # mapping of predicate attributes to table columns, see get_row_layouts()
+        self.row_layouts = None
+        # single pass encoder into MonPoly log strings and ILP rows, see get_encoder()
+        self.encoder = None
+        # validation of events against the signature, see get_validator()
+        self.validator = None
+        # incremented whenever the signature (and with it the schema
+        # configuration in effect) changes, kept in the config file so that HTTP workers notice
+        # changes across restarts of the engine, see ingest_config()
+        self.generation = 0
+        # dropping of history that no supported policy can reach
+        self.retention = RetentionManager()
+        # most recent encoded time points, used to replay policy changes from memory
+        self.hot_window = HotWindow()
+        # time points flushed to and visible in QuestDB
+        self.watermark = CommitWatermark()
+        # ILP buffers of time points MonPoly read whose flush failed, oldest first
+        self.unflushed = []
+        # state shown by /status and the index page
+        self.status = StatusSnapshot()
+        # bounds on the events waiting to be logged
+        self.admission = AdmissionController()
+        # ordering of time points sent by multiple producers
+        self.reorder = ReorderBuffer()
+        # crash and hang detection of MonPoly, see supervise()
+        self.supervisor = Supervisor()
+        # parsing of MonPoly's output into verdicts, see get_verdict_parser()
+        self.verdict_parser = None
+        self.verdict_table_ready = False
+        self.watermark_table_ready = False
+        # id of the next verdict written to the verdict table
+        self.verdict_count = 0
         # directory paths
-        self.signature_dir = os.path.join(CONFIG_DIR, "signature")
-        self.policy_dir = os.path.join(CONFIG_DIR, "policies")
-        self.sql_dir = os.path.join(CONFIG_DIR, "sql")
-        self.events_dir = os.path.join(CONFIG_DIR, "events")
-        self.monpoly_stdout_dir = os.path.join(CONFIG_DIR, "monpoly-stdout")
-        self.backend_data_dir = os.path.join(CONFIG_DIR, "backend-data")
+        self.signature_dir = os.path.join(config_dir, "signature")
+        self.policy_dir = os.path.join(config_dir, "policies")
+        self.sql_dir = os.path.join(config_dir, "sql")
+        self.events_dir = os.path.join(config_dir, "events")
+        self.monpoly_stdout_dir = os.path.join(config_dir, "monpoly-stdout")
+        self.backend_data_dir = os.path.join(config_dir, "backend-data")
+        self.exports_dir = os.path.join(config_dir, "exports")
         # create directories if they don't exist
         self.make_dirs(self.signature_dir)
         self.make_dirs(self.policy_dir)
@@ -43,6 +148,7 @@ class Monitor:
         self.make_dirs(self.monpoly_stdout_dir)
         self.make_dirs(self.events_dir)
         self.make_dirs(self.backend_data_dir)
+        self.make_dirs(self.exports_dir)
         self.conf_path = os.path.join(self.backend_data_dir, "conf.json")
         self.log_path = os.path.join(self.backend_data_dir, "backend.log")
         self.monitor_state_path = os.path.join(
@@ -62,17 +168,37 @@ class Monitor:
 
         self.most_recent_timestamp = None
         self.most_recent_timepoint = -1
+        # rows after this time point may have been written by a failed
+        # backfill and still have to be discarded, see discard_partial_timepoints()
+        self.discard_after = None
+        # most recent time point contained in MonPoly's saved state
+        self.state_timepoint = None
+        # server time point of MonPoly's time point 0: MonPoly numbers the
+        # time points it reads from 0 on, unless it continues a saved state
+        self.monpoly_offset = 0
         # second column isn't necessary for the functionality of the backend,
         # but questdb doesn't currently (2022-11-17) support tables with only
         # timestamp column:
         # https://github.com/questdb/questdb/issues/2691
-        # self.ts_query_create = "CREATE TABLE ts(time_point INT,time_stamp TIMESTAMP) timestamp(time_stamp) PARTITION BY DAY;"
-        self.ts_query_create = f"CREATE TABLE {TIMEPOINTS_TABLE}(time_point INT,time_stamp TIMESTAMP) timestamp(time_stamp);"
-        self.ts_query_drop = f"DROP TABLE IF EXISTS {TIMEPOINTS_TABLE};"
+        # the designated timestamp and partitioning are added by self.schema
+        self.ts_query_create = f"CREATE TABLE {self.timepoints_table}(time_point INT,time_stamp TIMESTAMP) timestamp(time_stamp);"
+        self.ts_query_drop = f"DROP TABLE IF EXISTS {self.timepoints_table};"
         self.monpoly = None
+        # non-blocking pipes of the running MonPoly, see monpoly_pipe()
+        self.pipe = None
+        # see launch_in_background()
+        self.startup = "not running"
+        # whether MonPoly replays the time points after its saved state, see launch()
+        self.replaying = False
+        self.restart_log_path = os.path.join(self.events_dir, "events_restart.log")
         self.restore_state()
+        self.hot_window.reset(self.most_recent_timestamp_int())
         self.write_config()
 
+    def table(self, predicate_name: str) -> str:
+        """the name of the table storing the given predicate"""
+        return self.table_prefix + predicate_name
+
     def write_server_log(self, msg: str):
         """writes the given message to the server log along with a timestamp"""
         if LOGGING:
@@ -80,6 +206,7 @@ class Monitor:
             with open(self.log_path, "a", encoding="utf-8") as log:
                 log.write(f"[{time_stamp}] {msg}\n")
 
+    @changes_status
     def check_monitorability(self, sig, pol, neg):
         """checks if the given policy is monitorable
 
@@ -156,6 +283,43 @@ class Monitor:
         else:
             return "no signature set"
 
+    def get_parsed_signature(self):
+        """get the current signature parsed into predicates and attribute types
+
+        Returns:
+            _type_: a Signature object or None if no signature is set
+        """
+        if self.signature is None and self.signature_set():
+            self.signature = Signature.from_file(self.signature_path)
+        return self.signature
+
+    def get_row_layouts(self) -> dict:
+        """the precomputed column layout of each predicate's table
+
+        Returns:
+            dict: predicate name -> RowLayout
+        """
+        if self.row_layouts is None:
+            signature = self.get_parsed_signature()
+            self.row_layouts = row_layouts(
+                signature, self.schema.symbol_columns(signature)
+            )
+        return self.row_layouts
+
+    def get_encoder(self) -> Encoder:
+        """the encoder compiled from the current signature"""
+        if self.encoder is None:
+            self.encoder = Encoder(
+                self.get_parsed_signature(), self.get_row_layouts(), self.table_prefix
+            )
+        return self.encoder
+
+    def get_validator(self) -> Validator:
+        """the validator compiled from the current signature"""
+        if self.validator is None:
+            self.validator = Validator(self.get_parsed_signature())
+        return self.validator
+
     def get_json_signature(self):
         """get the current signature as a json object
 
@@ -212,6 +376,17 @@ class Monitor:
             if self.most_recent_timestamp
             else None,
             "most_recent_timepoint": self.most_recent_timepoint,
+            "schema": self.schema.get_config(),
+            "retention": self.retention.get_config(),
+            "hot_window": self.hot_window.get_config(),
+            "admission": self.admission.get_config(),
+            "reorder": self.reorder.get_config(),
+            "supervisor": self.supervisor.get_config(),
+            "state_timepoint": self.state_timepoint,
+            "monpoly_offset": self.monpoly_offset,
+            "verdict_count": self.verdict_count,
+            "generation": self.generation,
+            "discard_after": self.discard_after,
         }
         return config
 
@@ -244,6 +419,31 @@ class Monitor:
                     self.most_recent_timestamp = parser.parse(ts)
                 self.most_recent_timepoint = conf["most_recent_timepoint"]
                 self.restore_db(conf)
+                if "schema" in conf.keys():
+                    self.schema = Schema(conf["schema"])
+                if "retention" in conf.keys():
+                    self.retention = RetentionManager(conf["retention"])
+                if "hot_window" in conf.keys():
+                    self.hot_window = HotWindow(conf["hot_window"])
+                if "admission" in conf.keys():
+                    self.admission = AdmissionController(conf["admission"])
+                if "reorder" in conf.keys():
+                    self.reorder = ReorderBuffer(conf["reorder"])
+                if "supervisor" in conf.keys():
+                    self.supervisor = Supervisor(conf["supervisor"])
+                if "state_timepoint" in conf.keys():
+                    self.state_timepoint = conf["state_timepoint"]
+                elif os.path.exists(self.monitor_state_path):
+                    # saved on the last clean stop, before the time point was recorded
+                    self.state_timepoint = self.most_recent_timepoint
+                if "monpoly_offset" in conf.keys():
+                    self.monpoly_offset = conf["monpoly_offset"]
+                if "verdict_count" in conf.keys():
+                    self.verdict_count = conf["verdict_count"]
+                if "generation" in conf.keys():
+                    self.generation = conf["generation"]
+                if "discard_after" in conf.keys():
+                    self.discard_after = conf["discard_after"]
                 self.write_server_log(f"[restore_state()] restored state with: {conf}")
         else:
             self.write_server_log(
@@ -259,6 +459,38 @@ class Monitor:
             conf_json.write(conf_string)
             self.write_server_log(f"wrote config: {conf_string}")
 
+    def get_schema_config(self) -> dict:
+        return {"schema": self.schema.get_config(), "partition by": self.schema.partition_by()}
+
+    @synchronized
+    def set_schema_config(self, changes: dict) -> dict:
+        """changes how tables are created from the signature, only while no
+        signature is set: the existing tables, the row layouts of the encoder
+        and the data of HTTP workers depend on it. The next set_signature()
+        creates the tables with it and starts a new generation.
+
+        Args:
+            changes (dict): settings of Schema.get_config() to change
+
+        Raises:
+            ValueError: if a setting is invalid or the tables already exist
+
+        Returns:
+            dict: the schema configuration
+        """
+        if self.signature_set():
+            raise ValueError(
+                "the schema configuration can't be changed while the tables of the signature exist, "
+                "set it before /set-signature or after /delete-everything"
+            )
+        schema = Schema(self.schema.get_config())
+        schema.configure(changes)
+        self.schema = schema
+        self.write_config()
+        return self.get_schema_config()
+
+    @synchronized
+    @changes_status
     def set_policy(self, policy, negate: bool = False):
         """sets the policy to the given policy
 
@@ -274,6 +506,7 @@ class Monitor:
             return { "error": "monpoly is already running and policy has been set. Use change_policy() to change the policy." }
         os.rename(policy, self.policy_path)
         self.policy_negate = negate
+        self.verdict_parser = None
         self.write_server_log(f"set policy: {self.get_policy()}")
         self.write_config()
         return {"message": f"policy set to {self.get_policy()}"}
@@ -348,39 +581,94 @@ class Monitor:
                 "ls pol_dir": os.listdir(self.policy_dir),
             }
 
-        check = self.check_monitorability(self.signature_path, new_policy_path, self.policy_negate)
+        with tracer.span("check monitorability"):
+            check = self.check_monitorability(self.signature_path, new_policy_path, self.policy_negate)
         if not check["monitorable"]:
             self.write_server_log(
                 "[change_policy()] cannot change policy, because policy is not monitorable"
             )
             return {"error": check["message"]}
-        # the events often take a while to propagate to the database and therefore a check is necessary if the most recent event is already in the database
-        if self.most_recent_timepoint > -1:
-            most_recent_timepoint_db = self.get_most_recent_timepoint_from_db()
-            if most_recent_timepoint_db < self.most_recent_timepoint:
-                return {
-                    "error": f"Retry again later. Most recent timepoint seen is not in database yet: {most_recent_timepoint_db} (database) < {self.most_recent_timepoint} (monitor)"
-                }
+        with tracer.span("relative intervals"):
+            relative_intervals = self.get_relative_intervals(new_policy_path)
+        lookback = relative_intervals_lookback(relative_intervals)
+        # replay from memory if the new policy doesn't look back further than the hot window
+        from_memory = not naive and self.hot_window.covers(lookback)
+        # the events often take a while to propagate to the database and
+        # therefore the policy change waits until the most recent event is
+        # visible, without holding the lock so that events are still logged
+        deadline = monotonic() + VISIBILITY_TIMEOUT
+        while True:
+            if not from_memory and self.most_recent_timepoint > -1:
+                with tracer.span("wait visible"):
+                    visible = self.watermark.wait_visible(
+                        self.most_recent_timepoint, self.probe_visible_timepoint, max(0.0, deadline - monotonic())
+                    )
+                if not visible:
+                    return {
+                        "error": f"Most recent timepoint seen is not in database after {VISIBILITY_TIMEOUT} seconds: {self.watermark.visible} (database) < {self.most_recent_timepoint} (monitor), flushed up to {self.watermark.flushed}"
+                    }
+            with self.lock:
+                # time points logged while waiting have to be visible as well,
+                # a single probe decides whether to wait again
+                if (
+                    from_memory
+                    or self.most_recent_timepoint == -1
+                    or self.watermark.wait_visible(self.most_recent_timepoint, self.probe_visible_timepoint, 0)
+                ):
+                    return self.replace_policy(new_policy_path, negate, naive, relative_intervals, from_memory)
+
+    @synchronized
+    @changes_status
+    def replace_policy(
+        self, new_policy_path: str, negate: bool, naive: bool, relative_intervals: tuple, from_memory: bool
+    ) -> dict:
+        """the part of change_policy() that runs under the lock once the
+        events to replay are available: replaces the policy file and restarts
+        MonPoly with the replayed time points
 
-        relative_intervals = self.get_relative_intervals(new_policy_path)
+        Args:
+            new_policy_path (str): path to the new policy
+            negate (bool): whether or not the new policy should be negated
+            naive (bool): whether the complete trace is replayed
+            relative_intervals (tuple): relative intervals of the new policy
+            from_memory (bool): whether the time points are replayed from the hot window
 
+        Returns:
+            dict: JSON style status message
+        """
+        lookback = relative_intervals_lookback(relative_intervals)
         old_policy = self.get_policy()
         os.rename(new_policy_path, self.policy_path)
         self.policy_negate = negate
+        self.verdict_parser = None
        # update negation in config
         self.write_config()
         self.write_server_log(
             f"[change_policy()] changed policy from {old_policy} to {self.get_policy()}"
         )
-        if naive:
-            timepoints = self.get_events()
-        else:
-            timepoints = self.get_events(relative_intervals=relative_intervals)
-        # print(naive)
-        # print(f"timepoints: {len(timepoints)}")
+        warning = self.retention_warning(relative_intervals, naive)
         timepoints_monpoly = os.path.join(self.events_dir, "events_policy_change.log")
-        self.create_log_strings(timepoints, output_file=timepoints_monpoly)
-        self.stop_monpoly(save_state=False)
+        if from_memory:
+            self.write_server_log(
+                f"[change_policy()] replaying the last {lookback} seconds from the hot window"
+            )
+            first_timepoint, timepoints = self.hot_window.since(lookback)
+            with open(timepoints_monpoly, "wb") as f:
+                f.writelines(timepoints)
+        else:
+            if naive:
+                timepoints = self.get_events()
+            else:
+                timepoints = self.get_events(relative_intervals=relative_intervals)
+            first_timepoint = timepoints[0]["timepoint"] if timepoints else None
+            timepoints = [Timepoint.from_dict(t, t["timestamp-int"]) for t in timepoints]
+            self.create_log_strings(timepoints, output_file=timepoints_monpoly)
+        with tracer.span("stop monpoly"):
+            self.stop_monpoly(save_state=False)
+        # the saved state belongs to the old policy
+        if os.path.exists(self.monitor_state_path):
+            os.remove(self.monitor_state_path)
+        self.state_timepoint = None
         if timepoints == []:
             self.write_server_log(
                 "[change_policy()] no timepoints found, starting monpoly without reading old timepoints"
@@ -392,17 +680,15 @@ class Monitor:
                 "[change_policy()] running monpoly and reading all past timepoints"
             )
             self.monpoly = self.start_monpoly(
-                self.signature_path, self.policy_path, log=timepoints_monpoly
+                self.signature_path, self.policy_path, log=timepoints_monpoly, first_timepoint=first_timepoint
             )
             self.write_server_log("[change_policy()] started monpoly")
             if self.monpoly.stdout is None:
                 return {"error": "monpoly stdout is None"}
-            output = ""
-            while "## Done with log file - waiting for stdin ##" not in output:
-                self.write_server_log(
-                    "[change_policy()] waiting for monpoly to finish"
-                )
-                output += self.monpoly.stdout.readline()
+            with tracer.span("replay"):
+                replayed = self.wait_for_replay()
+            if not replayed:
+                return {"error": "monpoly exited while reading the past time points"}
         self.clear_directory(self.events_dir)
         self.write_monpoly_log(
             f"--- policy changed from {old_policy} to {self.get_policy()} ---".replace(
@@ -410,8 +696,86 @@ class Monitor:
             )
         )
         self.write_monpoly_log("\n")
-        return {"success": f"changed policy from {old_policy} to {self.get_policy()}"}
+        response = {"success": f"changed policy from {old_policy} to {self.get_policy()}"}
+        if warning:
+            response["warning"] = warning
+        return response
+
+    def retention_warning(self, relative_intervals: tuple, naive: bool):
+        """checks whether a replay is incomplete, because history has been
+        dropped by the retention manager
+
+        Args:
+            relative_intervals (tuple): relative intervals of the new policy
+            naive (bool): whether the complete trace is replayed
 
+        Returns:
+            _type_: a warning message or None if the replay is complete
+        """
+        trimmed_before = self.retention.trimmed_before
+        if trimmed_before is None:
+            return None
+        if naive:
+            return f"history before {trimmed_before} has been dropped, the naive replay only covers the remaining history"
+        lookback = relative_intervals_lookback(relative_intervals)
+        trimmed_horizon = self.retention.trimmed_horizon
+        if lookback is None or trimmed_horizon is None or lookback > trimmed_horizon:
+            return f"history before {trimmed_before} has been dropped, but the new policy looks back {'unboundedly' if lookback is None else f'{lookback} seconds'}"
+        return None
+
+    @synchronized
+    def enforce_retention(self, force: bool = False) -> dict:
+        """drops all partitions that are older than the furthest look-back
+        of the monitored policy and the additionally configured policies
+
+        Args:
+            force (bool, optional): run even if the retention interval has not
+                passed yet. Defaults to False.
+
+        Returns:
+            dict: JSON style status message
+        """
+        if not force and not self.retention.due():
+            return {"retention": "not due"}
+        self.retention.last_run = time()
+        if self.most_recent_timestamp is None or not self.policy_set():
+            return {"retention": "nothing to drop"}
+        horizon = self.retention.horizon([self.policy_path], self.get_relative_intervals)
+        if horizon is None:
+            self.write_server_log("[enforce_retention()] unbounded look-back, keeping all history")
+            return {"retention": "a policy has an unbounded look-back, keeping all history"}
+        cutoff = self.retention.cutoff(self.most_recent_timestamp, horizon)
+        names = [self.table(n) for n in self.get_parsed_signature().names()]
+        # verdicts and flush records of dropped time points aren't kept either
+        names += [self.timepoints_table, self.verdicts_table, self.watermark_table]
+        # the other tables of a monitor are created with the same unit, see Schema
+        partition_by = self.schema.partition_by()
+        trimmed_before = partition_start(cutoff, partition_by)
+        if trimmed_before is None:
+            return {"retention": "the tables aren't partitioned, nothing can be dropped"}
+        tables = {table: partition_by for table in names}
+        tables[self.watermark_table] = WATERMARK_PARTITION_BY
+        self.ensure_verdict_table()
+        self.ensure_watermark_table()
+        errors = {}
+        for table, query in self.retention.drop_queries(tables, cutoff):
+            response = self.db.run_query(query)
+            if "error" in response.keys():
+                errors[table] = response["error"]
+        self.write_server_log(
+            f"[enforce_retention()] dropped partitions before {trimmed_before} (horizon {horizon}s): {errors}"
+        )
+        if errors:
+            # the coverage reported by retention_warning() only advances once
+            # every table has been trimmed, the next run tries again
+            return {"error": f"dropping partitions before {trimmed_before} failed: {errors}"}
+        self.retention.trimmed_before = trimmed_before.strftime(LOG_TIMESTAMP_FORMAT)
+        self.retention.trimmed_horizon = horizon
+        self.write_config()
+        return {"retention": f"dropped partitions before {trimmed_before}", "horizon": horizon}
+
+    @synchronized
+    @changes_status
     def set_signature(self, sig, db_exists=False):
         """sets the signature of the monitor, sets the database schema
 
@@ -433,6 +797,11 @@ class Monitor:
             else:
                 self.delete_database()
         os.rename(sig, self.signature_path)
+        self.signature = None
+        self.row_layouts = None
+        self.encoder = None
+        self.validator = None
+        self.generation += 1
         if not db_exists:
             create_response = self.init_database(self.signature_path)
             if 'error' in create_response.keys():
@@ -474,8 +843,12 @@ class Monitor:
         cmd = [MONPOLY, "-sql_drop", sig]
         # TODO possibly set check to True and report errors to the user
         process = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        query_drop = process.stdout
+        query_drop = self.schema.rewrite_drop(
+            process.stdout, self.get_parsed_signature(), self.table_prefix
+        )
         query_drop += self.ts_query_drop
+        query_drop += f"DROP TABLE IF EXISTS {self.verdicts_table};"
+        query_drop += f"DROP TABLE IF EXISTS {self.watermark_table};"
         self.write_server_log(
             f"[get_destruct_query()] Generated drop query: {query_drop}"
         )
@@ -483,6 +856,7 @@ class Monitor:
             drop_file.write(query_drop)
         return {"drop query": query_drop, "drop file": self.sql_drop_path}
 
+    @changes_status
     def init_database(self, sig):
         """
         Creates a database from the given signature file
@@ -490,34 +864,30 @@ class Monitor:
         cmd = [MONPOLY, "-sql", sig]
         # TODO possibly set check to True and report errors to the user
         process = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        query_create = process.stdout + self.ts_query_create
+        query_create = self.schema.rewrite(
+            process.stdout + self.ts_query_create, self.get_parsed_signature(), self.table_prefix
+        )
         create_response = self.db.run_query(query_create)
         self.write_server_log(f'ran queries: {query_create}\n\t with response: {create_response}')
         if 'error' in create_response.keys():
             return create_response
+        self.ensure_watermark_table()
+        self.ensure_verdict_table()
         # self.write_server_log(f'ran queries: {query_create} & {self.ts_query_create}')
         return {"success": create_response['response']}
 
-    def start_monpoly(self, sig, pol, restart: str = "", log: str = ""):
-        """starts monpoly with the given signature and policy
+    def monpoly_command(self, sig, pol, restart: str = "", log: str = "", suppress_stdout: bool = True) -> list:
+        """the command line of MonPoly, see start_monpoly()
 
         Args:
-            sig (_type_): path to a signature file
-            pol (_type_): path to a policy file
-            restart (str, optional): parameter whether this is a fresh start
-                or a restart. Defaults to "".
-            log (str, optional): path to a log file to be loaded,
-                is used for policy change. Defaults to "".
-
-        Returns:
-            _type_: _description_
+            suppress_stdout (bool, optional): don't print the verdicts of the
+                log file. Defaults to True.
         """
         cmd = [
             MONPOLY,
             "-unix",
             "-ack_sep",
             "-ignore_parse_errors",
-            "-tolerate_faulty_predicates",
             "-sig",
             sig,
             "-formula",
@@ -534,22 +904,51 @@ class Monitor:
             cmd.append("-log")
             cmd.append(log)
             cmd.append("-switch_to_stdin_after_log")
-            cmd.append("-suppress_stdout")
+            if suppress_stdout:
+                cmd.append("-suppress_stdout")
             cmd.append("-nonewlastts")
+        return cmd
+
+    def start_monpoly(self, sig, pol, restart: str = "", log: str = "", first_timepoint=None):
+        """starts monpoly with the given signature and policy
+
+        Args:
+            sig (_type_): path to a signature file
+            pol (_type_): path to a policy file
+            restart (str, optional): parameter whether this is a fresh start
+                or a restart. Defaults to "".
+            log (str, optional): path to a log file to be loaded,
+                is used for policy change. Defaults to "".
+            first_timepoint (_type_, optional): server time point of the first
+                time point in the log, required for a log without a saved
+                state. Defaults to None.
 
+        Returns:
+            _type_: _description_
+        """
+        if not restart:
+            # MonPoly counts the time points it reads from 0, a saved state
+            # continues the count of the MonPoly that saved it
+            if log and first_timepoint is None:
+                raise ValueError("the first time point of the log is needed to number the verdicts")
+            self.monpoly_offset = first_timepoint if log else self.most_recent_timepoint + 1
+            self.write_config()
+        cmd = self.monpoly_command(sig, pol, restart, log)
         self.write_server_log(f"[spawn_monpoly()] cmd={cmd}")
         p = subprocess.Popen(
             cmd,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
+            bufsize=0,
             start_new_session=True,
         )
         if not p.stdout:
             self.write_server_log(f"[spawn_monpoly()] monpoly_process.stdout is None")
+        self.supervisor.started()
         return p
 
+    @synchronized
     def launch(self, restart=False, db_exists=False):
         """
         starts or restarts monpoly and returns a string message
@@ -579,13 +978,37 @@ class Monitor:
                 )
                 return check["message"]
 
+        # the time points MonPoly reads next must not share their numbers
+        # with rows left behind by a failed backfill
+        try:
+            self.discard_partial_timepoints()
+        except ValueError as error:
+            return f"cannot launch monpoly: {error}"
+
         if os.path.exists(self.monitor_state_path):
             self.write_server_log(
                 f"[launch()] attempting to restart monpoly and load state from: {self.monitor_state_path}"
             )
+            # time points logged after the state was saved, e.g. by backfill.py
+            source = None
+            if self.state_timepoint is not None:
+                try:
+                    source, _ = self.write_replay_log(self.restart_log_path, self.state_timepoint)
+                except Exception as error:
+                    self.write_server_log(f"[launch()] can't replay the time points after {self.state_timepoint}: {error}")
+                    return f"cannot restart monpoly, the time points after its saved state can't be replayed: {error}"
+            self.replaying = source is not None
             self.monpoly = self.start_monpoly(
-                self.signature_path, self.policy_path, restart=self.monitor_state_path
+                self.signature_path,
+                self.policy_path,
+                restart=self.monitor_state_path,
+                log=self.restart_log_path if self.replaying else "",
             )
+            if self.replaying and not restart:
+                # launch_in_background() waits for restarts itself
+                self.replaying = False
+                if not self.wait_for_replay():
+                    return "monpoly didn't replay the time points after its saved state"
             return "restarted monpoly"
 
         if db_exists:
@@ -598,6 +1021,206 @@ class Monitor:
         else:
             return "cannot restart monpoly, because it was not previously started"
 
+    def launch_in_background(self) -> threading.Thread:
+        """restarts MonPoly from its saved state without blocking the caller,
+        the progress is reported by readiness()
+
+        Returns:
+            threading.Thread: the thread waiting for MonPoly to load its state
+        """
+        def run():
+            self.startup = "starting"
+            launch_msg = self.launch(restart=True)
+            self.write_server_log(f"[launch_in_background()] {launch_msg}")
+            if self.monpoly is None:
+                self.startup = "not running"
+                return
+            self.startup = "loading state"
+            if self.replaying:
+                # MonPoly reads the log file right after its state
+                if not self.wait_for_replay():
+                    self.startup = "failed: monpoly didn't replay the time points after its saved state"
+                    return
+                self.replaying = False
+                os.remove(self.restart_log_path)
+            try:
+                # answered once MonPoly reads stdin, i.e. after loading its state
+                self.monpoly_pipe().marker_round_trip(monotonic() + STATE_LOAD_TIMEOUT)
+            except MonpolyTimeout:
+                self.startup = f"failed: state not loaded within {STATE_LOAD_TIMEOUT} seconds"
+                return
+            except MonpolyExited:
+                self.startup = f"failed: monpoly exited with {self.monpoly.poll()}"
+                return
+            self.startup = "ready"
+            self.write_server_log("[launch_in_background()] monpoly is ready")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def readiness(self) -> dict:
+        """
+        Returns:
+            dict: whether the monitor accepts events and its startup state
+        """
+        return {
+            "ready": self.startup in READY_STATES,
+            "accepting": self.startup in ACCEPTING_STATES,
+            "status": self.startup,
+        }
+
+    def supervise(self):
+        """restarts MonPoly if it crashed or hung and takes the periodic
+        checkpoints, called by the maintenance thread
+
+        Returns:
+            _type_: JSON style status message or None if nothing was done
+        """
+        monpoly = self.monpoly
+        reason = self.supervisor.failure(monpoly)
+        if reason is None:
+            if self.supervisor.checkpoint_due():
+                return self.checkpoint()
+            return None
+        if monpoly.poll() is None:
+            # the request waiting for the hung MonPoly holds the lock,
+            # killing MonPoly ends that request
+            monpoly.kill()
+        return self.recover(reason, monpoly)
+
+    @synchronized
+    def checkpoint(self) -> dict:
+        """saves MonPoly's state and restarts it from there, so that a recovery
+        only has to replay the time points after the checkpoint
+        """
+        self.supervisor.last_checkpoint = monotonic()
+        if not self.monpoly or self.monpoly.poll() is not None:
+            return {"error": "monpoly not running"}
+        stop_log = self.stop_monpoly(save_state=True, release_buffered=False)
+        launch_msg = self.launch(restart=True)
+        self.write_server_log(f"[checkpoint()] {stop_log}, {launch_msg}")
+        return {"checkpoint": self.state_timepoint} | stop_log
+
+    @synchronized
+    def recover(self, reason: str, failed=None) -> dict:
+        """restarts a crashed or hung MonPoly from its latest saved state and
+        replays the time points after that state from the hot window or the
+        database, incoming events wait on the lock in the meantime
+
+        Args:
+            reason (str): why MonPoly is restarted
+            failed (_type_, optional): the failed MonPoly process, nothing is done
+                if it has already been replaced. Defaults to None.
+
+        Returns:
+            dict: JSON style status message
+        """
+        if failed is not None and self.monpoly is not failed:
+            return None
+        self.supervisor.detected(reason)
+        self.startup = "recovering"
+        self.write_server_log(f"[recover()] {reason}, restarting monpoly")
+        if self.monpoly is not None:
+            if self.monpoly.poll() is None:
+                self.monpoly.kill()
+            self.monpoly.wait()
+        state = ""
+        after = -1
+        if os.path.exists(self.monitor_state_path) and self.state_timepoint is not None:
+            state = self.monitor_state_path
+            after = self.state_timepoint
+        replay_path = os.path.join(self.events_dir, "events_recovery.log")
+        try:
+            source, first_timepoint = self.write_replay_log(replay_path, after)
+        except Exception as error:
+            # database errors, the supervisor tries again
+            self.startup = f"failed: {error}"
+            self.write_server_log(f"[recover()] can't replay the time points after {after}: {error}")
+            return {"error": f"recovery failed: {error}"}
+        self.monpoly = self.start_monpoly(
+            self.signature_path,
+            self.policy_path,
+            restart=state,
+            log=replay_path if source is not None else "",
+            first_timepoint=first_timepoint,
+        )
+        if source is not None and not self.wait_for_replay():
+            self.startup = f"failed: monpoly exited while replaying the time points after {after}"
+            return {"error": self.startup}
+        if os.path.exists(replay_path):
+            os.remove(replay_path)
+        elapsed = self.supervisor.recovered()
+        self.startup = "ready"
+        response = {
+            "recovered": reason,
+            "state": state or None,
+            "replayed after": after,
+            "replayed from": source,
+            "crash to serving seconds": elapsed,
+        }
+        self.write_server_log(f"[recover()] {response}")
+        return response
+
+    def write_replay_log(self, path: str, after: int):
+        """writes the time points after the given time point as MonPoly log
+
+        Returns:
+            tuple: "hot window" or "database", None if there is nothing to
+                replay, and the first time point in the log
+        """
+        if after >= self.most_recent_timepoint:
+            return None, None
+        encoded = self.hot_window.after(after)
+        if encoded is not None:
+            with open(path, "wb") as f:
+                f.writelines(encoded)
+            # the window holds consecutive time points
+            return "hot window", after + 1
+        if not self.watermark.wait_visible(
+            self.most_recent_timepoint, self.probe_visible_timepoint, VISIBILITY_TIMEOUT
+        ):
+            raise ValueError(f"time point {self.most_recent_timepoint} is not visible in the database")
+        exporter = EventExporter(
+            self.db,
+            self.timepoints_table,
+            self.get_parsed_signature(),
+            table_prefix=self.table_prefix,
+            after=after,
+        )
+        with open(path, "w", encoding="utf-8") as f:
+            for chunk in exporter.stream("monpoly"):
+                f.write(chunk)
+        if exporter.first_timepoint is None:
+            return None, None
+        return "database", exporter.first_timepoint
+
+    def wait_for_replay(self) -> bool:
+        """waits until MonPoly has read the log file it was started with
+
+        Returns:
+            bool: False if MonPoly exited or didn't finish within REPLAY_TIMEOUT
+        """
+        self.write_server_log("[wait_for_replay()] waiting for monpoly to finish")
+        try:
+            self.monpoly_pipe().read_until(LOG_DONE, monotonic() + REPLAY_TIMEOUT)
+        except MonpolyTimeout:
+            self.supervisor.stall(f"monpoly didn't read the log file within {REPLAY_TIMEOUT} seconds")
+            return False
+        except MonpolyExited as error:
+            self.write_server_log(f"[wait_for_replay()] {error}")
+            return False
+        return True
+
+    def monpoly_pipe(self) -> MonpolyPipe:
+        """the non-blocking pipes of the current MonPoly process"""
+        if self.pipe is None or self.pipe.process is not self.monpoly:
+            if self.pipe is not None:
+                self.pipe.close()
+            self.pipe = MonpolyPipe(self.monpoly)
+        return self.pipe
+
+    @changes_status
     def delete_database(self):
         """
         Deletes the database associated with the given signature file
@@ -620,6 +1243,8 @@ class Monitor:
         # TODO prompt user before running this query and deleting all tables
         query_response = self.db.run_query(query)
         os.remove(self.sql_drop_path)
+        self.verdict_table_ready = False
+        self.watermark_table_ready = False
         if "error" in query_response.keys():
             return query_response
         return {"query": query}
@@ -647,6 +1272,8 @@ class Monitor:
             os.remove(self.conf_path)
         return {"config": f"deleted {self.conf_path}"}
 
+    @synchronized
+    @changes_status
     def delete_everything(self):
         """stops the monitor, clears the database, clears the config,
         empties config directories
@@ -663,8 +1290,24 @@ class Monitor:
         self.clear_directory(self.events_dir)
         self.clear_directory(self.monpoly_stdout_dir)
         self.clear_directory(self.sql_dir)
+        self.clear_directory(self.exports_dir)
         self.most_recent_timestamp = None
         self.most_recent_timepoint = -1
+        self.discard_after = None
+        self.monpoly_offset = 0
+        self.retention.trimmed_before = None
+        self.retention.trimmed_horizon = None
+        self.state_timepoint = None
+        self.hot_window.reset()
+        self.watermark.reset()
+        self.unflushed.clear()
+        self.reorder.reset()
+        self.admission.set_buffered(0)
+        self.signature = None
+        self.row_layouts = None
+        self.encoder = None
+        self.validator = None
+        self.generation += 1
         self.write_config()
         if os.path.exists(self.monitor_state_path):
             os.remove(self.monitor_state_path)
@@ -672,39 +1315,59 @@ class Monitor:
             os.remove(self.log_path)
         return {"deleted everything": "done"} | drop_log | stop_log | conf_log
 
-    def stop_monpoly(self, save_state: bool = True):
+    @synchronized
+    def stop_monpoly(self, save_state: bool = True, release_buffered: bool = True):
         """this stops monpoly and saves the state if save_state is True
 
         Args:
             save_state (bool, optional): parameter whether or not to save the 
                 state of monpoly. Defaults to True.
+            release_buffered (bool, optional): log the time points held by the
+                reorder buffer before saving the state. Defaults to True.
 
         Returns:
             dict: JSON style status message
         """
         self.write_server_log("[stop()] stopping monpoly")
         log = dict()
+        if save_state and release_buffered and self.reorder.enabled and self.monpoly and self.monpoly.poll() is None:
+            # buffered time points would otherwise be lost
+            log |= {"released buffered time points": self.release_reordered(force=True)}
+        self.supervisor.stopped()
         if not self.monpoly or self.monpoly.poll():
             self.write_server_log(
                 f"[stop()] monpoly is not running, self.monpoly: {self.monpoly}"
             )
             return {"error": "monpoly not running or already stopped"}
 
+        if save_state and self.supervisor.stalled is not None:
+            # MonPoly may still process a time point that isn't in the
+            # database, a state saved now wouldn't match the database
+            self.write_server_log(f"[stop()] not saving the state: {self.supervisor.stalled}")
+            save_state = False
         if self.monpoly and self.monpoly.poll() is None:
             if save_state and self.monpoly.stdin:
                 self.write_server_log(
                     f"[stop()] sending > save_and_exit {self.monitor_state_path} <; to monpoly"
                 )
-                self.monpoly.stdin.write(
-                    f"> save_and_exit {self.monitor_state_path} < ;"
-                )
-                self.monpoly.stdin.flush()
-                self.write_server_log("[stop()] waiting for response from monpoly")
-                return_code = self.monpoly.wait()
+                deadline = monotonic() + SAVE_TIMEOUT
+                try:
+                    self.monpoly_pipe().send(
+                        f"> save_and_exit {self.monitor_state_path} < ;".encode("utf-8"), deadline
+                    )
+                    self.write_server_log("[stop()] waiting for response from monpoly")
+                    return_code = self.monpoly.wait(max(0, deadline - monotonic()))
+                except (MonpolyTimeout, MonpolyExited, subprocess.TimeoutExpired) as error:
+                    self.write_server_log(f"[stop()] saving the state failed: {error}")
+                    self.monpoly.kill()
+                    self.monpoly.wait()
+                    return {"error": f"monpoly didn't save its state: {error}"}
                 self.write_server_log(
                     f"[stop()] monpoly exited with return code: {return_code}, self.monpoly.poll(): {self.monpoly.poll()}, saved state at {self.monitor_state_path}"
                 )
                 log |= {"stopped monpoly and stored sate, return code": return_code}
+                self.state_timepoint = self.most_recent_timepoint
+                self.write_config()
             elif not save_state:
                 self.write_server_log("[stop()] stopping monpoly without saving state")
                 self.monpoly.kill()
@@ -727,6 +1390,74 @@ class Monitor:
         else:
             return "monpoly not running"
 
+    def read_status_files(self) -> tuple:
+        """the parts of the status that are read from disk or the database
+
+        Returns:
+            tuple: the parts and whether they can be cached
+        """
+        tables = self.get_schema()
+        return {
+            "policy": self.get_policy(),
+            "negate": self.policy_negate,
+            "signature": self.get_signature(),
+            "monitorability": self.get_monitorability_log(),
+            "tables": tables,
+        }, not isinstance(tables, str)
+
+    def get_status(self) -> tuple:
+        """the status shown by /status and the index page, without reading
+        files or querying the database unless the policy, signature or
+        tables changed, see status.py
+
+        Returns:
+            tuple: ETag and status dictionary
+        """
+        files = self.status.cached_files(self.read_status_files)
+        process = self.monpoly
+        exit_code = process.poll() if process else None
+        committed = self.watermark.committed
+        state = (
+            self.startup,
+            process.pid if process else None,
+            exit_code,
+            self.most_recent_timepoint,
+            self.most_recent_timestamp,
+            committed,
+        )
+        etag = self.status.etag(state)
+        database = None
+        if committed is not None:
+            database = {
+                "sequence": committed[0],
+                "timepoint": committed[1],
+                "timestamp": str(datetime.utcfromtimestamp(committed[2])),
+            }
+        status = files | {
+            "monpoly": {
+                "pid": process.pid if process else None,
+                "args": process.args if process else None,
+                "running": process is not None and exit_code is None,
+                "exit code": exit_code,
+                "startup": self.startup,
+            },
+            "timepoint": self.most_recent_timepoint,
+            "timestamp": str(self.most_recent_timestamp) if self.most_recent_timestamp is not None else None,
+            "database": database,
+            "output": self.status.output_tail(self.monpoly_stdout_path),
+        }
+        return etag, status
+
+    def get_monpoly_usage(self) -> dict:
+        """CPU time and memory used by MonPoly so far
+
+        Returns:
+            dict: see profiling.process_usage() or an error message
+        """
+        if not self.monpoly or self.monpoly.poll() is not None:
+            return {"error": "monpoly not running"}
+        return process_usage(self.monpoly.pid)
+
     def get_monpoly_exit_code(self):
         """returns the exit code of monpoly
 
@@ -751,6 +1482,7 @@ class Monitor:
         """
         with open(self.monpoly_stdout_path, "a", encoding="utf-8") as monpoly_log:
             monpoly_log.write(log)
+        self.status.add_output(log)
 
     def get_stdout(self) -> str:
         """reads the stdout of monpoly
@@ -764,71 +1496,319 @@ class Monitor:
         with open(self.monpoly_stdout_path, "r") as stdout:
             return stdout.read() or "stdout is empty"
 
-    def get_most_recent_timestamp_from_db(self):
-        """queries the most recent time stamp in the database
+    def most_recent_timestamp_int(self):
+        """the most recent time stamp in seconds since 1970-01-01 00:00:00
 
         Returns:
-            _type_: the most recent time stamp seen by the database
+            _type_: the time stamp or None if no time point has been seen yet
         """
+        if self.most_recent_timestamp is None:
+            return None
+        return int(datetime.timestamp(self.most_recent_timestamp))
+
+    def get_watermark(self):
+        """the latest committed flush, read from the watermark table once and
+        then maintained by store_timepoints_in_db()
+
+        Returns:
+            _type_: (sequence, time point, time stamp) or None if the database
+                has no time points
+        """
+        if not self.watermark.loaded:
+            committed = self.query_watermark()
+            if committed is not None:
+                self.watermark.commit(*committed)
+            self.watermark.loaded = True
+        return self.watermark.committed
+
+    def query_watermark(self):
+        """reads the latest row of the watermark table, databases written
+        before the table existed are scanned once instead
+
+        Returns:
+            _type_: (sequence, time point, time stamp) or None
+        """
+        from psycopg2 import DatabaseError
+
         try:
-            query = f"SELECT MAX(time_stamp) FROM {TIMEPOINTS_TABLE};"
+            query = f"SELECT sequence, time_point, time_stamp FROM {self.watermark_table} LIMIT -1;"
             t = self.db.run_query(query, select=True)
-            if 'error' in t.keys():
-                return None
-            t = t['response']
-            if t:
-                return t[0][0]
-            else:
+            if "error" not in t.keys() and t["response"]:
+                sequence, time_point, time_stamp = t["response"][0]
+                return int(sequence), int(time_point), self.epoch_seconds(time_stamp)
+            query = f"SELECT MAX(time_point), MAX(time_stamp) FROM {self.timepoints_table};"
+            t = self.db.run_query(query, select=True)
+            if "error" in t.keys() or not t["response"] or t["response"][0][0] is None:
                 return None
-        except psycopg2.DatabaseError:
+            time_point, time_stamp = t["response"][0]
+            return 0, int(time_point), self.epoch_seconds(time_stamp)
+        except DatabaseError:
             return None
 
-    def get_most_recent_timepoint_from_db(self) -> int:
-        """queries the most recent time point (index) in the database
+    @staticmethod
+    def epoch_seconds(time_stamp: datetime) -> int:
+        """seconds since 1970-01-01 00:00:00 of a time stamp read from the
+        database, which are UTC without time zone"""
+        return int((time_stamp - datetime(1970, 1, 1)).total_seconds())
+
+    def trim_watermark(self) -> dict:
+        """drops the partitions of the watermark table before the one holding
+        the latest committed flush, only that row is ever read
+
+        Returns:
+            dict: JSON style status message
+        """
+        self.watermark.last_trim = monotonic()
+        committed = self.get_watermark()
+        if committed is None or not self.watermark_table_ready:
+            return {"watermark": "nothing to trim"}
+        keep_from = partition_start(datetime.utcfromtimestamp(committed[2]), WATERMARK_PARTITION_BY)
+        query = f"ALTER TABLE {self.watermark_table} DROP PARTITION WHERE time_stamp < '{keep_from}';"
+        response = self.db.run_query(query)
+        self.write_server_log(f"[trim_watermark()] dropped partitions before {keep_from}: {response}")
+        if "error" in response.keys():
+            return {"error": f"trimming the watermark table failed: {response['error']}"}
+        return {"watermark": f"dropped partitions before {keep_from}"}
+
+    def get_most_recent_timestamp_from_db(self):
+        """the most recent time stamp in the database, from the watermark
 
         Returns:
             _type_: the most recent time stamp seen by the database
         """
-        try:
-            query = f"SELECT MAX(time_point) FROM {TIMEPOINTS_TABLE};"
-            t = self.db.run_query(query, select=True)
-            if 'error' in t.keys():
-                return -1
-            # database query result comes as a list of list
-            # one list per table
-            tp = t['response'][0][0]
-            return int(tp) if tp is not None else -1
-        except psycopg2.DatabaseError:
+        committed = self.get_watermark()
+        if committed is None:
+            return None
+        return datetime.utcfromtimestamp(committed[2])
+
+    def get_most_recent(self) -> dict:
+        """the most recent time point and time stamp in the database and the
+        sequence number of the flush that wrote them"""
+        return {
+            "timestamp": self.get_most_recent_timestamp_from_db(),
+            "timepoint": self.get_most_recent_timepoint_from_db(),
+            "sequence": self.watermark.sequence,
+        }
+
+    def get_most_recent_timepoint_from_db(self) -> int:
+        """the most recent time point (index) in the database, from the watermark
+
+        Returns:
+            _type_: the most recent time point seen by the database or -1
+        """
+        committed = self.get_watermark()
+        return committed[1] if committed is not None else -1
+
+    def probe_visible_timepoint(self) -> int:
+        """cheap check for the highest time point visible in the database,
+        only the partitions at or after the most recent time stamp are scanned
+
+        Returns:
+            int: the highest visible time point or -1
+        """
+        timestamp = self.most_recent_timestamp_int()
+        if timestamp is None:
+            return -1
+        lower = datetime.utcfromtimestamp(timestamp)
+        query = f"SELECT MAX(time_point) FROM {self.timepoints_table} WHERE time_stamp >= '{lower}';"
+        t = self.db.run_query(query, select=True)
+        if 'error' in t.keys() or not t['response']:
             return -1
+        tp = t['response'][0][0]
+        return int(tp) if tp is not None else -1
+
+    def store_timepoints_in_db(self, timepoints: list, verdicts: list = ()):
+        """logs the given time points (Timepoint records) in the database,
+        time points with `skip` set are left out
+
+        Args:
+            timepoints (list): Timepoint records
+            verdicts (list, optional): Verdict records MonPoly printed for
+                them, written to the verdict table. Defaults to ().
+        """
+        from questdb.ingress import Buffer
 
-    def store_timepoints_in_db(self, timepoints: list):
-        """logs the given events in the database"""
         buf = Buffer()
-        for timepoint in timepoints:
-            if "skip" in timepoint.keys():
-                continue
-            self.most_recent_timestamp = datetime.fromtimestamp(timepoint["timestamp-int"])
-            self.most_recent_timepoint = self.most_recent_timepoint + 1
-            buf.row(TIMEPOINTS_TABLE, symbols=None, columns={"time_point": self.most_recent_timepoint}, at=self.most_recent_timestamp)
-            for p in timepoint["predicates"]:
-                if "name" not in p.keys():
-                    return {"log_events error": 'predicate must have a "name"'}
-                elif "occurrences" not in p.keys():
-                    # predicate can be named without an occurrence
+        if verdicts:
+            with tracer.span("verdicts", verdicts=len(verdicts)):
+                self.ensure_verdict_table()
+                self.verdict_count = self.get_verdict_parser().add_rows(
+                    buf, self.verdicts_table, verdicts, self.verdict_count
+                )
+        # sequence numbers continue those in the watermark table and of the
+        # buffers still waiting to be flushed
+        self.ensure_watermark_table()
+        self.get_watermark()
+        sequence = (self.unflushed[-1][1] if self.unflushed else self.watermark.sequence) + 1
+        stored = 0
+        with tracer.span("build buffer") as span:
+            for timepoint in timepoints:
+                if timepoint.skip is not None:
                     continue
-                name = p["name"]
-                for occ in p["occurrences"]:
-                    columns = {"time_point": self.most_recent_timepoint} | {
-                        f"x{i+1}": o for i, o in enumerate(occ)
-                    }
-                    buf.row(name, symbols=None, columns=columns, at=self.most_recent_timestamp)
+                self.most_recent_timestamp = datetime.fromtimestamp(timepoint.timestamp)
+                self.most_recent_timepoint = self.most_recent_timepoint + 1
+                time_point = self.most_recent_timepoint
+                at = self.most_recent_timestamp
+                timepoint.time_point = time_point
+                stored += 1
+                buf.row(self.timepoints_table, symbols=None, columns={"time_point": time_point}, at=at)
+                self.hot_window.append(time_point, timepoint.timestamp, timepoint.monpoly_string)
+                for table, symbols, columns in timepoint.rows:
+                    columns["time_point"] = time_point
+                    buf.row(table, symbols=symbols, columns=columns, at=at)
+            if stored:
+                buf.row(
+                    self.watermark_table,
+                    symbols=None,
+                    columns={"sequence": sequence, "time_point": time_point},
+                    at=at,
+                )
+            span.set(timepoints=stored)
         # update config after going over all timestamps
         self.write_config()
-        with Sender(self.db.host, self.db.port_influxdb) as sender:
-            self.write_server_log(f"sending buffer {buf} to database")
-            sender.flush(buf)
+        self.write_server_log(f"sending {stored} time points to database")
+        self.unflushed.append(
+            (buf, sequence, time_point, self.most_recent_timestamp_int()) if stored else (buf, None, None, None)
+        )
+        self.flush_unflushed()
 
-        return {"events": timepoints}
+        return {"stored": stored}
+
+    def flush_unflushed(self):
+        """flushes the ILP buffers of the time points MonPoly already read, in
+        order, a buffer that can't be flushed stays queued and is retried by
+        the next flush or the maintenance thread (see retry_flush())
+
+        Raises:
+            IngressError: if QuestDB can't be reached
+        """
+        while self.unflushed:
+            buf, sequence, time_point, timestamp = self.unflushed[0]
+            with tracer.span("flush", bytes=len(buf)):
+                self.db.ilp_writer().flush(buf)
+            self.unflushed.pop(0)
+            if sequence is not None:
+                self.watermark.commit(sequence, time_point, timestamp)
+
+    @synchronized
+    def retry_flush(self):
+        """
+        Raises:
+            IngressError: if QuestDB still can't be reached
+        """
+        self.flush_unflushed()
+
+    def get_verdict_parser(self) -> VerdictParser:
+        """the verdict parser of the current policy, the names of the free
+        variables are taken from the monitorability check"""
+        if self.verdict_parser is None:
+            check_output = self.get_monitorability_log()
+            if "free variables" not in check_output and os.path.exists(self.policy_path):
+                check_output = self.check_monitorability(
+                    self.signature_path, self.policy_path, self.policy_negate
+                )["message"]
+            self.verdict_parser = VerdictParser(
+                policy_id(self.get_policy(), self.policy_negate), free_variables(check_output)
+            )
+        return self.verdict_parser
+
+    @synchronized
+    def discard_partial_timepoints(self):
+        """sets the time point of the rows after `discard_after`, which a
+        failed backfill may have written partially, to -1, QuestDB can't
+        delete rows. Exports and replays skip time point -1. Runs under the
+        monitor's lock, so that no time points are stored meanwhile.
+
+        Raises:
+            ValueError: if a table can't be updated, the rows are then
+                discarded by the next call
+        """
+        if self.discard_after is None:
+            return
+        signature = self.get_parsed_signature() or ()
+        tables = [self.timepoints_table] + [self.table_prefix + p.name for p in signature]
+        for table in tables:
+            response = self.db.run_query(
+                f"UPDATE {table} SET time_point = -1 WHERE time_point > {self.discard_after};"
+            )
+            if "error" in response.keys():
+                raise ValueError(
+                    f"can't discard the time points after {self.discard_after} in {table}: {response['error']}"
+                )
+        self.write_server_log(f"[discard_partial_timepoints()] discarded the time points after {self.discard_after}")
+        self.discard_after = None
+        self.write_config()
+
+    def ensure_verdict_table(self):
+        """creates the verdict table, it isn't part of the DDL generated from
+        the signature, init_database() creates it with the other tables and
+        monitors created before it existed get it on first use"""
+        if self.verdict_table_ready:
+            return
+        query = verdict_table_ddl(
+            self.verdicts_table, self.schema.partition_by(), self.schema.symbol_capacity
+        )
+        response = self.db.run_query(query)
+        self.write_server_log(f"[ensure_verdict_table()] {response}")
+        self.verdict_table_ready = "error" not in response.keys()
+        # the tables are part of the status
+        self.status.changed()
+
+    def ensure_watermark_table(self):
+        """creates the watermark table, for databases created before it was
+        part of init_database()"""
+        if self.watermark_table_ready:
+            return
+        query = watermark_table_ddl(self.watermark_table)
+        response = self.db.run_query(query)
+        self.write_server_log(f"[ensure_watermark_table()] {response}")
+        self.watermark_table_ready = "error" not in response.keys()
+        self.status.changed()
+
+    def query_verdicts(
+        self, policy="current", start_date=None, end_date=None, bindings=None, after=-1, limit=None, token=None
+    ) -> dict:
+        """a page of the verdicts in the verdict table
+
+        Args:
+            policy (str, optional): policy id, "current" for the current policy
+                or None for all policies. Defaults to "current".
+            start_date (_type_, optional): Defaults to None.
+            end_date (_type_, optional): Defaults to None.
+            bindings (_type_, optional): (variable, value) pairs the verdicts
+                have to bind. Defaults to None.
+            after (int, optional): only verdicts after this id. Defaults to -1.
+            limit (_type_, optional): maximum number of verdicts. Defaults to None.
+            token (_type_, optional): continuation token of a previous page,
+                overrides all other arguments. Defaults to None.
+
+        Returns:
+            dict: JSON style response with the verdicts and the continuation token
+        """
+        from psycopg2 import DatabaseError
+
+        try:
+            if token is not None:
+                query = VerdictQuery.from_token(self.db, self.verdicts_table, token)
+            else:
+                if policy == "current":
+                    policy = self.get_verdict_parser().policy
+                query = VerdictQuery(
+                    self.db,
+                    self.verdicts_table,
+                    policy=policy,
+                    start_date=start_date,
+                    end_date=end_date,
+                    bindings=bindings,
+                    after=after,
+                )
+                if limit is not None:
+                    query.limit = limit
+            return query.page()
+        except ValueError as error:
+            return {"error": str(error)}
+        except DatabaseError as error:
+            return {"error": f"pg.DatabaseError: {str(error)}"}
 
     def send_timepoint_to_monpoly(self, event_str: str):
         """sends the given events to MonPoly
@@ -837,25 +1817,39 @@ class Monitor:
             event_str (str): string of events formatted as MonPoly input
 
         Returns:
-            _type_: JSON style response message
+            _type_: JSON style response message, with "timeout" set if MonPoly
+                didn't answer within the supervisor's hang timeout
         """
         if self.monpoly:
             if self.monpoly.stdin and self.monpoly.stdout:
                 self.write_server_log(
                     f"[send_events_to_monpoly({event_str})] sending events to monpoly: {event_str}"
                 )
-                self.monpoly.stdin.write(event_str)
-                self.monpoly.stdin.flush()
-                result = ""
-                reached_separator = False
-                while not reached_separator:
-                    line = self.monpoly.stdout.readline()
-                    self.write_server_log(
-                        f"[send_events_to_monpoly({event_str})] read line from monpoly: {line}"
-                    )
-                    reached_separator = "## reached separator ##" in line
-                    if not reached_separator:
-                        result += line
+                stalled = self.supervisor.stalled
+                if stalled is not None:
+                    return {"error": f"monpoly is being restarted: {stalled}"}
+                # a client's deadline only stops further time points from being
+                # sent (see submit_timepoints()), MonPoly is only declared stalled
+                # after the hang timeout
+                deadline = monotonic() + self.supervisor.hang_timeout
+                self.supervisor.begin()
+                try:
+                    with tracer.span("monpoly", bytes=len(event_str)):
+                        output = self.monpoly_pipe().request(
+                            event_str.encode("utf-8"), SEPARATOR, deadline
+                        )
+                except MonpolyTimeout:
+                    # MonPoly is still busy with the time point, its answer
+                    # can't be matched to later requests anymore
+                    self.supervisor.stall(f"monpoly didn't answer within {self.supervisor.hang_timeout} seconds: {event_str}")
+                    self.write_server_log(f"[send_events_to_monpoly({event_str})] timeout")
+                    return {"error": f"timeout while processing {event_str}", "timeout": True}
+                except MonpolyExited as error:
+                    # crashed or killed by the supervisor
+                    self.write_server_log(f"[send_events_to_monpoly({event_str})] {error}")
+                    return {"error": f"{error} while processing {event_str}"}
+                self.supervisor.end()
+                result = output.decode("utf-8", errors="replace")
 
                 self.write_monpoly_log(result)
                 self.write_server_log(
@@ -873,39 +1867,15 @@ class Monitor:
 
     def create_log_strings(self, timepoints: list, output_file=None):
         """
-        this function takes a list of event dictionaries
-        it adds log strings (to be sent to monpoly) to for
-        each timestamp and returns the extended list of
-        dictionaries
+        this function takes a list of Timepoint records and encodes each of
+        them into its log string (to be sent to monpoly) and its database rows
+        in a single pass, the list is returned
         """
-        self.write_server_log(f"create_log_strings({timepoints})")
-        for timepoint in timepoints:
-            timestamp = timepoint["timestamp-int"]
-            monpoly_string = f"@{timestamp} "
-
-            for predicate in timepoint["predicates"]:
-                if "name" not in predicate.keys():
-                    timepoint["skip"] = f"predicate {predicate} has no name"
-                    self.write_server_log(
-                        f"create_log_strings(): predicate ({predicate}) with no name at timestamp: {timestamp}"
-                    )
-                    break
-                else:
-                    name = predicate["name"]
-                    for occurrence in predicate["occurrences"]:
-                        predicate_str = (
-                            f"{name} {self.tuple_str_from_list(occurrence)} "
-                        )
-                        monpoly_string += predicate_str
-            monpoly_string += ";\n"
-            timepoint["monpoly-string"] = monpoly_string
-            if output_file is not None:
-                with open(output_file, "a", encoding="utf-8") as f:
-                    f.write(monpoly_string)
-
-            self.write_server_log(
-                f"create_log_strings(): created monpoly string: {monpoly_string}"
-            )
+        with tracer.span("encode", timepoints=len(timepoints)):
+            self.get_encoder().encode(timepoints)
+        if output_file is not None:
+            with open(output_file, "a", encoding="utf-8") as f:
+                f.writelines(t.monpoly_string for t in timepoints if t.skip is None)
         return timepoints
 
     def tuple_str_from_list(self, l: list) -> str:
@@ -944,6 +1914,228 @@ class Monitor:
             ts = ts + ts.utcoffset()
         return int(ts.timestamp())
 
+    def prepare_timepoints(self, timepoints_json: str) -> list:
+        """parses the events in the given json file into Timepoint records with
+        their MonPoly log strings, this doesn't depend on the state of the monitor
+
+        Args:
+            timepoints_json (str): path to the json file containing the events
+                or a binary file object, e.g. a decompressing reader of an upload
+
+        Raises:
+            ValueError: if the file isn't valid JSON
+
+        Returns:
+            list: list of Timepoint records
+        """
+        # get current time at this point, so all events with a missing timestamp are logged with the same timestamp
+        timestamp_now = datetime.now()
+        get_timestamp = self.get_timestamp
+        with tracer.span("json decode"):
+            if isinstance(timepoints_json, str):
+                with open(timepoints_json, encoding="utf-8") as f:
+                    events = json.load(f)
+            else:
+                events = json.load(timepoints_json)
+        # TODO don't sort - leave order of time points up to user and skip if out of order
+        with tracer.span("timestamps", timepoints=len(events)):
+            timepoints = [
+                Timepoint.from_dict(e, get_timestamp(e, timestamp_now)) for e in events
+            ]
+        # invalid time points are skipped here instead of being rejected by MonPoly
+        with tracer.span("validate"):
+            self.get_validator().validate(timepoints)
+        return self.create_log_strings(timepoints)
+
+    def prepare_binary_timepoints(self, data: bytes) -> list:
+        """decodes MessagePack events (see binary_events.py) or a columnar
+        batch (see columnar_events.py) into Timepoint records with their
+        MonPoly log strings, like prepare_timepoints()
+
+        Args:
+            data (bytes): the MessagePack document
+
+        Raises:
+            ValueError: if the document is malformed or msgpack (or numpy for
+                columnar batches) isn't installed
+
+        Returns:
+            list: list of Timepoint records
+        """
+        validator = self.get_validator()
+        with tracer.span("msgpack decode", bytes=len(data)):
+            document = unpack(data)
+        if "timestamps" in document:
+            # checked and encoded column by column
+            with tracer.span("columnar decode") as span:
+                timepoints = ColumnarDecoder(validator, self.get_encoder()).decode(document)
+                span.set(timepoints=len(timepoints))
+            return timepoints
+        with tracer.span("timepoints"):
+            timepoints = decode_timepoints(document, validator)
+        with tracer.span("validate"):
+            validator.validate(timepoints)
+        return self.create_log_strings(timepoints)
+
+    @synchronized
+    def submit_timepoints(self, timepoints: list, deadline=None) -> dict:
+        """sends the given Timepoint records to MonPoly and writes the ones
+        MonPoly accepts to the database
+
+        Args:
+            timepoints (list): Timepoint records with their log strings
+            deadline (_type_, optional): time.monotonic() after which no more time
+                points are sent, the remaining ones are skipped. Defaults to None.
+
+        Returns:
+            dict: JSON style response dcitionary with either the skipped time
+                points or an error message
+        """
+        skip_log = {}
+        verdicts = []
+        for timepoint in timepoints:
+            if timepoint.skip is None and deadline is not None and monotonic() >= deadline:
+                timepoint.skip = "deadline exceeded before the time point was sent to monpoly"
+            if timepoint.skip is not None:
+                self.write_server_log(
+                    f"[log_timepoints()] skipping event: {timepoint}, because: {timepoint.skip}"
+                )
+                skip_log[timepoint.timestamp] = timepoint.skip
+                continue
+            monpoly_output = self.send_timepoint_to_monpoly(timepoint.monpoly_string)
+            if "error" in monpoly_output.keys():
+                return {
+                    "error": f'error while logging timepoints: {monpoly_output["error"]}'
+                }
+            output = monpoly_output["output"]
+            if (
+                "WARNING: Skipping out of order timestamp" in output
+                or "ERROR" in output
+            ):
+                timepoint.skip = output
+                skip_log[timepoint.timestamp] = output
+            else:
+                verdicts.extend(VerdictParser.parse(output, self.monpoly_offset))
+        db_response = self.store_timepoints_in_db(timepoints, verdicts)
+        self.write_server_log(f"stored events in db: {db_response}")
+
+        return {"skipped-timepoints": skip_log}
+
+    @synchronized
+    def log_reordered(self, source: str, timepoints: list) -> dict:
+        """adds the time points of a producer to the reorder buffer and logs
+        all time points that can be released
+
+        Args:
+            source (str): identifies the producer
+            timepoints (list): Timepoint records with their log strings
+
+        Returns:
+            dict: JSON style response with the skipped time points (invalid
+                or late ones of this producer, rejected ones of all released
+                time points) and the number of buffered and released time points
+        """
+        skip_log = {t.timestamp: t.skip for t in timepoints if t.skip is not None}
+        late = self.reorder.push(source, timepoints)
+        skip_log |= {t.timestamp: t.skip for t in late}
+        response = self.release_reordered()
+        if "error" in response.keys():
+            return response
+        response["skipped-timepoints"] = skip_log | response["skipped-timepoints"]
+        response["buffered"] = len(self.reorder.heap)
+        return response
+
+    @synchronized
+    def release_reordered(self, force: bool = False) -> dict:
+        """logs the time points that can be released from the reorder buffer
+
+        Args:
+            force (bool, optional): release all buffered time points. Defaults to False.
+
+        Returns:
+            dict: JSON style response of submit_timepoints() and the number of
+                released time points
+        """
+        released = self.reorder.pop_ready(force)
+        self.admission.set_buffered(len(self.reorder.heap))
+        if not released:
+            return {"skipped-timepoints": {}, "released": 0}
+        try:
+            response = self.submit_timepoints(released)
+        except Exception as error:
+            # MonPoly has read the time points, their rows stay queued in
+            # self.unflushed and are flushed by the next tick
+            self.write_server_log(f"[release_reordered()] storing released time points failed: {error}")
+            return {"error": f"storing released time points failed: {error}", "released": len(released)}
+        response["released"] = len(released)
+        return response
+
+    def ingest_config(self, generation=None):
+        """what is needed to prepare time points outside of the monitor,
+        e.g. in the HTTP workers (see engine.RemoteMonitor)
+
+        Args:
+            generation (_type_, optional): the generation the caller already
+                has. Defaults to None.
+
+        Returns:
+            _type_: None if the caller is up to date, otherwise a dictionary
+                with the signature, schema configuration and table prefix
+        """
+        if generation == self.generation:
+            return None
+        return {
+            "generation": self.generation,
+            "signature": self.get_signature() if self.signature_set() else None,
+            "schema": self.schema.get_config(),
+            "table_prefix": self.table_prefix,
+        }
+
+    def ingest(self, ticket, timepoints: list, source=None, generation=None, timeout=None, trace=None):
+        """logs the prepared time points of an admitted request, directly or
+        through the reorder buffer, and releases the ticket
+
+        Args:
+            ticket (_type_): the ticket returned by self.admission.admit()
+            timepoints (list): Timepoint records with their log strings
+            source (_type_, optional): identifies the producer. Defaults to None.
+            generation (_type_, optional): generation of the signature the time
+                points were prepared with, if they were prepared elsewhere.
+                Defaults to None.
+            timeout (_type_, optional): seconds the request may take, time points
+                that can't be sent in time are skipped. Defaults to None.
+            trace (_type_, optional): tracing context of the request if it was
+                prepared in another process, see Tracer.context(). Defaults to None.
+
+        Returns:
+            _type_: JSON style response or a Rejection
+        """
+        elapsed = None
+        deadline = monotonic() + timeout if timeout is not None else None
+        with tracer.trace("ingest", trace, timepoints=len(timepoints)):
+            try:
+                rejected = self.admission.add_timepoints(ticket, len(timepoints))
+                if rejected is not None:
+                    return rejected
+                with tracer.span("lock wait"):
+                    self.lock.acquire()
+                try:
+                    if generation is not None and generation != self.generation:
+                        # prepared with an outdated signature
+                        self.get_validator().validate(timepoints)
+                        self.create_log_strings(timepoints)
+                    t = perf_counter()
+                    if self.reorder.enabled:
+                        result = self.log_reordered(source, timepoints)
+                    else:
+                        result = self.submit_timepoints(timepoints, deadline)
+                    elapsed = perf_counter() - t
+                finally:
+                    self.lock.release()
+                return result
+            finally:
+                self.admission.release(ticket, elapsed)
+
     def log_timepoints(self, timepoints_json: str) -> dict:
         """logs the events in the given json file
         first checking the JSON formatting, then sending it to MonPoly and if
@@ -956,53 +2148,16 @@ class Monitor:
             dict: JSON style response dcitionary with either success message
                 or error message
         """
-        # get current time at this point, so all events with a missing timestamp are logged with the same timestamp
         self.write_server_log(
             f"[log_timepoints()] started logging events: {timepoints_json}"
         )
-        timestamp_now = datetime.now()
-        with open(timepoints_json, encoding="utf-8") as f:
-            try:
-                timepoints = json.load(f)
-                timepoints = [
-                    {"timestamp-int": self.get_timestamp(e, timestamp_now)} | e
-                    for e in timepoints
-                ]
-                # TODO don't sort - leave order of time points up to user and skip if out of order
-                # list.sort(timepoints, key=lambda e: e["timestamp-int"])
-                timepoints = self.create_log_strings(timepoints)
-
-                skip_log = {}
-                for timepoint in timepoints:
-                    if "skip" in timepoint.keys():
-                        self.write_server_log(
-                            f'[log_timepoints()] skipping event: {timepoint}, because: {timepoint["skip"]}'
-                        )
-                        skip_log |= {timepoint["timestamp-int"]: timepoint["skip"]}
-                        continue
-                    monpoly_output = self.send_timepoint_to_monpoly(
-                        timepoint["monpoly-string"]
-                    )
-                    if "error" in monpoly_output.keys():
-                        return {
-                            "error": f'error while logging timepoints: {monpoly_output["error"]}'
-                        }
-                    output = monpoly_output["output"]
-                    if (
-                        "WARNING: Skipping out of order timestamp" in output
-                        or "ERROR" in output
-                    ):
-                        timepoint["skip"] = output
-                        skip_log |= {timepoint["timestamp-int"]: timepoint["skip"]}
-                db_response = self.store_timepoints_in_db(timepoints)
-                self.write_server_log(f"stored events in db: {db_response}")
-
-                return {"skipped-timepoints": skip_log}
-
-            except ValueError as error:
-                self.write_server_log(f"error parsing json file: {error}")
-                self.clear_directory(self.events_dir)
-                return {"error": f"Error while parsing events JSON {error}"}
+        try:
+            timepoints = self.prepare_timepoints(timepoints_json)
+        except ValueError as error:
+            self.write_server_log(f"error parsing json file: {error}")
+            self.clear_directory(self.events_dir)
+            return {"error": f"Error while parsing events JSON {error}"}
+        return self.submit_timepoints(timepoints)
 
     def db_response_to_timepoints(self, db_response: list) -> list:
         """converts the response from the database to a list of timepoints
@@ -1018,39 +2173,39 @@ class Monitor:
             "[db_response_to_timepoints()] converting db response to timepoints"
         )
         db_response_dict = {k: v for d in db_response for k, v in d.items()}
-        if db_response_dict[TIMEPOINTS_TABLE] is not None:
-            timestamps = {x[1] for x in db_response_dict[TIMEPOINTS_TABLE] if x is not None}
-        else:
+        if db_response_dict[self.timepoints_table] is None:
             return []
+        # one entry per time point, time points with the same time stamp are
+        # kept apart, so that MonPoly numbers the replayed time points like
+        # the server (see monpoly_offset)
         result = dict()
-        for ts in timestamps:
-            ts_int = int(ts.timestamp())
-            ts_dict = {
-                "timestamp-int": ts_int,
+        for x in db_response_dict[self.timepoints_table]:
+            # rows discarded after a failed backfill have time point -1
+            if x is None or x[0] < 0:
+                continue
+            time_point, ts = x[0], x[1]
+            result[time_point] = {
+                "timestamp-int": int(ts.timestamp()),
                 "timestamp": ts.strftime(LOG_TIMESTAMP_FORMAT),
+                "timepoint": time_point,
                 "predicates": dict(),
             }
-            result[ts_int] = ts_dict
 
         for predicate_name in db_response_dict.keys():
-            if predicate_name == TIMEPOINTS_TABLE:
+            if predicate_name == self.timepoints_table:
                 continue
             for occurrence in db_response_dict[predicate_name]:
-                ts = int(occurrence[-1].timestamp())
-                # TODO work with time_point column
-                if predicate_name in result[ts]["predicates"].keys():
-                    result[ts]["predicates"][predicate_name].append(occurrence[0:-2])
-                    result[ts]["timepoint"] = occurrence[-2]
-                else:
-                    result[ts]["predicates"][predicate_name] = [occurrence[0:-2]]
-                    result[ts]["timepoint"] = occurrence[-2]
-
-        result = [v for _, v in result.items()]
+                time_point = occurrence[-2]
+                if time_point not in result:
+                    continue
+                predicates = result[time_point]["predicates"]
+                predicates.setdefault(predicate_name, []).append(occurrence[0:-2])
+
+        result = sorted(result.values(), key=lambda e: e["timepoint"])
         for t in result:
             t["predicates"] = [
                 {"name": k, "occurrences": v} for k, v in t["predicates"].items()
             ]
-        result.sort(key=lambda e: e["timestamp-int"])
 
         return result
 
@@ -1126,7 +2281,7 @@ class Monitor:
         Returns:
             str: a single SQL query for the given predicate and its masked relative intervals
         """
-        prefix = f"SELECT * FROM {predicate_name} WHERE "
+        prefix = f"SELECT * FROM {self.table(predicate_name)} WHERE "
         conditions = []
         for masked_interval in intervals:
             mask = masked_interval["mask"]
@@ -1161,8 +2316,8 @@ class Monitor:
             query = self.relative_intervals_to_query_per_predicate(name, intervals)
             queries.append((name, query))
         parsed_interval = self.parse_interval(rl)
-        query = f"SELECT * FROM {TIMEPOINTS_TABLE} WHERE {parsed_interval};"
-        queries.append((TIMEPOINTS_TABLE, query))
+        query = f"SELECT * FROM {self.timepoints_table} WHERE {parsed_interval};"
+        queries.append((self.timepoints_table, query))
         return queries
 
     def queries_from_dates(
@@ -1180,11 +2335,9 @@ class Monitor:
         """
         queries = []
         names = []
-        if os.path.exists(self.sig_json_path):
-            with open(self.sig_json_path) as f:
-                signature = json.load(f)
-                for predicate in signature:
-                    names.append(predicate["name"])
+        signature = self.get_parsed_signature()
+        if signature is not None:
+            names = signature.names()
 
         if start_date is not None and end_date is not None:
             # BETWEEN is inclusive
@@ -1196,10 +2349,11 @@ class Monitor:
         else:
             query_suffix = ""
 
-        names.append(TIMEPOINTS_TABLE)
         for predicate_name in names:
-            query = f"SELECT * FROM {predicate_name} {query_suffix};"
+            query = f"SELECT * FROM {self.table(predicate_name)} {query_suffix};"
             queries.append((predicate_name, query))
+        query = f"SELECT * FROM {self.timepoints_table} {query_suffix};"
+        queries.append((self.timepoints_table, query))
         return queries
 
     def get_events(
@@ -1217,6 +2371,10 @@ class Monitor:
         Returns:
             list: all events in the database
         """
+        try:
+            self.discard_partial_timepoints()
+        except ValueError as error:
+            return str(error)
         queries = []
         if relative_intervals is not None:
             queries = self.relative_intervals_to_query(relative_intervals)
@@ -1239,10 +2397,97 @@ class Monitor:
         self.write_server_log(f"    current timestamp: {self.most_recent_timestamp}")
         for predicate_name, query in queries:
             self.write_server_log(f"    running query: {query}")
-            response = self.db.run_query(query, select=True)
+            with tracer.span("replay query", predicate=predicate_name) as span:
+                response = self.db.run_query(query, select=True)
+                span.set(rows=len(response.get("response", ())))
             if 'error' in response.keys():
                 return response['error']
             results.append({predicate_name: response['response']})
 
         monpoly_log = self.db_response_to_timepoints(results)
         return monpoly_log
+
+    def export_events(
+        self, start_date=None, end_date=None, predicates=None, after=-1, limit=None, token=None
+    ):
+        """creates an exporter that streams the events in the database in batches
+
+        Args:
+            start_date (_type_, optional): Defaults to None.
+            end_date (_type_, optional): Defaults to None.
+            predicates (_type_, optional): names of the predicates to export,
+                all predicates if None. Defaults to None.
+            after (int, optional): only export time points after this one. Defaults to -1.
+            limit (_type_, optional): maximum number of time points. Defaults to None.
+            token (_type_, optional): continuation token of a previous export,
+                overrides all other arguments. Defaults to None.
+
+        Raises:
+            ValueError: if no signature is set or the token is malformed
+
+        Returns:
+            EventExporter: the exporter
+        """
+        signature = self.get_parsed_signature()
+        if signature is None:
+            raise ValueError("no signature set")
+        self.discard_partial_timepoints()
+        if token is not None:
+            return EventExporter.from_token(
+                self.db, self.timepoints_table, signature, token, self.table_prefix
+            )
+        return EventExporter(
+            self.db,
+            self.timepoints_table,
+            signature,
+            table_prefix=self.table_prefix,
+            start_date=start_date,
+            end_date=end_date,
+            predicates=predicates,
+            after=after,
+            limit=limit,
+        )
+
+    def export_columnar(
+        self, export_format: str, name: str, start_date=None, end_date=None, predicates=None
+    ) -> list:
+        """writes one Arrow IPC or Parquet file per predicate with its occurrences
+        in the given time range to the exports directory
+
+        Args:
+            export_format (str): "arrow" or "parquet"
+            name (str): name of the export, the files are written to
+                a subdirectory with this name
+            start_date (_type_, optional): Defaults to None.
+            end_date (_type_, optional): Defaults to None.
+            predicates (_type_, optional): names of the predicates to export,
+                all predicates if None. Defaults to None.
+
+        Raises:
+            ValueError: if no signature is set, the format is unknown or
+                pyarrow isn't installed
+
+        Returns:
+            list: paths to the written files
+        """
+        from columnar_export import ColumnarExporter
+
+        signature = self.get_parsed_signature()
+        if signature is None:
+            raise ValueError("no signature set")
+        self.discard_partial_timepoints()
+        exporter = ColumnarExporter(
+            self.db,
+            self.timepoints_table,
+            signature,
+            export_format,
+            table_prefix=self.table_prefix,
+            start_date=start_date,
+            end_date=end_date,
+            predicates=predicates,
+        )
+        directory = os.path.join(self.exports_dir, name)
+        self.clear_directory(directory)
+        paths = exporter.write(directory)
+        self.write_server_log(f"[export_columnar()] exported {exporter.exported} time points to {paths}")
+        return paths
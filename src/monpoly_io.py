@@ -0,0 +1,134 @@
+import os
+import selectors
+from time import monotonic
+
+# markers MonPoly prints after every time point and after the log file given with -log
+SEPARATOR = b"## reached separator ##"
+LOG_DONE = b"## Done with log file - waiting for stdin ##"
+# a command without effect on the monitor, MonPoly only reads it after loading
+# its state and the log file and acknowledges it with SEPARATOR
+MARKER_REQUEST = b"> get_pos < ;\n"
+READ_SIZE = 64 * 1024
+
+
+class MonpolyTimeout(TimeoutError):
+    """MonPoly didn't answer before the deadline"""
+
+
+class MonpolyExited(ConnectionError):
+    """MonPoly closed its pipes"""
+
+
+class MonpolyPipe:
+    """non-blocking access to the stdin and stdout of a MonPoly process
+
+    Output is read into a byte buffer that is scanned incrementally for
+    markers. While input is written, available output is read as well, so
+    that neither side blocks on a full pipe. Every operation takes a
+    deadline (a time.monotonic() value, None to wait indefinitely).
+    """
+
+    def __init__(self, process):
+        self.process = process
+        self.stdin = process.stdin.fileno()
+        self.stdout = process.stdout.fileno()
+        os.set_blocking(self.stdin, False)
+        os.set_blocking(self.stdout, False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.stdout, selectors.EVENT_READ)
+        self.buffer = bytearray()
+        # the buffer before this position doesn't contain the marker
+        self.scanned = 0
+
+    def close(self):
+        self.selector.close()
+
+    def select(self, deadline):
+        """
+        Raises:
+            MonpolyTimeout: if no pipe is ready before the deadline
+        """
+        timeout = None
+        if deadline is not None:
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                raise MonpolyTimeout("deadline exceeded")
+        ready = self.selector.select(timeout)
+        if not ready:
+            raise MonpolyTimeout("deadline exceeded")
+        return ready
+
+    def fill(self):
+        """reads the available output into the buffer
+
+        Raises:
+            MonpolyExited: if MonPoly closed its stdout
+        """
+        try:
+            data = os.read(self.stdout, READ_SIZE)
+        except BlockingIOError:
+            return
+        if not data:
+            raise MonpolyExited(f"monpoly exited with code {self.process.poll()}")
+        self.buffer += data
+
+    def send(self, data: bytes, deadline=None):
+        """writes the data to MonPoly's stdin
+
+        Raises:
+            MonpolyTimeout: if MonPoly doesn't accept the data before the deadline
+            MonpolyExited: if MonPoly closed its pipes
+        """
+        view = memoryview(data)
+        self.selector.register(self.stdin, selectors.EVENT_WRITE)
+        try:
+            while view:
+                for key, _ in self.select(deadline):
+                    if key.fd == self.stdout:
+                        self.fill()
+                        continue
+                    try:
+                        written = os.write(self.stdin, view)
+                    except BlockingIOError:
+                        continue
+                    except BrokenPipeError as error:
+                        raise MonpolyExited(f"monpoly exited: {error}") from error
+                    view = view[written:]
+        finally:
+            self.selector.unregister(self.stdin)
+
+    def read_until(self, marker: bytes, deadline=None) -> bytes:
+        """reads up to the next line containing the marker
+
+        Raises:
+            MonpolyTimeout: if the marker doesn't arrive before the deadline
+            MonpolyExited: if MonPoly closed its stdout
+
+        Returns:
+            bytes: the output before the marker, the marker line is consumed
+        """
+        while True:
+            index = self.buffer.find(marker, max(0, self.scanned - len(marker) + 1))
+            if index >= 0:
+                end = self.buffer.find(b"\n", index + len(marker))
+                if end >= 0:
+                    output = bytes(self.buffer[:index])
+                    del self.buffer[: end + 1]
+                    self.scanned = 0
+                    return output
+                # wait for the rest of the marker line
+                self.scanned = index
+            else:
+                self.scanned = len(self.buffer)
+            self.select(deadline)
+            self.fill()
+
+    def request(self, data: bytes, marker: bytes, deadline=None) -> bytes:
+        """sends the data and reads the output up to the marker"""
+        self.send(data, deadline)
+        return self.read_until(marker, deadline)
+
+    def marker_round_trip(self, deadline=None) -> bytes:
+        """waits until MonPoly has handled everything before the marker,
+        e.g. loading its state, see MARKER_REQUEST"""
+        return self.request(MARKER_REQUEST, SEPARATOR, deadline)
@@ -0,0 +1,233 @@
+import os
+import sys
+import threading
+from collections import Counter
+from time import monotonic
+
+# seconds between two samples of the sampling profiler
+SAMPLE_INTERVAL = 0.005
+# tracemalloc snapshots kept for diffs, the oldest one is dropped first
+MAX_SNAPSHOTS = 8
+# allocation sites reported per snapshot or diff
+TOP_ALLOCATIONS = 20
+
+
+class SamplingProfiler:
+    """samples the stacks of all threads of the process in a background
+    thread and aggregates them in the folded format of flamegraph.pl and
+    speedscope (`thread;outer;...;inner count` per line)
+
+    Nothing is sampled and no thread runs while the profiler is stopped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopping = threading.Event()
+        # guards the aggregated stacks, they are read while sampling
+        self.stacks_lock = threading.Lock()
+        self.interval = SAMPLE_INTERVAL
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    def start(self, interval: float = SAMPLE_INTERVAL) -> dict:
+        """starts sampling, the stacks of a previous run are discarded"""
+        with self.lock:
+            if self.running:
+                return {"error": "profiler is already running"}
+            if interval <= 0:
+                return {"error": f"invalid interval {interval}"}
+            self.interval = interval
+            self.stacks = Counter()
+            self.samples = 0
+            self.started_at = monotonic()
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self.run, name="sampling-profiler", daemon=True)
+            self.thread.start()
+        return {"started": True, "interval": interval}
+
+    def stop(self) -> dict:
+        with self.lock:
+            if not self.running:
+                return {"error": "profiler is not running"}
+            self.stopping.set()
+            self.thread.join()
+            self.thread = None
+            self.duration = monotonic() - self.started_at
+        return self.get_stats()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stopping.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            sample = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                sample.append(";".join(reversed(stack)))
+            with self.stacks_lock:
+                self.stacks.update(sample)
+                self.samples += 1
+
+    def folded(self) -> str:
+        """the sampled stacks so far, one `stack count` line per stack"""
+        with self.stacks_lock:
+            stacks = list(self.stacks.items())
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks))
+
+    def get_stats(self) -> dict:
+        duration = self.duration
+        if self.running:
+            duration = monotonic() - self.started_at
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "seconds": round(duration, 3),
+        }
+
+
+class AllocationProfiler:
+    """tracemalloc snapshots with their top allocation sites and the
+    differences between them
+
+    tracemalloc slows down every allocation, it is only started on request
+    and stopped again with stop().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshots = dict()
+        self.next_id = 0
+
+    def start(self, frames: int = 1) -> dict:
+        import tracemalloc
+
+        if tracemalloc.is_tracing():
+            return {"error": "tracemalloc is already tracing"}
+        tracemalloc.start(frames)
+        return {"tracing": True, "frames": frames}
+
+    def stop(self) -> dict:
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            return {"error": "tracemalloc is not tracing"}
+        tracemalloc.stop()
+        with self.lock:
+            self.snapshots.clear()
+        return {"tracing": False}
+
+    @staticmethod
+    def format_stats(stats: list, top: int) -> list:
+        return [
+            {
+                "site": str(stat.traceback),
+                "size": stat.size,
+                "count": stat.count,
+                "size diff": getattr(stat, "size_diff", None),
+                "count diff": getattr(stat, "count_diff", None),
+            }
+            for stat in stats[:top]
+        ]
+
+    def snapshot(self, top: int = TOP_ALLOCATIONS) -> dict:
+        """takes a snapshot, it can be compared to later ones with diff()"""
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            return {"error": "tracemalloc is not tracing, start it first"}
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),)
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            snapshot_id = self.next_id
+            self.next_id += 1
+            self.snapshots[snapshot_id] = snapshot
+            while len(self.snapshots) > MAX_SNAPSHOTS:
+                del self.snapshots[min(self.snapshots)]
+        return {
+            "snapshot": snapshot_id,
+            "traced bytes": current,
+            "peak traced bytes": peak,
+            "top": self.format_stats(snapshot.statistics("lineno"), top),
+        }
+
+    def diff(self, first: int, second: int, top: int = TOP_ALLOCATIONS) -> dict:
+        """the allocation sites that grew the most from the first to the second snapshot"""
+        with self.lock:
+            if first not in self.snapshots or second not in self.snapshots:
+                return {"error": f"unknown snapshot, available: {sorted(self.snapshots)}"}
+            old, new = self.snapshots[first], self.snapshots[second]
+        return {
+            "from": first,
+            "to": second,
+            "top": self.format_stats(new.compare_to(old, "lineno"), top),
+        }
+
+    def get_stats(self) -> dict:
+        import tracemalloc
+
+        return {"tracing": tracemalloc.is_tracing(), "snapshots": sorted(self.snapshots)}
+
+
+class Profiling:
+    """the profilers of a process"""
+
+    def __init__(self):
+        self.sampler = SamplingProfiler()
+        self.allocations = AllocationProfiler()
+
+    def get_stats(self) -> dict:
+        return {
+            "sampler": self.sampler.get_stats(),
+            "tracemalloc": self.allocations.get_stats(),
+            "process": process_usage(os.getpid()),
+        }
+
+
+def process_usage(pid) -> dict:
+    """CPU time and memory of a process, read from /proc (Linux only)
+
+    Returns:
+        dict: CPU seconds in user and kernel mode, resident and peak resident
+            set size in bytes, or an error message
+    """
+    try:
+        with open(f"/proc/{pid}/stat", encoding="utf-8") as stat_file:
+            # the command name in parentheses may contain spaces
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        memory = dict()
+        with open(f"/proc/{pid}/status", encoding="utf-8") as status_file:
+            for line in status_file:
+                key, _, value = line.partition(":")
+                if key in ("VmRSS", "VmHWM"):
+                    # reported in kB
+                    memory[key] = int(value.split()[0]) * 1024
+    except (OSError, IndexError, ValueError) as error:
+        return {"error": f"can't read /proc/{pid}: {error}"}
+    ticks = os.sysconf("SC_CLK_TCK")
+    return {
+        "pid": pid,
+        # fields 14 and 15 of /proc/<pid>/stat, counted after the command name
+        "user cpu seconds": int(fields[11]) / ticks,
+        "system cpu seconds": int(fields[12]) / ticks,
+        "rss bytes": memory.get("VmRSS"),
+        "peak rss bytes": memory.get("VmHWM"),
+    }
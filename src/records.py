@@ -0,0 +1,120 @@
+from operator import itemgetter
+
+
+class Timepoint:
+    """compact record of a single time point in the ingestion pipeline
+
+    The occurrences of a predicate are kept as the lists/tuples they were
+    decoded as, they are neither copied nor wrapped.
+    """
+    __slots__ = ("timestamp", "predicates", "monpoly_string", "rows", "skip", "time_point")
+
+    def __init__(self, timestamp: int, predicates: list, skip=None):
+        # time stamp in seconds since 1970-01-01 00:00:00
+        self.timestamp = timestamp
+        # list of (predicate name, list of occurrences)
+        self.predicates = predicates
+        self.monpoly_string = None
+        # (table, symbols, columns) ILP rows, without the time point column
+        self.rows = None
+        # reason why the time point is not sent to MonPoly or the database
+        self.skip = skip
+        # index of the time point, assigned once it is stored
+        self.time_point = None
+
+    @classmethod
+    def from_dict(cls, event: dict, timestamp: int) -> "Timepoint":
+        """creates a time point from its JSON representation
+        ({"timestamp": ..., "predicates": [{"name": ..., "occurrences": [...]}]})
+
+        Args:
+            event (dict): the JSON representation
+            timestamp (int): the time stamp in seconds
+
+        Returns:
+            Timepoint: the record, with `skip` set if a predicate has no name
+        """
+        predicates = []
+        for predicate in event.get("predicates", ()):
+            if "name" not in predicate:
+                return cls(timestamp, [], skip=f"predicate {predicate} has no name")
+            # predicate can be named without an occurrence
+            predicates.append((predicate["name"], predicate.get("occurrences", ())))
+        return cls(timestamp, predicates)
+
+    def to_dict(self) -> dict:
+        result = {
+            "timestamp-int": self.timestamp,
+            "predicates": [
+                {"name": name, "occurrences": occurrences}
+                for name, occurrences in self.predicates
+            ],
+        }
+        if self.time_point is not None:
+            result["timepoint"] = self.time_point
+        if self.skip is not None:
+            result["skip"] = self.skip
+        return result
+
+    def __repr__(self):
+        return f"Timepoint({self.timestamp}, {self.predicates}, skip={self.skip})"
+
+
+class RowLayout:
+    """precomputed mapping of the attributes of a predicate to the columns of
+    its table, split into SYMBOL and other columns
+    """
+    __slots__ = ("names", "symbol_names", "symbol_getter", "column_names", "column_getter")
+
+    def __init__(self, column_names: tuple, symbol_names=frozenset()):
+        self.names = tuple(column_names)
+        self.symbol_names = tuple(c for c in column_names if c in symbol_names)
+        self.column_names = tuple(c for c in column_names if c not in symbol_names)
+        self.symbol_getter = self.getter(
+            [i for i, c in enumerate(column_names) if c in symbol_names]
+        )
+        self.column_getter = self.getter(
+            [i for i, c in enumerate(column_names) if c not in symbol_names]
+        )
+
+    @staticmethod
+    def getter(indexes: list):
+        """a function returning the attributes at the given indexes as a tuple"""
+        if len(indexes) == 1:
+            index = indexes[0]
+            return lambda occurrence: (occurrence[index],)
+        return itemgetter(*indexes) if indexes else None
+
+    def split(self, occurrence) -> tuple:
+        """the symbols and columns of an ILP row for the given occurrence
+
+        Raises:
+            IndexError: if the occurrence has less attributes than the predicate
+
+        Returns:
+            tuple: (symbols dict or None, columns dict)
+        """
+        if self.symbol_getter is None:
+            return None, dict(zip(self.names, occurrence))
+        symbols = dict(zip(self.symbol_names, map(str, self.symbol_getter(occurrence))))
+        if self.column_getter is None:
+            return symbols, {}
+        return symbols, dict(zip(self.column_names, self.column_getter(occurrence)))
+
+
+def row_layouts(signature, symbol_columns: dict) -> dict:
+    """the row layouts of all predicates in the signature
+
+    Args:
+        signature (_type_): the parsed signature or None
+        symbol_columns (dict): see Schema.symbol_columns()
+
+    Returns:
+        dict: predicate name -> RowLayout
+    """
+    if signature is None:
+        return {}
+    return {
+        p.name: RowLayout(p.columns, symbol_columns.get(p.name, frozenset()))
+        for p in signature
+    }
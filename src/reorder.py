@@ -0,0 +1,127 @@
+import heapq
+import threading
+from itertools import count
+from time import monotonic
+
+# default number of seconds a time point may arrive late
+LATENESS = 5
+# default number of time points the buffer holds at most
+CAPACITY = 100_000
+
+
+class ReorderBuffer:
+    """orders the time points of multiple concurrent producers by time stamp
+    before they are sent to MonPoly
+
+    Time points are held in a min-heap and released once
+    - the time stamp is at least `lateness` seconds behind the most recent
+      time stamp seen from any producer,
+    - every known producer's watermark (its most recent time stamp, producers
+      send in order) has passed the time stamp, or
+    - the time point has been held for `lateness` seconds of wall clock time, or
+    - the buffer holds more than `capacity` time points, the oldest are
+      released early, so that a producer far ahead can't grow it without bound.
+    Time points older than the last released time stamp are too late.
+    """
+
+    def __init__(self, config=None):
+        self.enabled = False
+        self.lateness = LATENESS
+        self.capacity = CAPACITY
+        if config:
+            self.configure(config)
+        self.lock = threading.Lock()
+        # (time stamp, arrival order, arrival time, Timepoint)
+        self.heap = []
+        self.order = count()
+        self.watermarks = dict()
+        self.max_timestamp = None
+        self.released_up_to = None
+
+    def configure(self, config: dict):
+        """
+        Raises:
+            ValueError: if a setting is invalid
+        """
+        if "lateness" in config.keys():
+            self.lateness = int(config["lateness"])
+        if "capacity" in config.keys():
+            capacity = int(config["capacity"])
+            if capacity < 1:
+                raise ValueError(f"the capacity must be at least 1, got {capacity}")
+            self.capacity = capacity
+        if "enabled" in config.keys():
+            self.enabled = config["enabled"]
+
+    def get_config(self) -> dict:
+        return {"enabled": self.enabled, "lateness": self.lateness, "capacity": self.capacity}
+
+    def push(self, source: str, timepoints: list) -> list:
+        """adds the time points of a producer to the buffer
+
+        Args:
+            source (str): identifies the producer
+            timepoints (list): Timepoint records, skipped ones are ignored
+
+        Returns:
+            list: the time points that arrived too late, marked as skipped
+        """
+        late = []
+        now = monotonic()
+        with self.lock:
+            for timepoint in timepoints:
+                if timepoint.skip is not None:
+                    continue
+                ts = timepoint.timestamp
+                if self.released_up_to is not None and ts < self.released_up_to:
+                    timepoint.skip = f"arrived too late, time points up to {self.released_up_to} have already been released"
+                    late.append(timepoint)
+                    continue
+                heapq.heappush(self.heap, (ts, next(self.order), now, timepoint))
+                if self.watermarks.get(source, ts) <= ts:
+                    self.watermarks[source] = ts
+                if self.max_timestamp is None or ts > self.max_timestamp:
+                    self.max_timestamp = ts
+        return late
+
+    def pop_ready(self, force: bool = False) -> list:
+        """removes the time points that can be released from the buffer
+
+        Args:
+            force (bool, optional): release everything. Defaults to False.
+
+        Returns:
+            list: the released time points in time stamp order
+        """
+        released = []
+        now = monotonic()
+        with self.lock:
+            if not self.heap:
+                return released
+            bound = self.max_timestamp - self.lateness
+            if self.watermarks:
+                bound = max(bound, min(self.watermarks.values()))
+            while self.heap:
+                ts, _, arrival, timepoint = self.heap[0]
+                over_capacity = len(self.heap) > self.capacity
+                if not force and not over_capacity and ts > bound and now - arrival < self.lateness:
+                    break
+                heapq.heappop(self.heap)
+                released.append(timepoint)
+                self.released_up_to = ts
+        return released
+
+    def reset(self):
+        with self.lock:
+            self.heap = []
+            self.watermarks = dict()
+            self.max_timestamp = None
+            self.released_up_to = None
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {
+                "buffered": len(self.heap),
+                "watermarks": dict(self.watermarks),
+                "released up to": self.released_up_to,
+            }
@@ -0,0 +1,205 @@
+import os
+from datetime import datetime, timedelta
+from time import time
+
+# default number of seconds kept in addition to the furthest look-back
+SAFETY_HORIZON = 3600
+# default number of seconds between two runs of the retention manager
+RETENTION_INTERVAL = 600
+
+
+def partition_start(timestamp: datetime, partition_by: str):
+    """the start of the partition containing the time stamp
+
+    Args:
+        timestamp (datetime): a UTC time stamp
+        partition_by (str): the PARTITION BY unit of the table
+
+    Returns:
+        _type_: a datetime or None if the table isn't partitioned
+    """
+    unit = partition_by.upper()
+    if unit == "NONE":
+        return None
+    start = timestamp.replace(minute=0, second=0, microsecond=0)
+    if unit == "HOUR":
+        return start
+    start = start.replace(hour=0)
+    if unit == "DAY":
+        return start
+    if unit == "WEEK":
+        # QuestDB's weeks start on Monday
+        return start - timedelta(days=start.weekday())
+    if unit == "MONTH":
+        return start.replace(day=1)
+    if unit == "YEAR":
+        return start.replace(month=1, day=1)
+    raise ValueError(f"unknown partition unit {partition_by}")
+
+
+def interval_lookback(interval: str):
+    """how far back into the past a relative interval reaches
+
+    Args:
+        interval (str): a relative interval as returned by MonPoly (e.g. "[-20,0]")
+
+    Returns:
+        _type_: the look-back in seconds or None if the interval is unbounded
+    """
+    bounds = interval.strip()[1:-1].split(",")
+    lower = bounds[0].strip()
+    if lower.lstrip("-") == "*":
+        return None
+    return max(-int(lower), 0)
+
+
+def relative_intervals_lookback(relative_intervals: tuple):
+    """the furthest look-back of a policy given its relative intervals
+
+    Args:
+        relative_intervals (tuple): the result of Monitor.get_relative_intervals()
+
+    Returns:
+        _type_: the look-back in seconds or None if it is unbounded
+    """
+    rl, rls = relative_intervals
+    intervals = [rl] + [
+        masked["interval"] for predicate in rls for masked in predicate["intervals"]
+    ]
+    lookback = 0
+    for interval in intervals:
+        current = interval_lookback(interval)
+        if current is None:
+            return None
+        lookback = max(lookback, current)
+    return lookback
+
+
+class RetentionManager:
+    """keeps track of how much history the supported policies can reach and
+    when old partitions were last dropped
+    """
+
+    def __init__(self, config=None):
+        self.enabled = False
+        self.safety_horizon = SAFETY_HORIZON
+        self.interval = RETENTION_INTERVAL
+        # additional policies (besides the monitored one) that must remain replayable
+        self.policies = []
+        # everything before this time stamp has been dropped from the database
+        self.trimmed_before = None
+        # the horizon in seconds that was kept when history was last dropped
+        self.trimmed_horizon = None
+        self.last_run = 0.0
+        # policy path -> (modification time, look-back)
+        self.lookbacks = dict()
+        if config:
+            self.configure(config)
+
+    def configure(self, config: dict):
+        """
+        Raises:
+            ValueError: if a setting is invalid
+        """
+        if "enabled" in config.keys():
+            self.enabled = config["enabled"]
+        if "safety_horizon" in config.keys():
+            self.safety_horizon = int(config["safety_horizon"])
+        if "interval" in config.keys():
+            self.interval = int(config["interval"])
+        if "policies" in config.keys():
+            self.policies = list(config["policies"])
+        if "trimmed_before" in config.keys():
+            self.trimmed_before = config["trimmed_before"]
+        if "trimmed_horizon" in config.keys():
+            self.trimmed_horizon = config["trimmed_horizon"]
+
+    def get_config(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "safety_horizon": self.safety_horizon,
+            "interval": self.interval,
+            "policies": self.policies,
+            "trimmed_before": self.trimmed_before,
+            "trimmed_horizon": self.trimmed_horizon,
+        }
+
+    def due(self) -> bool:
+        """returns true if retention is enabled and the interval has passed"""
+        return self.enabled and time() - self.last_run >= self.interval
+
+    def policy_lookback(self, policy_path: str, get_relative_intervals):
+        """the look-back of the given policy, cached until the policy file changes
+
+        Args:
+            policy_path (str): path to a policy file
+            get_relative_intervals (_type_): function returning the relative
+                intervals of a policy file (Monitor.get_relative_intervals)
+
+        Returns:
+            _type_: the look-back in seconds or None if it is unbounded
+        """
+        mtime = os.path.getmtime(policy_path)
+        cached = self.lookbacks.get(policy_path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        lookback = relative_intervals_lookback(get_relative_intervals(policy_path))
+        self.lookbacks[policy_path] = (mtime, lookback)
+        return lookback
+
+    def horizon(self, policy_paths: list, get_relative_intervals):
+        """the number of seconds of history that must be kept
+
+        Args:
+            policy_paths (list): the monitored policy and other policies that
+                must remain replayable
+            get_relative_intervals (_type_): see policy_lookback()
+
+        Returns:
+            _type_: the horizon in seconds or None if history can't be dropped
+        """
+        horizon = 0
+        for path in policy_paths + self.policies:
+            if not os.path.exists(path):
+                continue
+            lookback = self.policy_lookback(path, get_relative_intervals)
+            if lookback is None:
+                return None
+            horizon = max(horizon, lookback)
+        return horizon + self.safety_horizon
+
+    def cutoff(self, most_recent_timestamp, horizon: int):
+        """the time stamp before which all history can be dropped
+
+        Args:
+            most_recent_timestamp (_type_): the most recent time stamp of the monitor
+            horizon (int): see horizon()
+
+        Returns:
+            _type_: a UTC datetime, comparable to the time_stamp columns in QuestDB
+        """
+        t = datetime.timestamp(most_recent_timestamp)
+        return datetime.utcfromtimestamp(t - horizon)
+
+    def drop_queries(self, tables: dict, cutoff: datetime) -> list:
+        """queries dropping all partitions that end before the cutoff
+
+        QuestDB drops every partition whose start matches the condition, so
+        the cutoff is moved back to the start of the partition containing it,
+        otherwise that partition would be dropped with the rows after the cutoff.
+
+        Args:
+            tables (dict): table name -> its PARTITION BY unit
+            cutoff (datetime): see cutoff()
+
+        Returns:
+            list: (table, query) for the partitioned tables
+        """
+        queries = []
+        for table, partition_by in tables.items():
+            start = partition_start(cutoff, partition_by)
+            if start is not None:
+                queries.append(
+                    (table, f"ALTER TABLE {table} DROP PARTITION WHERE time_stamp < '{start}';")
+                )
+        return queries
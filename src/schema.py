@@ -0,0 +1,176 @@
+import re
+from signature import Signature
+
+# above this many expected rows per day a table is partitioned by hour
+PARTITION_BY_HOUR_THRESHOLD = 10_000_000
+SYMBOL_CAPACITY = 256
+# entry of low_cardinality that stores every string attribute as SYMBOL
+ALL_COLUMNS = "*"
+PARTITION_UNITS = ("NONE", "HOUR", "DAY", "WEEK", "MONTH", "YEAR")
+
+CREATE_TABLE_PATTERN = re.compile(
+    r"^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\((.*)\)(.*)$",
+    re.IGNORECASE | re.DOTALL,
+)
+DESIGNATED_TIMESTAMP_PATTERN = re.compile(r"timestamp\s*\(\s*\w+\s*\)", re.IGNORECASE)
+PARTITION_PATTERN = re.compile(r"PARTITION\s+BY\s+\w+", re.IGNORECASE)
+DROP_TABLE_PATTERN = re.compile(r"(DROP\s+TABLE\s+(?:IF\s+EXISTS\s+)?)(\w+)", re.IGNORECASE)
+
+
+class Schema:
+    """post-processes the DDL generated by MonPoly (`monpoly -sql`) into a
+    QuestDB schema that can make use of partition pruning and indexes
+
+    - every table gets `time_stamp` as designated timestamp
+    - every table is partitioned by DAY or HOUR depending on the expected volume
+    - string attributes keep the column type generated by MonPoly, those listed
+      as low cardinality columns (e.g. "Q.x2", or "*" for all of them) are
+      stored as indexed SYMBOL columns with SYMBOL_CAPACITY distinct values,
+      unless they are also listed as high cardinality columns
+    """
+
+    def __init__(self, config=None):
+        self.expected_rows_per_day = 0
+        self.partition = None
+        self.low_cardinality = set()
+        self.high_cardinality = set()
+        self.symbol_capacity = SYMBOL_CAPACITY
+        if config:
+            if "low_cardinality" not in config.keys():
+                # configurations written before SYMBOL columns were opt-in
+                # created every string attribute as SYMBOL
+                config = dict(config, low_cardinality=[ALL_COLUMNS])
+            self.configure(config)
+
+    def configure(self, config: dict):
+        """
+        Raises:
+            ValueError: if a setting is invalid
+        """
+        if "expected_rows_per_day" in config.keys():
+            self.expected_rows_per_day = int(config["expected_rows_per_day"])
+        if "partition" in config.keys():
+            self.set_partition(config["partition"])
+        if "low_cardinality" in config.keys():
+            self.low_cardinality = set(config["low_cardinality"])
+        if "high_cardinality" in config.keys():
+            self.high_cardinality = set(config["high_cardinality"])
+        if "symbol_capacity" in config.keys():
+            self.symbol_capacity = int(config["symbol_capacity"])
+
+    def get_config(self) -> dict:
+        return {
+            "expected_rows_per_day": self.expected_rows_per_day,
+            "partition": self.partition,
+            "low_cardinality": sorted(self.low_cardinality),
+            "high_cardinality": sorted(self.high_cardinality),
+            "symbol_capacity": self.symbol_capacity,
+        }
+
+    def set_partition(self, partition):
+        """fixes the partition unit instead of deriving it from the expected volume
+
+        Args:
+            partition (_type_): one of PARTITION_UNITS or None to derive it
+        """
+        if partition is not None and partition.upper() not in PARTITION_UNITS:
+            raise ValueError(f"unknown partition unit {partition}")
+        self.partition = partition.upper() if partition is not None else None
+
+    def partition_by(self) -> str:
+        """the partition unit used for all tables"""
+        if self.partition is not None:
+            return self.partition
+        if self.expected_rows_per_day > PARTITION_BY_HOUR_THRESHOLD:
+            return "HOUR"
+        return "DAY"
+
+    def symbol_columns(self, signature: Signature) -> dict:
+        """the attribute columns that are stored as SYMBOL per predicate
+
+        Args:
+            signature (Signature): the signature of the monitor
+
+        Returns:
+            dict: predicate name -> frozenset of column names (e.g. {"Q": {"x2"}})
+        """
+        symbols = {}
+        if signature is None:
+            return symbols
+        all_columns = ALL_COLUMNS in self.low_cardinality
+        for predicate in signature:
+            symbols[predicate.name] = frozenset(
+                column
+                for column, t in zip(predicate.columns, predicate.types)
+                if t == "string"
+                and (all_columns or f"{predicate.name}.{column}" in self.low_cardinality)
+                and f"{predicate.name}.{column}" not in self.high_cardinality
+            )
+        return symbols
+
+    def rewrite(self, ddl: str, signature: Signature, table_prefix: str = "") -> str:
+        """rewrites all CREATE TABLE statements in the given DDL, other
+        statements are left as they are
+
+        Args:
+            ddl (str): semicolon separated SQL statements
+            signature (Signature): the signature the DDL was generated from
+            table_prefix (str, optional): prefix of the predicate tables. Defaults to "".
+
+        Returns:
+            str: the rewritten DDL
+        """
+        symbols = self.symbol_columns(signature)
+        statements = [s for s in ddl.split(";") if s.strip()]
+        rewritten = [
+            self.rewrite_create_table(s, symbols, table_prefix) for s in statements
+        ]
+        return "".join(f"{s.strip()};\n" for s in rewritten)
+
+    def rewrite_drop(self, ddl: str, signature: Signature, table_prefix: str = "") -> str:
+        """adds the table prefix to the predicate tables of DROP TABLE statements"""
+        if not table_prefix or signature is None:
+            return ddl
+        return DROP_TABLE_PATTERN.sub(
+            lambda m: m.group(1) + (table_prefix + m.group(2) if m.group(2) in signature else m.group(2)),
+            ddl,
+        )
+
+    def rewrite_create_table(self, statement: str, symbols: dict, table_prefix: str = "") -> str:
+        """rewrites a single CREATE TABLE statement
+
+        Args:
+            statement (str): a SQL statement without the trailing semicolon
+            symbols (dict): the symbol columns per predicate (see symbol_columns())
+            table_prefix (str, optional): prefix of the predicate tables. Defaults to "".
+
+        Returns:
+            str: the rewritten statement
+        """
+        match = CREATE_TABLE_PATTERN.match(statement)
+        if match is None:
+            return statement
+        table, body, suffix = match.groups()
+        table_symbols = symbols.get(table, frozenset())
+        if table in symbols:
+            table = table_prefix + table
+        columns = []
+        has_time_stamp = False
+        for column in (c.strip() for c in body.split(",") if c.strip()):
+            column_name = column.split()[0]
+            if column_name == "time_stamp":
+                has_time_stamp = True
+                column = "time_stamp TIMESTAMP"
+            elif column_name in table_symbols:
+                column = (
+                    f"{column_name} SYMBOL CAPACITY {self.symbol_capacity} CACHE INDEX"
+                )
+            columns.append(column)
+        if not has_time_stamp:
+            columns.append("time_stamp TIMESTAMP")
+        suffix = DESIGNATED_TIMESTAMP_PATTERN.sub("", suffix)
+        suffix = PARTITION_PATTERN.sub("", suffix).strip()
+        return (
+            f"CREATE TABLE {table}({', '.join(columns)}) timestamp(time_stamp) "
+            f"PARTITION BY {self.partition_by()} {suffix}"
+        )
@@ -0,0 +1,82 @@
+import re
+
+# MonPoly signatures declare one predicate per entry, e.g. `Q(x:int, y:string)`
+# or `Q(int, string)`. Argument names are optional, types are mandatory.
+PREDICATE_PATTERN = re.compile(r"([A-Za-z_][\w']*)\s*\(([^)]*)\)")
+MONPOLY_TYPES = ("int", "float", "string", "regexp")
+
+
+class Predicate:
+    """a single predicate of a MonPoly signature"""
+    __slots__ = ("name", "arg_names", "types", "columns")
+
+    def __init__(self, name: str, arg_names: tuple, types: tuple):
+        self.name = name
+        self.arg_names = arg_names
+        self.types = types
+        # column names of the attributes in the predicate's table (x1, x2, ...)
+        self.columns = tuple(f"x{i+1}" for i in range(len(types)))
+
+    @property
+    def arity(self) -> int:
+        return len(self.types)
+
+    def __repr__(self):
+        args = ", ".join(f"{n}:{t}" for n, t in zip(self.arg_names, self.types))
+        return f"{self.name}({args})"
+
+
+class Signature:
+    """parsed MonPoly signature, predicates are kept in declaration order"""
+
+    def __init__(self, predicates: list):
+        self.predicates = {p.name: p for p in predicates}
+
+    @classmethod
+    def from_text(cls, text: str) -> "Signature":
+        """parses the text of a MonPoly signature file
+
+        Args:
+            text (str): content of a `.sig` file
+
+        Raises:
+            ValueError: if an attribute has an unknown type
+
+        Returns:
+            Signature: the parsed signature
+        """
+        predicates = []
+        for name, args in PREDICATE_PATTERN.findall(text):
+            arg_names = []
+            types = []
+            for i, arg in enumerate(a.strip() for a in args.split(",") if a.strip()):
+                if ":" in arg:
+                    arg_name, arg_type = (s.strip() for s in arg.split(":", 1))
+                else:
+                    arg_name, arg_type = f"x{i+1}", arg
+                if arg_type not in MONPOLY_TYPES:
+                    raise ValueError(f"unknown type {arg_type} of predicate {name}")
+                arg_names.append(arg_name)
+                types.append(arg_type)
+            predicates.append(Predicate(name, tuple(arg_names), tuple(types)))
+        return cls(predicates)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Signature":
+        with open(path, "r", encoding="utf-8") as sig_file:
+            return cls.from_text(sig_file.read())
+
+    def names(self) -> list:
+        return list(self.predicates.keys())
+
+    def get(self, name: str):
+        return self.predicates.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.predicates
+
+    def __iter__(self):
+        return iter(self.predicates.values())
+
+    def __len__(self):
+        return len(self.predicates)
@@ -0,0 +1,79 @@
+import os
+import threading
+import zlib
+
+# characters of MonPoly's output kept for the status
+OUTPUT_TAIL_CHARS = 16 * 1024
+
+
+class StatusSnapshot:
+    """the state of a monitor shown by /status and the index page, kept in
+    memory so that polling it neither reads files nor queries the database
+
+    The parts that are read from disk or QuestDB (policy, signature,
+    monitorability and tables) are read again only after changed() was
+    called, the tail of MonPoly's output is appended to as it is written.
+    The ETag covers a version of these parts and the in-memory state, it
+    is computed without serializing the status.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # ETags of earlier processes never match
+        self.boot = os.urandom(4).hex()
+        # bumped whenever the policy, signature, monitorability or tables change
+        self.version = 0
+        self.files = None
+        self.files_version = -1
+        # None until the tail has been read from the log file once
+        self.output = None
+        self.output_count = 0
+
+    def changed(self):
+        with self.lock:
+            self.version += 1
+
+    def cached_files(self, read) -> dict:
+        """the parts read from disk, read again after a change
+
+        Args:
+            read (_type_): function returning the parts and whether they can
+                be cached, e.g. not if the database couldn't be reached
+        """
+        version = self.version
+        if self.files_version != version:
+            files, complete = read()
+            with self.lock:
+                # a change during the read is picked up by the next call
+                if complete and self.version == version:
+                    self.files, self.files_version = files, version
+            return files
+        return self.files
+
+    def add_output(self, text: str):
+        with self.lock:
+            if self.output is not None:
+                self.output = (self.output + text)[-OUTPUT_TAIL_CHARS:]
+            self.output_count += 1
+
+    def output_tail(self, path: str) -> str:
+        """the end of MonPoly's output, the log file is read on the first call"""
+        if self.output is None:
+            tail = ""
+            if os.path.exists(path):
+                with open(path, "rb") as log:
+                    log.seek(max(os.path.getsize(path) - OUTPUT_TAIL_CHARS, 0))
+                    tail = log.read().decode("utf-8", errors="replace")
+            with self.lock:
+                if self.output is None:
+                    self.output = tail
+        return self.output
+
+    def etag(self, state) -> str:
+        """the ETag of the status with the given in-memory state
+
+        Args:
+            state (_type_): the parts of the status that aren't versioned
+        """
+        key = repr((self.version, self.files_version, self.output_count, state)).encode("utf-8")
+        return f"{self.boot}-{zlib.crc32(key):08x}"
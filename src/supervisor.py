@@ -0,0 +1,158 @@
+from time import monotonic, time
+
+# default number of seconds MonPoly may take to answer a single time point
+HANG_TIMEOUT = 120
+# default number of seconds between checkpoints, 0 disables them
+CHECKPOINT_INTERVAL = 0
+# upper bound of the delay between restarts of a MonPoly that keeps crashing
+MAX_RESTART_DELAY = 300
+
+
+class Supervisor:
+    """detects a crashed (poll) or hung (heartbeat) MonPoly and keeps track
+    of the recoveries, the restart itself is done by Monitor.recover()
+
+    The heartbeat is the time the pending request to MonPoly was sent, a
+    request that takes longer than `hang_timeout` seconds counts as a hang.
+    """
+
+    def __init__(self, config=None):
+        self.enabled = True
+        self.hang_timeout = HANG_TIMEOUT
+        self.checkpoint_interval = CHECKPOINT_INTERVAL
+        if config:
+            self.configure(config)
+        # whether MonPoly is supposed to be running
+        self.expected = False
+        self.busy_since = None
+        # why MonPoly's output can't be trusted anymore, e.g. after a timeout
+        self.stalled = None
+        self.timeouts = 0
+        self.last_checkpoint = monotonic()
+        # consecutive failures without MonPoly answering in between
+        self.consecutive = 0
+        self.next_attempt = 0
+        self.detected_at = None
+        self.restarts = 0
+        self.last_failure = None
+        self.last_failure_time = None
+        self.last_recovery_seconds = None
+        self.max_recovery_seconds = None
+        # exceptions raised by steps of the maintenance thread
+        self.maintenance_errors = 0
+        self.last_maintenance_error = None
+
+    def configure(self, config: dict):
+        """
+        Raises:
+            ValueError: if a setting is invalid
+        """
+        if "enabled" in config.keys():
+            self.enabled = config["enabled"]
+        if "hang_timeout" in config.keys():
+            self.hang_timeout = int(config["hang_timeout"])
+        if "checkpoint_interval" in config.keys():
+            self.checkpoint_interval = int(config["checkpoint_interval"])
+
+    def get_config(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "hang_timeout": self.hang_timeout,
+            "checkpoint_interval": self.checkpoint_interval,
+        }
+
+    def started(self):
+        self.expected = True
+        self.busy_since = None
+        self.stalled = None
+
+    def stall(self, reason: str):
+        """MonPoly missed a deadline, it has to be restarted"""
+        self.stalled = reason
+        self.timeouts += 1
+
+    def stopped(self):
+        self.expected = False
+        self.busy_since = None
+        # a stalled MonPoly that was stopped by hand (e.g. with supervision
+        # disabled) doesn't block the next one
+        self.stalled = None
+
+    def begin(self):
+        """a request has been sent to MonPoly"""
+        self.busy_since = monotonic()
+
+    def end(self):
+        """MonPoly answered the pending request"""
+        self.busy_since = None
+        self.consecutive = 0
+
+    def failure(self, monpoly):
+        """
+        Args:
+            monpoly (_type_): the MonPoly process (Popen) or None
+
+        Returns:
+            _type_: the reason MonPoly has to be restarted or None
+        """
+        if not self.enabled or not self.expected or monpoly is None:
+            return None
+        if monotonic() < self.next_attempt:
+            return None
+        if self.stalled is not None:
+            return self.stalled
+        code = monpoly.poll()
+        if code is not None:
+            return f"monpoly exited with code {code}"
+        busy_since = self.busy_since
+        if busy_since is not None and monotonic() - busy_since > self.hang_timeout:
+            return f"monpoly didn't answer within {self.hang_timeout} seconds"
+        return None
+
+    def checkpoint_due(self) -> bool:
+        return (
+            self.enabled
+            and self.expected
+            and self.checkpoint_interval > 0
+            and monotonic() - self.last_checkpoint >= self.checkpoint_interval
+        )
+
+    def detected(self, reason: str):
+        self.detected_at = monotonic()
+        self.last_failure = reason
+        self.last_failure_time = time()
+        self.consecutive += 1
+        # a MonPoly that crashes again right away is restarted with a growing delay
+        self.next_attempt = self.detected_at + min(2 ** (self.consecutive - 1) - 1, MAX_RESTART_DELAY)
+
+    def recovered(self) -> float:
+        """
+        Returns:
+            float: seconds from the detection of the failure until MonPoly
+                accepted events again
+        """
+        elapsed = monotonic() - self.detected_at
+        self.detected_at = None
+        self.restarts += 1
+        self.last_recovery_seconds = elapsed
+        if self.max_recovery_seconds is None or elapsed > self.max_recovery_seconds:
+            self.max_recovery_seconds = elapsed
+        return elapsed
+
+    def maintenance_failed(self, error: str):
+        """a step of the maintenance thread raised, it is retried on the next tick"""
+        self.maintenance_errors += 1
+        self.last_maintenance_error = error
+
+    def get_stats(self) -> dict:
+        return {
+            "restarts": self.restarts,
+            "timeouts": self.timeouts,
+            "recovering": self.detected_at is not None,
+            "last failure": self.last_failure,
+            "last failure time": self.last_failure_time,
+            "crash to serving seconds": self.last_recovery_seconds,
+            "max crash to serving seconds": self.max_recovery_seconds,
+            "maintenance errors": self.maintenance_errors,
+            "last maintenance error": self.last_maintenance_error,
+        }
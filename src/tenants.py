@@ -0,0 +1,197 @@
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from time import monotonic
+from monitor import CONFIG_DIR, Monitor
+
+# tenant names end up in directory and table names
+TENANT_NAME = re.compile(r"[A-Za-z0-9_]{1,64}")
+# default number of tenants whose MonPoly process is kept running
+MAX_ACTIVE_TENANTS = 64
+# default number of seconds after which an unused tenant is evicted
+IDLE_TIMEOUT = 900
+
+
+class TenantRegistry:
+    """namespaced monitors served by one server, each tenant has its own
+    signature, policy, MonPoly process, data directory and table prefix
+
+    Monitors are started lazily on their first request. Tenants that weren't
+    used for `idle_timeout` seconds, or the least recently used ones once more
+    than `max_active` are running, are evicted: MonPoly saves its state and
+    exits, the next request restarts it from that checkpoint. All monitors
+    share the database connection pools and the ILP writer (see DbHelper).
+
+    get() counts a use of the tenant that has to be ended with release(),
+    tenants in use aren't evicted. Monitors are created and stopped outside
+    of the registry lock, under a lock of the tenant, so that starting or
+    evicting one tenant doesn't block the requests of the others.
+    """
+
+    def __init__(
+        self,
+        base_dir: str = os.path.join(CONFIG_DIR, "tenants"),
+        max_active: int = MAX_ACTIVE_TENANTS,
+        idle_timeout: int = IDLE_TIMEOUT,
+    ):
+        self.base_dir = base_dir
+        self.max_active = max_active
+        self.idle_timeout = idle_timeout
+        # guards active, users and tenant_locks, notified by release()
+        self.lock = threading.Condition()
+        # tenant -> (Monitor, last use), least recently used first
+        self.active = OrderedDict()
+        # tenant -> requests that use its monitor
+        self.users = Counter()
+        # tenant -> lock held while its monitor is started or stopped
+        self.tenant_locks = dict()
+        self.started = 0
+        self.evicted = 0
+
+    @staticmethod
+    def table_prefix(tenant: str) -> str:
+        return f"{tenant}__"
+
+    def tenant_dir(self, tenant: str) -> str:
+        return os.path.join(self.base_dir, tenant)
+
+    def tenant_lock(self, tenant: str) -> threading.Lock:
+        with self.lock:
+            return self.tenant_locks.setdefault(tenant, threading.Lock())
+
+    def use(self, tenant: str):
+        """
+        Returns:
+            _type_: the active monitor of the tenant, with one more use, or None
+        """
+        with self.lock:
+            if tenant not in self.active:
+                return None
+            monitor, _ = self.active.pop(tenant)
+            self.active[tenant] = (monitor, monotonic())
+            self.users[tenant] += 1
+            return monitor
+
+    def get(self, tenant: str) -> Monitor:
+        """the monitor of the tenant, started from its checkpoint if necessary,
+        the caller has to release() it once the request is done
+
+        Raises:
+            ValueError: if the tenant name is invalid
+        """
+        if not TENANT_NAME.fullmatch(tenant):
+            raise ValueError(f"invalid tenant name {tenant}, use letters, digits and _")
+        monitor = self.use(tenant)
+        if monitor is not None:
+            return monitor
+        with self.tenant_lock(tenant):
+            # started by another request in the meantime
+            monitor = self.use(tenant)
+            if monitor is not None:
+                return monitor
+            monitor = Monitor(self.tenant_dir(tenant), self.table_prefix(tenant))
+            monitor.launch_in_background()
+            monitor.write_server_log(f"[TenantRegistry.get()] starting tenant {tenant}")
+            with self.lock:
+                self.started += 1
+                self.active[tenant] = (monitor, monotonic())
+                self.users[tenant] += 1
+                overflow = len(self.active) - self.max_active
+        if overflow > 0:
+            self.evict_least_recently_used(overflow, keep=tenant)
+        return monitor
+
+    def release(self, tenant: str):
+        """ends a use of the tenant started by get()"""
+        with self.lock:
+            self.users[tenant] -= 1
+            if self.users[tenant] <= 0:
+                del self.users[tenant]
+            self.lock.notify_all()
+
+    def evict(self, tenant: str, blocking: bool = True) -> dict:
+        """stops the tenant's MonPoly and saves its state
+
+        Args:
+            tenant (str): the tenant to evict
+            blocking (bool, optional): wait for requests of the tenant to finish,
+                otherwise tenants in use aren't evicted. Defaults to True.
+
+        Returns:
+            dict: JSON style status message
+        """
+        # a request for the tenant waits until its state is saved, instead
+        # of starting a second MonPoly from the old state
+        with self.tenant_lock(tenant):
+            with self.lock:
+                if blocking:
+                    self.lock.wait_for(lambda: self.users[tenant] <= 0 or tenant not in self.active)
+                if tenant not in self.active:
+                    return {"error": f"tenant {tenant} is not active"}
+                if self.users[tenant] > 0:
+                    return {"error": f"tenant {tenant} is busy"}
+                monitor, _ = self.active.pop(tenant)
+                self.evicted += 1
+            stop_log = monitor.stop_monpoly(save_state=True)
+        monitor.write_server_log(f"[TenantRegistry.evict()] evicted tenant {tenant}: {stop_log}")
+        return {"evicted": tenant} | stop_log
+
+    def evict_least_recently_used(self, count: int, keep: str = None):
+        with self.lock:
+            candidates = [t for t in self.active if t != keep]
+        for tenant in candidates:
+            if count <= 0:
+                break
+            if "evicted" in self.evict(tenant, blocking=False):
+                count -= 1
+
+    def evict_idle(self) -> list:
+        """evicts the tenants that weren't used for idle_timeout seconds
+
+        Returns:
+            list: the evicted tenants
+        """
+        now = monotonic()
+        with self.lock:
+            idle = [
+                t for t, (_, last_use) in self.active.items()
+                if now - last_use >= self.idle_timeout
+            ]
+        return [t for t in idle if "evicted" in self.evict(t, blocking=False)]
+
+    def monitors(self) -> list:
+        """the monitors of the active tenants"""
+        with self.lock:
+            return [monitor for monitor, _ in self.active.values()]
+
+    def stop_all(self):
+        with self.lock:
+            tenants = list(self.active)
+        for tenant in tenants:
+            self.evict(tenant)
+
+    def known(self) -> list:
+        """all tenants with a data directory, active or not"""
+        if not os.path.isdir(self.base_dir):
+            return []
+        return sorted(
+            t for t in os.listdir(self.base_dir)
+            if os.path.isdir(os.path.join(self.base_dir, t))
+        )
+
+    def get_stats(self) -> dict:
+        now = monotonic()
+        with self.lock:
+            active = {
+                t: {"idle seconds": round(now - last_use, 1), "pid": monitor.get_monpoly_pid()}
+                for t, (monitor, last_use) in self.active.items()
+            }
+        return {
+            "active": active,
+            "known": self.known(),
+            "max active": self.max_active,
+            "idle timeout": self.idle_timeout,
+            "started": self.started,
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,268 @@
+import contextvars
+import json
+import os
+import random
+import threading
+from contextlib import contextmanager
+from time import time_ns
+
+# requests that take at least this many seconds are always kept
+TRACE_SLOW_SECONDS = 0.5
+# fraction of the other requests that is kept
+TRACE_SAMPLE_RATE = 0.01
+# spans recorded per trace, e.g. one per MonPoly round trip, later ones are counted only
+MAX_SPANS = 10000
+# the trace file is rotated (to <file>.1) once it is larger
+MAX_TRACE_FILE_BYTES = 100 * 1024 * 1024
+TRACE_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "monitor-data",
+    "backend-data",
+    "traces.jsonl",
+)
+
+# the innermost open span of the current thread (or context)
+current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """the spans of one request in one process"""
+    __slots__ = ("trace_id", "spans", "dropped")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans = []
+        self.dropped = 0
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attributes", "error")
+
+    def __init__(self, trace: Trace, name: str, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time_ns()
+        self.end = None
+        self.attributes = attributes or {}
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, message: str):
+        """marks the span as failed without an exception, e.g. for an error response"""
+        self.error = message
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": otlp_attributes(self.attributes),
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class NullSpan:
+    """stands in for a span while no request is traced"""
+
+    def set(self, **attributes):
+        pass
+
+    def fail(self, message: str):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def otlp_attributes(attributes: dict) -> list:
+    result = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        result.append({"key": key, "value": typed})
+    return result
+
+
+class Tracer:
+    """records a tree of spans per traced request and writes the traces
+    that are kept to a local file, one OTLP/JSON ExportTraceServiceRequest
+    per line (e.g. for the OpenTelemetry collector's file receiver)
+
+    Sampling is tail-based: the decision is made when the root span ends,
+    slow requests (`slow_seconds`) and failed ones are always kept, the
+    others with probability `sample_rate`. While tracing is disabled or
+    outside of a traced request span() does nothing.
+
+    The spans of a request that is handled by the engine process (see
+    engine.py) continue its trace there, each process samples and writes
+    its own part.
+    """
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.enabled = os.environ.get("MONPOLY_TRACING", "") not in ("", "0")
+        self.slow_seconds = float(os.environ.get("MONPOLY_TRACE_SLOW_SECONDS", TRACE_SLOW_SECONDS))
+        self.sample_rate = float(os.environ.get("MONPOLY_TRACE_SAMPLE_RATE", TRACE_SAMPLE_RATE))
+        self.path = os.environ.get("MONPOLY_TRACE_FILE", path)
+        self.lock = threading.Lock()
+        self.traces = 0
+        self.kept = 0
+
+    def get_config(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "slow_seconds": self.slow_seconds,
+            "sample_rate": self.sample_rate,
+            "path": self.path,
+        }
+
+    def get_stats(self) -> dict:
+        return {"traces": self.traces, "kept": self.kept}
+
+    def configure(self, enabled=None, slow_seconds=None, sample_rate=None) -> dict:
+        """
+        Raises:
+            ValueError: if the sample rate isn't between 0 and 1
+        """
+        if sample_rate is not None:
+            if not 0 <= sample_rate <= 1:
+                raise ValueError(f"invalid sample rate {sample_rate}")
+            self.sample_rate = sample_rate
+        if slow_seconds is not None:
+            self.slow_seconds = slow_seconds
+        if enabled is not None:
+            self.enabled = enabled
+        return self.get_config()
+
+    @staticmethod
+    def context():
+        """(trace id, span id) of the current span to continue the trace in
+        another process, None outside of a traced request"""
+        span = current_span.get()
+        if span is None:
+            return None
+        return (span.trace.trace_id, span.span_id)
+
+    @contextmanager
+    def trace(self, name: str, context=None, **attributes):
+        """the root span of a request, or a child of the current span if a
+        trace is already open
+
+        Args:
+            name (str): name of the span
+            context (_type_, optional): (trace id, parent span id) from context()
+                of the calling process. Defaults to None.
+        """
+        parent = current_span.get()
+        if parent is not None:
+            with self.span(name, **attributes) as span:
+                yield span
+            return
+        if not self.enabled:
+            yield NULL_SPAN
+            return
+        if context is not None:
+            trace_id, parent_id = context
+        else:
+            trace_id, parent_id = os.urandom(16).hex(), None
+        trace = Trace(trace_id)
+        root = Span(trace, name, parent_id, attributes)
+        trace.spans.append(root)
+        token = current_span.set(root)
+        try:
+            yield root
+        except BaseException as error:
+            root.error = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            current_span.reset(token)
+            root.end = time_ns()
+            self.finish(trace, root)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """a child of the current span, nothing is recorded outside of a trace"""
+        parent = current_span.get()
+        if parent is None:
+            yield NULL_SPAN
+            return
+        trace = parent.trace
+        if len(trace.spans) >= MAX_SPANS:
+            trace.dropped += 1
+            yield NULL_SPAN
+            return
+        span = Span(trace, name, parent.span_id, attributes)
+        trace.spans.append(span)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.error = f"{type(error).__name__}: {error}"
+            raise
+        finally:
+            current_span.reset(token)
+            span.end = time_ns()
+
+    def finish(self, trace: Trace, root: Span):
+        """the tail-based sampling decision"""
+        self.traces += 1
+        slow = (root.end - root.start) / 1e9 >= self.slow_seconds
+        failed = any(span.error for span in trace.spans)
+        if not (slow or failed or random.random() < self.sample_rate):
+            return
+        if trace.dropped:
+            root.attributes["spans.dropped"] = trace.dropped
+        self.export(trace)
+        self.kept += 1
+
+    def export(self, trace: Trace):
+        for span in trace.spans:
+            if span.end is None:
+                # still open in another thread, e.g. a daemon that outlived the request
+                span.end = time_ns()
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": otlp_attributes(
+                            {"service.name": "monpoly-server", "process.pid": os.getpid()}
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "monpoly-server"},
+                            "spans": [span.to_otlp() for span in trace.spans],
+                        }
+                    ],
+                }
+            ]
+        }
+        line = json.dumps(request) + "\n"
+        with self.lock:
+            try:
+                if os.path.getsize(self.path) > MAX_TRACE_FILE_BYTES:
+                    os.replace(self.path, self.path + ".1")
+            except OSError:
+                pass
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as trace_file:
+                trace_file.write(line)
+
+
+# one tracer per process
+tracer = Tracer()
@@ -0,0 +1,70 @@
+LIST_TYPES = (list, tuple)
+# python types accepted for attributes of the MonPoly types,
+# exact type checks, so that booleans aren't accepted as integers
+PYTHON_TYPES = {
+    "int": (int,),
+    "float": (float, int),
+    "string": (str,),
+    "regexp": (str,),
+}
+
+
+class PredicateValidator:
+    """checks the occurrences of one predicate against its arity and types"""
+    __slots__ = ("name", "arity", "types", "type_names")
+
+    def __init__(self, predicate):
+        self.name = predicate.name
+        self.arity = predicate.arity
+        self.types = tuple(PYTHON_TYPES[t] for t in predicate.types)
+        self.type_names = predicate.types
+
+    def check(self, occurrences):
+        """returns an error message for the first invalid occurrence or None"""
+        if type(occurrences) not in LIST_TYPES:
+            return f"occurrences of {self.name} must be a list, got {occurrences}"
+        arity = self.arity
+        types = self.types
+        for occurrence in occurrences:
+            if type(occurrence) not in LIST_TYPES or len(occurrence) != arity:
+                return f"{self.name} expects {arity} attributes, got {occurrence}"
+            for i, (value, accepted) in enumerate(zip(occurrence, types)):
+                if type(value) not in accepted:
+                    return f"attribute x{i+1} of {self.name} must be of type {self.type_names[i]}, got {value!r} in {occurrence}"
+        return None
+
+
+class Validator:
+    """validates Timepoint records against the signature before they are
+    encoded and sent to MonPoly, compiled once per signature
+    """
+
+    def __init__(self, signature):
+        self.predicates = dict()
+        if signature is not None:
+            for predicate in signature:
+                self.predicates[predicate.name] = PredicateValidator(predicate)
+
+    def validate(self, timepoints: list) -> list:
+        """marks every invalid time point as skipped with a precise error
+
+        Args:
+            timepoints (list): Timepoint records
+
+        Returns:
+            list: the same records
+        """
+        predicates = self.predicates
+        for index, timepoint in enumerate(timepoints):
+            if timepoint.skip is not None:
+                continue
+            for name, occurrences in timepoint.predicates:
+                validator = predicates.get(name)
+                if validator is None:
+                    error = f"unknown predicate {name}"
+                else:
+                    error = validator.check(occurrences)
+                if error is not None:
+                    timepoint.skip = f"time point {index} of the batch: {error}"
+                    break
+        return timepoints
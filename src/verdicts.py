@@ -0,0 +1,304 @@
+import hashlib
+import re
+from datetime import datetime
+from typing import NamedTuple
+from export import LOG_TIMESTAMP_FORMAT, decode_token, encode_token, token_int, token_timestamp
+
+# name of the verdict table, prefixed with the table prefix of the monitor
+VERDICTS_TABLE = "verdicts"
+# default number of verdicts per page of the /verdicts API
+VERDICT_PAGE_SIZE = 1000
+# e.g. "@1307955600 (time point 2): (1,"a") (2,"b")" or "@1307955600 (time point 2): true"
+VERDICT_LINE = re.compile(r"^@(\d+(?:\.\d+)?) \(time point (\d+)\):(.*)$", re.MULTILINE)
+# a tuple of values, strings are quoted and may contain commas and parentheses
+VERDICT_TUPLE = re.compile(r'\(((?:[^()"]|"[^"]*")*)\)')
+VERDICT_VALUE = re.compile(r'"[^"]*"|[^,]+')
+# printed by `monpoly -check`
+FREE_VARIABLES = re.compile(r"free variables is: \(([^)]*)\)")
+
+
+class Verdict(NamedTuple):
+    """a verdict of MonPoly, the variable bindings of a satisfying (or for a
+    negated policy violating) assignment, empty for closed formulas"""
+    timestamp: float
+    time_point: int
+    bindings: tuple
+
+
+def free_variables(check_output: str) -> tuple:
+    """the free variables of the policy in the order MonPoly prints their values
+
+    Args:
+        check_output (str): output of `monpoly -check`
+    """
+    match = FREE_VARIABLES.search(check_output)
+    if match is None:
+        return ()
+    return tuple(v.strip() for v in match.group(1).split(",") if v.strip())
+
+
+def policy_id(policy: str, negate: bool) -> str:
+    """identifies the verdicts of a policy in the verdict table"""
+    text = ("-negate " if negate else "") + policy.strip()
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def quote(value) -> str:
+    """a SQL string literal"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def verdict_table_ddl(table: str, partition_by: str, symbol_capacity: int) -> str:
+    """one row per variable binding of a verdict, so that bindings can be
+    filtered with the symbol indexes (closed formulas have a single row
+    without variable)"""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table}("
+        f"policy SYMBOL CAPACITY 256 CACHE INDEX, "
+        f"verdict LONG, "
+        f"time_point LONG, "
+        f"position INT, "
+        f"variable SYMBOL CAPACITY 256 CACHE INDEX, "
+        f"value SYMBOL CAPACITY {symbol_capacity} CACHE INDEX, "
+        f"time_stamp TIMESTAMP"
+        f") timestamp(time_stamp) PARTITION BY {partition_by};"
+    )
+
+
+class VerdictParser:
+    """parses the verdicts in MonPoly's output and writes them to the verdict
+    table, one ILP row per variable binding"""
+
+    def __init__(self, policy: str, variables: tuple):
+        self.policy = policy
+        self.variables = variables
+
+    @staticmethod
+    def parse(output: str, offset: int = 0) -> list:
+        """
+        Args:
+            output (str): MonPoly's output for one or more time points
+            offset (int, optional): server time point of MonPoly's time point 0,
+                see Monitor.monpoly_offset. Defaults to 0.
+
+        Returns:
+            list: Verdict records with the server's time points, in the order
+                MonPoly printed them
+        """
+        verdicts = []
+        for match in VERDICT_LINE.finditer(output):
+            timestamp = float(match.group(1))
+            time_point = int(match.group(2)) + offset
+            rest = match.group(3).strip()
+            if rest == "true":
+                verdicts.append(Verdict(timestamp, time_point, ()))
+                continue
+            for values in VERDICT_TUPLE.findall(rest):
+                bindings = tuple(
+                    v.strip().strip('"') for v in VERDICT_VALUE.findall(values)
+                )
+                verdicts.append(Verdict(timestamp, time_point, bindings))
+        return verdicts
+
+    def rows(self, verdict: Verdict, verdict_id: int) -> list:
+        """the (symbols, columns) of the rows storing the verdict"""
+        columns = {"verdict": verdict_id, "time_point": verdict.time_point}
+        if not verdict.bindings:
+            return [({"policy": self.policy}, columns | {"position": 0})]
+        rows = []
+        for position, value in enumerate(verdict.bindings):
+            variable = (
+                self.variables[position] if position < len(self.variables) else f"_{position}"
+            )
+            rows.append(
+                (
+                    {"policy": self.policy, "variable": variable, "value": value},
+                    columns | {"position": position},
+                )
+            )
+        return rows
+
+    def add_rows(self, buf, table: str, verdicts: list, first_id: int) -> int:
+        """adds the verdicts to the ILP buffer, with consecutive ids
+
+        Returns:
+            int: the id of the next verdict
+        """
+        verdict_id = first_id
+        for verdict in verdicts:
+            at = datetime.fromtimestamp(verdict.timestamp)
+            for symbols, columns in self.rows(verdict, verdict_id):
+                buf.row(table, symbols=symbols, columns=columns, at=at)
+            verdict_id += 1
+        return verdict_id
+
+
+class VerdictQuery:
+    """a page of the verdicts in the verdict table
+
+    Candidates are found with the indexes of the verdict table: the rows of
+    the first binding filter, or the first row of every verdict without
+    filters. The other filters are applied to the candidates, then all
+    bindings of the remaining verdicts are fetched. Pages are paginated on
+    (time_stamp, verdict) like EventExporter, so each page only reads the
+    partitions it needs.
+    """
+
+    def __init__(
+        self,
+        db,
+        table: str,
+        policy=None,
+        start_date=None,
+        end_date=None,
+        bindings=None,
+        after: int = -1,
+        after_timestamp=None,
+        limit: int = VERDICT_PAGE_SIZE,
+    ):
+        self.db = db
+        self.table = table
+        self.policy = policy
+        self.start_date = str(start_date) if start_date is not None else None
+        self.end_date = str(end_date) if end_date is not None else None
+        # list of (variable, value) pairs, all have to match
+        self.bindings = [tuple(b) for b in bindings or []]
+        self.after = after
+        self.after_timestamp = after_timestamp
+        self.limit = limit
+
+    @classmethod
+    def from_token(cls, db, table: str, token: str):
+        """
+        Raises:
+            ValueError: if the token is malformed or one of its fields has the
+                wrong type
+        """
+        state = decode_token(token)
+        if not isinstance(state, dict):
+            raise ValueError(f"invalid continuation token: {token}")
+        policy = state.get("policy")
+        if policy is not None and not isinstance(policy, str):
+            raise ValueError("invalid continuation token: policy must be a string")
+        bindings = state.get("bindings")
+        if bindings is not None and not (
+            isinstance(bindings, list)
+            and all(
+                isinstance(b, list) and len(b) == 2 and all(isinstance(x, str) for x in b)
+                for b in bindings
+            )
+        ):
+            raise ValueError("invalid continuation token: bindings must be (variable, value) pairs")
+        return cls(
+            db,
+            table,
+            policy=policy,
+            start_date=token_timestamp(state, "start"),
+            end_date=token_timestamp(state, "end"),
+            bindings=bindings,
+            after=token_int(state, "after", -1),
+            after_timestamp=token_timestamp(state, "after_timestamp"),
+            limit=token_int(state, "limit", VERDICT_PAGE_SIZE, minimum=1),
+        )
+
+    def continuation_token(self) -> str:
+        return encode_token(
+            {
+                "policy": self.policy,
+                "start": self.start_date,
+                "end": self.end_date,
+                "bindings": self.bindings,
+                "after": self.after,
+                "after_timestamp": self.after_timestamp,
+                "limit": self.limit,
+            }
+        )
+
+    @staticmethod
+    def binding_condition(binding: tuple) -> str:
+        variable, value = binding
+        return f"variable = {quote(variable)} AND value = {quote(value)}"
+
+    def candidates_query(self) -> str:
+        conditions = [f"verdict > {self.after}"]
+        if self.bindings:
+            conditions.append(self.binding_condition(self.bindings[0]))
+        else:
+            conditions.append("position = 0")
+        if self.policy is not None:
+            conditions.append(f"policy = {quote(self.policy)}")
+        if self.after_timestamp is not None:
+            conditions.append(f"time_stamp >= '{self.after_timestamp}'")
+        if self.start_date is not None:
+            conditions.append(f"time_stamp >= '{self.start_date}'")
+        if self.end_date is not None:
+            conditions.append(f"time_stamp <= '{self.end_date}'")
+        return (
+            f"SELECT verdict, time_stamp FROM {self.table} "
+            f"WHERE {' AND '.join(conditions)} ORDER BY time_stamp, verdict LIMIT {self.limit};"
+        )
+
+    def page(self) -> dict:
+        """
+        Raises:
+            psycopg2.DatabaseError: if the query fails
+
+        Returns:
+            dict: JSON style response with the verdicts and a continuation
+                token if there may be more
+        """
+        with self.db.connection() as connection:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute(self.candidates_query())
+            candidates = cursor.fetchall()
+            verdicts = []
+            if candidates:
+                first_ts = candidates[0][1]
+                last_ts = candidates[-1][1]
+                window = f"time_stamp BETWEEN '{first_ts}' AND '{last_ts}'"
+                ids = [row[0] for row in candidates]
+                for binding in self.bindings[1:]:
+                    if not ids:
+                        break
+                    cursor.execute(
+                        f"SELECT verdict FROM {self.table} WHERE {window} "
+                        f"AND {self.binding_condition(binding)} "
+                        f"AND verdict IN ({', '.join(map(str, ids))});"
+                    )
+                    matching = {row[0] for row in cursor.fetchall()}
+                    ids = [i for i in ids if i in matching]
+                if ids:
+                    cursor.execute(
+                        f"SELECT verdict, policy, time_point, time_stamp, position, variable, value "
+                        f"FROM {self.table} WHERE {window} "
+                        f"AND verdict IN ({', '.join(map(str, ids))});"
+                    )
+                    verdicts = self.group(cursor.fetchall(), ids)
+                self.after = candidates[-1][0]
+                self.after_timestamp = str(last_ts)
+            cursor.close()
+        response = {"verdicts": verdicts}
+        if len(candidates) >= self.limit:
+            response["continuation"] = self.continuation_token()
+        return response
+
+    @staticmethod
+    def group(rows: list, ids: list) -> list:
+        """groups the binding rows by verdict, in the order of the ids"""
+        verdicts = {}
+        for verdict, policy, time_point, ts, position, variable, value in sorted(
+            rows, key=lambda row: row[4]
+        ):
+            if verdict not in verdicts:
+                verdicts[verdict] = {
+                    "verdict": verdict,
+                    "policy": policy,
+                    "timepoint": time_point,
+                    "timestamp-int": int(ts.timestamp()),
+                    "timestamp": ts.strftime(LOG_TIMESTAMP_FORMAT),
+                    "bindings": {},
+                }
+            if variable is not None:
+                verdicts[verdict]["bindings"][variable] = value
+        return [verdicts[i] for i in ids if i in verdicts]
@@ -0,0 +1,121 @@
+from time import monotonic, sleep
+
+# default number of seconds to wait for written time points to become visible
+VISIBILITY_TIMEOUT = 10.0
+# bounds of the exponential backoff between two visibility probes
+PROBE_DELAY_MIN = 0.005
+PROBE_DELAY_MAX = 0.1
+# metadata table with one row per committed flush, the most recent one is
+# read with `LIMIT -1`, which doesn't depend on the size of the table
+WATERMARK_TABLE = "watermark"
+# the watermark table is always partitioned, independently of the schema, so
+# that the rows of older flushes can be dropped, see Monitor.trim_watermark()
+WATERMARK_PARTITION_BY = "DAY"
+# seconds between two trims of the watermark table
+WATERMARK_TRIM_INTERVAL = 3600
+
+
+def watermark_table_ddl(table: str) -> str:
+    """the watermark table is created explicitly, a table created by ILP
+    would name its designated timestamp `timestamp` instead of `time_stamp`"""
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table}("
+        f"sequence LONG, "
+        f"time_point LONG, "
+        f"time_stamp TIMESTAMP"
+        f") timestamp(time_stamp) PARTITION BY {WATERMARK_PARTITION_BY};"
+    )
+
+
+class CommitWatermark:
+    """tracks the highest time point that has been handed to QuestDB and the
+    highest time point that is known to be visible to SQL queries
+
+    ILP writes are acknowledged by a successful flush, but they only become
+    visible to queries once QuestDB has committed them. `wait_visible()`
+    bridges the gap with a cheap probe instead of letting clients retry.
+
+    Every flush also writes its sequence number, last time point and time
+    stamp to the watermark table, `committed` caches the latest of them so
+    that the most recent time point and time stamp in the database are
+    known without a query.
+    """
+
+    def __init__(self):
+        # highest time point of a successful ILP flush
+        self.flushed = -1
+        # highest time point confirmed to be visible by a probe
+        self.visible = -1
+        # (sequence, time point, time stamp) of the latest committed flush,
+        # replaced as a whole so that readers never see a partial update
+        self.committed = None
+        # whether `committed` reflects the watermark table, see Monitor.get_watermark()
+        self.loaded = False
+        # monotonic time of the last trim of the watermark table
+        self.last_trim = monotonic()
+
+    def reset(self, time_point: int = -1):
+        self.flushed = time_point
+        self.visible = time_point
+        self.committed = None
+        # a reset watermark (e.g. after deleting the database) is known
+        self.loaded = True
+
+    def flushed_up_to(self, time_point: int):
+        self.flushed = max(self.flushed, time_point)
+
+    @property
+    def sequence(self) -> int:
+        """number of the latest committed flush, 0 if there was none"""
+        committed = self.committed
+        return committed[0] if committed is not None else 0
+
+    def commit(self, sequence: int, time_point: int, timestamp: int):
+        """records a flush of the time points up to time_point that succeeded
+
+        Args:
+            sequence (int): sequence number of the flush
+            time_point (int): the last time point of the flush
+            timestamp (int): its time stamp in seconds since 1970-01-01 00:00:00
+        """
+        self.committed = (sequence, time_point, timestamp)
+        self.flushed_up_to(time_point)
+        self.loaded = True
+
+    def trim_due(self) -> bool:
+        """whether the rows of older flushes should be dropped again"""
+        return self.committed is not None and monotonic() - self.last_trim >= WATERMARK_TRIM_INTERVAL
+
+    def wait_visible(self, time_point: int, probe, timeout: float = VISIBILITY_TIMEOUT) -> bool:
+        """waits until the given time point is visible in the database
+
+        Args:
+            time_point (int): the time point to wait for
+            probe (_type_): function returning the highest visible time point
+                (-1 if none is visible or the probe failed)
+            timeout (float, optional): seconds to wait at most.
+                Defaults to VISIBILITY_TIMEOUT.
+
+        Returns:
+            bool: true if the time point is visible, false if the timeout passed
+                or the time point hasn't been flushed
+        """
+        if self.loaded and time_point > self.flushed:
+            # e.g. its flush failed and is retried later, it can't become
+            # visible while waiting
+            return False
+        deadline = monotonic() + timeout
+        delay = PROBE_DELAY_MIN
+        while self.visible < time_point:
+            self.visible = max(self.visible, probe())
+            if self.visible >= time_point:
+                break
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            sleep(min(delay, remaining))
+            delay = min(delay * 2, PROBE_DELAY_MAX)
+        return True
+
+    def get_stats(self) -> dict:
+        return {"flushed": self.flushed, "visible": self.visible, "sequence": self.sequence}
@@ -0,0 +1,47 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from encoder import Encoder  # noqa: E402
+from records import Timepoint, row_layouts  # noqa: E402
+from schema import Schema  # noqa: E402
+from signature import Signature  # noqa: E402
+
+
+class EncoderTest(unittest.TestCase):
+    """log strings and ILP rows of the compiled predicate encoders"""
+
+    def encode(self, signature: str, predicates: list, schema=None) -> Timepoint:
+        signature = Signature.from_text(signature)
+        schema = schema or Schema()
+        encoder = Encoder(signature, row_layouts(signature, schema.symbol_columns(signature)), "t_")
+        (timepoint,) = encoder.encode([Timepoint(100, predicates)])
+        return timepoint
+
+    def test_occurrences_follow_the_predicate_name(self):
+        timepoint = self.encode("P(int, float)\nE()", [("P", [[1, 2.5], [3, 4.0]]), ("E", [[]])])
+        self.assertIsNone(timepoint.skip)
+        self.assertEqual(timepoint.monpoly_string, "@100 P (1, 2.5) (3, 4.0) E () ;\n")
+        self.assertEqual(
+            timepoint.rows,
+            [("t_P", None, {"x1": 1, "x2": 2.5}), ("t_P", None, {"x1": 3, "x2": 4.0}), ("t_E", None, {})],
+        )
+
+    def test_strings_and_regexps_are_quoted(self):
+        timepoint = self.encode("Q(string, regexp)", [("Q", [["a b", "a.*b"], ["ab", "(a|b)+"]])])
+        self.assertEqual(timepoint.monpoly_string, '@100 Q ("a b", "a.*b") (ab, "(a|b)+") ;\n')
+
+    def test_symbol_columns(self):
+        schema = Schema({"low_cardinality": ["Q.x2"]})
+        timepoint = self.encode("Q(int, string)", [("Q", [[1, "a"]])], schema)
+        self.assertEqual(timepoint.rows, [("t_Q", {"x2": "a"}, {"x1": 1})])
+
+    def test_invalid_occurrences_are_skipped(self):
+        self.assertIsNotNone(self.encode("Q(string)", [("Q", [['a"b']])]).skip)
+        self.assertIsNotNone(self.encode("P(int, int)", [("P", [[1]])]).skip)
+
+
+if __name__ == "__main__":
+    unittest.main()
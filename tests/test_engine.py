@@ -0,0 +1,76 @@
+import os
+import socket
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import engine  # noqa: E402
+from engine import EngineClient, FrameAuthenticationError, recv_frame, send_frame  # noqa: E402
+
+
+class FrameTest(unittest.TestCase):
+    """only frames signed with the engine's key are unpickled"""
+
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_signed_frame(self):
+        key = os.urandom(engine.KEY_SIZE)
+        send_frame(self.left, ("", "get_status", (), {}), key)
+        self.assertEqual(recv_frame(self.right, key), ("", "get_status", (), {}))
+
+    def test_frame_with_another_key_is_not_unpickled(self):
+        send_frame(self.left, ("", "get_status", (), {}), os.urandom(engine.KEY_SIZE))
+        with mock.patch("engine.pickle.loads") as loads:
+            with self.assertRaises(FrameAuthenticationError):
+                recv_frame(self.right, os.urandom(engine.KEY_SIZE))
+            loads.assert_not_called()
+
+
+class RetryTest(unittest.TestCase):
+    """requests are only resent after a failed send if they have no side effects"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, "engine.sock")
+        engine.create_key(self.socket_path)
+        self.client = EngineClient(self.socket_path)
+        self.sent = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def request(self, operation: str):
+        broken = mock.Mock()
+        self.client.local.sock = broken
+        self.client.local.key = engine.read_key(self.socket_path)
+
+        def send(sock, message, key):
+            self.sent.append(message[1])
+            if sock is broken:
+                raise BrokenPipeError("engine restarted")
+
+        with mock.patch("engine.send_frame", send), mock.patch(
+            "engine.recv_frame", lambda sock, key: ("value", "ok")
+        ), mock.patch.object(self.client, "connect", lambda: mock.Mock()):
+            return self.client.request("", operation)
+
+    def test_read_only_operation_is_resent(self):
+        self.assertEqual(self.request("get_status"), "ok")
+        self.assertEqual(self.sent, ["get_status", "get_status"])
+
+    def test_ingest_is_not_resent(self):
+        with self.assertRaises(ConnectionError):
+            self.request("ingest")
+        self.assertEqual(self.sent, ["ingest"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from admission import AdmissionController, Ticket  # noqa: E402
+from records import Timepoint  # noqa: E402
+from reorder import ReorderBuffer  # noqa: E402
+
+
+class CapacityTest(unittest.TestCase):
+    """the reorder buffer is bounded and its time points count as in flight"""
+
+    def test_oldest_time_points_are_released_beyond_the_capacity(self):
+        reorder = ReorderBuffer({"enabled": True, "lateness": 3600, "capacity": 3})
+        # producer b holds back everything after 11
+        reorder.push("b", [Timepoint(11, [])])
+        reorder.push("a", [Timepoint(ts, []) for ts in (15, 13, 12, 14)])
+        released = reorder.pop_ready()
+        # 11 by the watermark of b, 12 because of the capacity
+        self.assertEqual([t.timestamp for t in released], [11, 12])
+        self.assertEqual(len(reorder.heap), 3)
+        # the released time stamps bound the lateness of later ones
+        (late,) = reorder.push("b", [Timepoint(10, [])])
+        self.assertIsNotNone(late.skip)
+
+    def test_invalid_capacity(self):
+        with self.assertRaises(ValueError):
+            ReorderBuffer({"capacity": 0})
+
+    def test_buffered_time_points_are_admitted_against_the_bound(self):
+        admission = AdmissionController({"max_timepoints": 10})
+        admission.set_buffered(8)
+        ticket = Ticket("client", 0)
+        self.assertIsNotNone(admission.add_timepoints(ticket, 3))
+        admission.set_buffered(5)
+        self.assertIsNone(admission.add_timepoints(ticket, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from monitor import Monitor  # noqa: E402
+from retention import RetentionManager, partition_start  # noqa: E402
+
+
+class DropQueriesTest(unittest.TestCase):
+    """partitions are only dropped if they end before the cutoff"""
+
+    def setUp(self):
+        self.retention = RetentionManager()
+
+    def test_partition_containing_the_cutoff_is_kept(self):
+        cutoff = datetime(2023, 5, 17, 13, 45, 10)
+        queries = dict(self.retention.drop_queries({"p": "DAY", "q": "HOUR"}, cutoff))
+        self.assertEqual(queries["p"], "ALTER TABLE p DROP PARTITION WHERE time_stamp < '2023-05-17 00:00:00';")
+        self.assertEqual(queries["q"], "ALTER TABLE q DROP PARTITION WHERE time_stamp < '2023-05-17 13:00:00';")
+
+    def test_cutoff_at_the_start_of_a_partition(self):
+        cutoff = datetime(2023, 5, 17)
+        (_, query), = self.retention.drop_queries({"p": "DAY"}, cutoff)
+        self.assertEqual(query, "ALTER TABLE p DROP PARTITION WHERE time_stamp < '2023-05-17 00:00:00';")
+
+    def test_coarser_units(self):
+        cutoff = datetime(2023, 5, 17, 13, 45, 10)
+        # 2023-05-17 is a Wednesday
+        self.assertEqual(partition_start(cutoff, "WEEK"), datetime(2023, 5, 15))
+        self.assertEqual(partition_start(cutoff, "MONTH"), datetime(2023, 5, 1))
+        self.assertEqual(partition_start(cutoff, "YEAR"), datetime(2023, 1, 1))
+
+    def test_unpartitioned_tables_are_left_alone(self):
+        self.assertEqual(self.retention.drop_queries({"p": "NONE"}, datetime(2023, 5, 17)), [])
+
+
+class TrimWatermarkTest(unittest.TestCase):
+    """only the partition holding the latest flush of the watermark table is kept"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.monitor = Monitor(self.directory.name)
+        self.monitor.db = mock.Mock()
+        self.monitor.db.run_query.return_value = {"success": "ok"}
+        self.monitor.watermark_table_ready = True
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_partitions_before_the_latest_flush_are_dropped(self):
+        latest = int((datetime(2023, 5, 17, 13, 45, 10) - datetime(1970, 1, 1)).total_seconds())
+        self.monitor.watermark.commit(7, 42, latest)
+        self.assertNotIn("error", self.monitor.trim_watermark())
+        (query,), _ = self.monitor.db.run_query.call_args
+        self.assertEqual(
+            query,
+            f"ALTER TABLE {self.monitor.watermark_table} DROP PARTITION WHERE time_stamp < '2023-05-17 00:00:00';",
+        )
+        self.assertFalse(self.monitor.watermark.trim_due())
+
+    def test_nothing_is_dropped_without_a_flush(self):
+        self.monitor.watermark.reset()
+        self.monitor.trim_watermark()
+        self.monitor.db.run_query.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from schema import Schema  # noqa: E402
+from signature import Signature  # noqa: E402
+
+
+class SymbolColumnsTest(unittest.TestCase):
+    """string attributes are only stored as SYMBOL if they are listed as low cardinality"""
+
+    def setUp(self):
+        self.signature = Signature.from_text("Q(user:string, host:string, n:int)\n")
+
+    def test_no_symbols_by_default(self):
+        self.assertEqual(Schema().symbol_columns(self.signature), {"Q": frozenset()})
+
+    def test_low_cardinality_columns(self):
+        schema = Schema({"low_cardinality": ["Q.x2"]})
+        self.assertEqual(schema.symbol_columns(self.signature), {"Q": frozenset({"x2"})})
+        ddl = schema.rewrite("CREATE TABLE Q(x1 string, x2 string, x3 int, time_stamp timestamp)", self.signature)
+        self.assertIn("x1 string", ddl)
+        self.assertIn("x2 SYMBOL CAPACITY 256 CACHE INDEX", ddl)
+
+    def test_all_columns_except_high_cardinality(self):
+        schema = Schema({"low_cardinality": ["*"], "high_cardinality": ["Q.x1"]})
+        self.assertEqual(schema.symbol_columns(self.signature), {"Q": frozenset({"x2"})})
+
+    def test_configurations_without_low_cardinality_keep_their_symbols(self):
+        # written before SYMBOL columns were opt-in, the tables exist already
+        schema = Schema({"expected_rows_per_day": 0, "partition": None, "high_cardinality": ["Q.x1"]})
+        self.assertEqual(schema.symbol_columns(self.signature), {"Q": frozenset({"x2"})})
+        self.assertEqual(Schema(schema.get_config()).symbol_columns(self.signature), {"Q": frozenset({"x2"})})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from monitor import Monitor  # noqa: E402
+from verdicts import VerdictParser  # noqa: E402
+
+
+class PolicyChangeTest(unittest.TestCase):
+    """the verdicts MonPoly prints after a policy change refer to the server's
+    time points, although MonPoly numbers the replayed time points from 0"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.monitor = Monitor(self.directory.name)
+        with open(self.monitor.signature_path, "w", encoding="utf-8") as f:
+            f.write("p(string)\n")
+        with open(self.monitor.policy_path, "w", encoding="utf-8") as f:
+            f.write("p(x)\n")
+        self.monitor.check_monitorability = lambda *args: {"monitorable": True, "message": ""}
+        self.monitor.stop_monpoly = lambda *args, **kwargs: {}
+        self.monitor.wait_for_replay = self.read_replay_log
+        self.replayed = None
+        popen = mock.patch("monitor.subprocess.Popen")
+        popen.start()
+        self.addCleanup(popen.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def change_policy(self, lookback: int, naive: bool = False):
+        self.monitor.get_relative_intervals = lambda path: (
+            f"[-{lookback},0]",
+            [{"predicate_name": "p", "intervals": [{"mask": [None], "interval": f"[-{lookback},0]"}]}],
+        )
+        path = os.path.join(self.directory.name, "new_policy.mfotl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("p(x)\n")
+        response = self.monitor.change_policy(path, naive=naive)
+        self.assertIn("success", response)
+
+    def read_replay_log(self) -> bool:
+        """stands in for MonPoly reading the log it was started with"""
+        path = os.path.join(self.monitor.events_dir, "events_policy_change.log")
+        with open(path, encoding="utf-8") as f:
+            self.replayed = [line for line in f.read().split("\n") if line.startswith("@")]
+        return True
+
+    def verdict_time_point(self, monpoly_time_point: int) -> int:
+        output = f"@100 (time point {monpoly_time_point}): (\"a\")\n"
+        (verdict,) = VerdictParser.parse(output, self.monitor.monpoly_offset)
+        return verdict.time_point
+
+    def test_replay_from_hot_window(self):
+        timestamps = [10, 10, 11, 12, 12, 13]
+        for time_point, timestamp in enumerate(timestamps):
+            self.monitor.hot_window.append(time_point, timestamp, f"@{timestamp} p (\"a\");\n")
+        self.monitor.most_recent_timepoint = len(timestamps) - 1
+        self.monitor.most_recent_timestamp = datetime.fromtimestamp(timestamps[-1])
+        self.change_policy(lookback=1)
+        self.assertEqual(len(self.replayed), 3)
+        # time points 3, 4 and 5 are replayed, MonPoly calls them 0, 1 and 2
+        self.assertEqual(self.verdict_time_point(0), 3)
+        self.assertEqual(self.verdict_time_point(2), 5)
+
+    def test_replay_from_database(self):
+        # time points 4 and 5 share their time stamp
+        timepoints_rows = [
+            (4, datetime(2023, 1, 1, 0, 0, 10)),
+            (5, datetime(2023, 1, 1, 0, 0, 10)),
+            (6, datetime(2023, 1, 1, 0, 0, 11)),
+        ]
+        p_rows = [("a", 5, datetime(2023, 1, 1, 0, 0, 10)), ("b", 6, datetime(2023, 1, 1, 0, 0, 11))]
+
+        def run_query(query, select=False):
+            if self.monitor.timepoints_table in query:
+                return {"response": timepoints_rows}
+            return {"response": p_rows}
+
+        self.monitor.db.run_query = run_query
+        self.monitor.watermark.wait_visible = lambda *args: True
+        self.monitor.most_recent_timepoint = 6
+        self.monitor.most_recent_timestamp = datetime(2023, 1, 1, 0, 0, 11)
+        self.change_policy(lookback=5)
+        # every time point of the timepoints table is replayed on its own
+        # and MonPoly's time point k is the k-th row of the table
+        self.assertEqual(len(self.replayed), len(timepoints_rows))
+        for monpoly_time_point, (time_point, _) in enumerate(timepoints_rows):
+            self.assertEqual(self.verdict_time_point(monpoly_time_point), time_point)
+
+    def test_waiting_for_visibility_does_not_hold_the_lock(self):
+        self.monitor.db.run_query = lambda query, select=False: {"response": []}
+        self.monitor.most_recent_timepoint = 6
+        self.monitor.most_recent_timestamp = datetime(2023, 1, 1, 0, 0, 11)
+        waits = []
+
+        def wait_visible(time_point, probe, timeout):
+            waits.append((timeout, self.monitor.lock._is_owned()))
+            return True
+
+        self.monitor.watermark.wait_visible = wait_visible
+        self.change_policy(lookback=5)
+        # the long wait runs without the lock, only the final probe holds it
+        (timeout, locked), (final_timeout, final_locked) = waits
+        self.assertGreater(timeout, 0)
+        self.assertFalse(locked)
+        self.assertEqual(final_timeout, 0)
+        self.assertTrue(final_locked)
+
+
+if __name__ == "__main__":
+    unittest.main()